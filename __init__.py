@@ -1,15 +1,28 @@
 from .config import ConfigHelper, EnvHelper, EnvSecretValue, EnvValue
 from .data_types import (
     HitsMisses,
+    CacheMetrics,
+    SamplingProfiler,
+    AccessTraceRecorder,
     IdentityMap,
     LRUList,
     TagsManager,
     TTLManager,
     GCType,
+    GCBudget,
     GCOperator,
     ManagedIdentityMap,
+    ShardedManagedIdentityMap,
+    SharedIdentityMap,
+    DiskTier,
     IdentityMapsCollection,
     IdentityMapInfo,
+    BudgetPolicy,
+    CollectionBudget,
+    GCScheduler,
+    AsyncGCScheduler,
+    AsyncManagedIdentityMap,
+    AsyncIdentityMapsCollection,
 )
 from .logger import Logger
 from .id_generators import SimpleIDGenerator
@@ -0,0 +1,76 @@
+"""
+Per-entry memory overhead of ManagedIdentityMap's slotted entry records against the layout they replaced,
+one parallel index per concern (identity map, LRU list, TTL index, forward and reverse tag indexes).
+
+    python -m py_tool_kit.benchmarks.entry_overhead
+
+Memory is measured with tracemalloc while the map is filled; keys and values are created beforehand, so only
+the bookkeeping is counted.
+"""
+import time
+import tracemalloc
+from collections import deque
+from typing import Any, Callable
+
+from ..data_types import ManagedIdentityMap
+from .timing import print_table
+
+ENTRIES = 1_000_000
+LAYOUTS = {
+    "plain": {},
+    "ttl": {"ttl": 600},
+    "tags": {"tags": ["users", "tenant:1"]},
+    "ttl + tags": {"ttl": 600, "tags": ["users", "tenant:1"]},
+}
+
+
+def parallel_indexes(items: dict[int, Any], kwargs: dict[str, Any]) -> tuple:
+    # The baseline's indexes: LRUList was a deque of keys, whose membership test made every write O(n), so the
+    # keys are appended as upsert() appended them; TTLManager mapped deadlines to keys and keys to deadlines.
+    identity_map, lru, ttd_keys, keys_ttd, tag_keys, key_tags = {}, deque(), {}, {}, {}, {}
+    ttl, tags = kwargs.get("ttl"), kwargs.get("tags") or ()
+    for key, data in items.items():
+        identity_map[key] = data
+        lru.append(key)
+        if ttl:
+            ttd = int(time.time()) + ttl
+            ttd_keys.setdefault(ttd, set()).add(key)
+            keys_ttd[key] = ttd
+        for tag in tags:
+            tag_keys.setdefault(tag, set()).add(key)
+            key_tags.setdefault(key, set()).add(tag)
+    return identity_map, lru, ttd_keys, keys_ttd, tag_keys, key_tags
+
+
+def entry_records(items: dict[int, Any], kwargs: dict[str, Any]) -> ManagedIdentityMap:
+    identity_map = ManagedIdentityMap()
+    for key, data in items.items():
+        identity_map.add(key, data, **kwargs)
+    return identity_map
+
+
+def bytes_per_entry(build: Callable[[dict[int, Any], dict[str, Any]], Any], kwargs: dict[str, Any]) -> float:
+    items = {key: object() for key in range(ENTRIES)}
+    tracemalloc.start()
+    try:
+        built = build(items, kwargs)
+        used = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del built
+    return used / ENTRIES
+
+
+def main() -> None:
+    rows = []
+    for name, kwargs in LAYOUTS.items():
+        before = bytes_per_entry(parallel_indexes, kwargs)
+        after = bytes_per_entry(entry_records, kwargs)
+        rows.append([name, f"{before:.0f}", f"{after:.0f}", f"{1 - after / before:.0%}"])
+    print_table(
+        f"bytes per entry, {ENTRIES:,} entries", ["entry", "parallel indexes", "entry records", "saved"], rows
+    )
+
+
+if __name__ == "__main__":
+    main()
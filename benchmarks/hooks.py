@@ -0,0 +1,92 @@
+"""
+Cost of ManagedIdentityMap hooks per operation.
+
+    python -m py_tool_kit.benchmarks.hooks
+
+"no hooks" is a map no hook was ever registered on, "removed" one whose hooks were all removed again; both
+must match, and "evict only" must match them on get(): lookups are only rerouted while on_hit or on_miss
+handlers exist. add() evicts on every call (max_items is full), so it shows the per-eviction hook cost.
+"""
+import random
+
+from ..data_types import ManagedIdentityMap, SamplingProfiler
+from .timing import ns_per_op, print_table
+
+ITEMS = 10_000
+OPS = 100_000
+ROUNDS = 3
+
+
+def noop(*args) -> None:
+    pass
+
+
+class NoopListener:
+    def on_hit(self, key) -> None:
+        pass
+
+    def on_miss(self, key) -> None:
+        pass
+
+    def on_evict(self, key, reason) -> None:
+        pass
+
+
+def removed(identity_map: ManagedIdentityMap) -> None:
+    listener = NoopListener()
+    identity_map.add_listener(listener)
+    identity_map.remove_listener(listener)
+
+
+SETUPS = {
+    "no hooks": lambda identity_map: None,
+    "removed": removed,
+    "evict only": lambda identity_map: identity_map.add_hook("on_evict", noop),
+    "profiler": lambda identity_map: identity_map.add_listener(SamplingProfiler(sample_rate=0.1)),
+    "no-op listener": lambda identity_map: identity_map.add_listener(NoopListener()),
+}
+
+
+def bench(setup) -> list:
+    identity_map = ManagedIdentityMap(max_items=ITEMS)
+    for key in range(ITEMS):
+        identity_map.add(key, key)
+    setup(identity_map)
+    hits = [random.randrange(ITEMS) for _ in range(OPS)]
+    misses = [ITEMS + key for key in hits]
+    new_keys = iter(range(ITEMS, ITEMS + OPS * 3))
+
+    def get_hit():
+        for key in hits:
+            identity_map.get(key)
+
+    def get_miss():
+        for key in misses:
+            identity_map.get(key)
+
+    def add_evict():
+        for _ in range(OPS):
+            identity_map.add(next(new_keys), 0)
+
+    return [ns_per_op(get_hit, OPS), ns_per_op(get_miss, OPS), ns_per_op(add_evict, OPS)]
+
+
+def main() -> None:
+    # Rounds alternate between the setups and the best of them counts, so drift hits every setup alike.
+    results = {}
+    for _ in range(ROUNDS):
+        for name, setup in SETUPS.items():
+            timings = bench(setup)
+            results[name] = [min(pair) for pair in zip(results.get(name, timings), timings)]
+    baseline = results["no hooks"]
+    rows = []
+    for name, timings in results.items():
+        row = [name]
+        for ns, base in zip(timings, baseline):
+            row.append(f"{ns:.0f} ({ns / base - 1:+.0%})")
+        rows.append(row)
+    print_table(f"ns/op, {ITEMS:,} items", ["hooks", "get hit", "get miss", "add + evict"], rows)
+
+
+if __name__ == "__main__":
+    main()
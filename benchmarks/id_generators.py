@@ -0,0 +1,84 @@
+"""
+Throughput of SimpleIDGenerator with lowest-first and FIFO reuse of freed IDs.
+
+    python -m py_tool_kit.benchmarks.id_generators
+
+The first table frees and takes back IDs at random among 1k to 1M live ones; the cost should grow no more
+than logarithmically with the number of free IDs. The second one splits allocations and frees between
+threads and shows the aggregate throughput.
+"""
+import random
+import threading
+import time
+from collections import deque
+
+from ..id_generators import SimpleIDGenerator
+from .timing import ns_per_op, print_table
+
+SIZES = (1_000, 100_000, 1_000_000)
+OPS = 100_000
+BLOCK = 1_000
+THREADS = (1, 4, 16)
+OPS_TOTAL = 400_000
+
+
+def bench_size(size: int, fifo: bool) -> list:
+    generator = SimpleIDGenerator(fifo=fifo)
+    generator.allocate_block(size)
+    # Free a tenth of the IDs up front, so that every take-back comes from a sizable free list.
+    for id in random.sample(range(1, size), size // 10):
+        generator.free(id)
+    probes = [random.randrange(1, size) for _ in range(OPS)]
+
+    def free_next():
+        for id in probes:
+            generator.free(id)
+            generator.next
+
+    def block():
+        for _ in range(OPS // BLOCK):
+            generator.allocate_block(BLOCK)
+
+    return [
+        size,
+        "fifo" if fifo else "lowest",
+        f"{ns_per_op(free_next, OPS):.0f}",
+        f"{ns_per_op(block, OPS):.1f}",
+    ]
+
+
+def run_threads(threads: int, fifo: bool) -> float:
+    generator = SimpleIDGenerator(fifo=fifo)
+    ops = OPS_TOTAL // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker() -> None:
+        live = deque()
+        barrier.wait()
+        for index in range(ops):
+            live.append(generator())
+            # Short-lived IDs: every other one is freed soon after it was taken.
+            if index % 2:
+                generator.free(live.popleft())
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for one in workers:
+        one.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for one in workers:
+        one.join()
+    return ops * threads / (time.perf_counter() - started)
+
+
+def main() -> None:
+    rows = [bench_size(size, fifo) for size in SIZES for fifo in (False, True)]
+    print_table("SimpleIDGenerator, ns/op", ["ids", "reuse", "free+next", f"allocate_block({BLOCK})/id"], rows)
+    rows = [
+        [threads, f"{run_threads(threads, False):,.0f}", f"{run_threads(threads, True):,.0f}"] for threads in THREADS
+    ]
+    print_table("SimpleIDGenerator, allocations/sec", ["threads", "lowest", "fifo"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Per-operation cost of LRUList from 1k to 1M keys.
+
+    python -m py_tool_kit.benchmarks.lru_list
+
+Every column should stay flat as the number of keys grows.
+"""
+import random
+
+from ..data_types import LRUList
+from .timing import ns_per_op, print_table
+
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+OPS = 100_000
+
+
+def bench_size(size: int) -> list:
+    lru = LRUList()
+    for key in range(size):
+        lru.add(key)
+    probes = [random.randrange(size) for _ in range(OPS)]
+
+    def touch():
+        for key in probes:
+            lru.upsert(key)
+
+    def has():
+        for key in probes:
+            lru.has(key)
+
+    def remove_add():
+        for key in probes:
+            lru.remove(key)
+            lru.add(key)
+
+    popped = min(OPS, size)
+
+    def pop_add():
+        for key in lru.pop_first(popped):
+            lru.add(key)
+
+    return [
+        size,
+        f"{ns_per_op(touch, OPS):.0f}",
+        f"{ns_per_op(has, OPS):.0f}",
+        f"{ns_per_op(remove_add, OPS):.0f}",
+        f"{ns_per_op(pop_add, popped):.0f}",
+    ]
+
+
+def main() -> None:
+    rows = [bench_size(size) for size in SIZES]
+    print_table("LRUList, ns/op", ["keys", "upsert", "has", "remove+add", "pop_first+add"], rows)
+
+
+if __name__ == "__main__":
+    main()
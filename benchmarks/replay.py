@@ -0,0 +1,48 @@
+"""
+Hit ratio curves of a trace recorded with AccessTraceRecorder, for choosing max_items and GC types.
+
+    python -m py_tool_kit.benchmarks.replay users.trace
+    python -m py_tool_kit.benchmarks.replay users.trace --capacities 1000 10000 100000 --output curves.json
+
+LRU comes from stack distances (every capacity at once), LFRU from one simulated map per capacity and
+TTL-only from one expiry-only cache per TTL; --no-lfru skips the slowest of them.
+"""
+import argparse
+import json
+
+from ..data_types import AccessTrace, hit_ratio_curves
+from ..data_types.access_trace import CAPACITIES, TTLS
+from .timing import print_table
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace")
+    parser.add_argument("--capacities", nargs="+", type=int, default=list(CAPACITIES))
+    parser.add_argument("--ttls", nargs="+", type=float, default=list(TTLS), help="seconds")
+    parser.add_argument("--no-lfru", dest="lfru", action="store_false")
+    parser.add_argument("--output", help="save the curves as JSON")
+    args = parser.parse_args()
+
+    curves = hit_ratio_curves(AccessTrace(args.trace), args.capacities, args.ttls, args.lfru)
+    title = (
+        f"{curves['accesses']:,} accesses to ~{curves['keys']:,} keys (sample rate {curves['sample_rate']:g}), "
+        f"observed hit ratio {curves['observed']:.3f}"
+    )
+    header = ["capacity", "LRU"] + (["LFRU"] if args.lfru else [])
+    rows = []
+    for index, capacity in enumerate(curves["capacities"]):
+        row = [capacity, f"{curves['lru'][index]:.3f}"]
+        if args.lfru:
+            row.append(f"{curves['lfru'][index]:.3f}")
+        rows.append(row)
+    print_table(title, header, rows)
+    ttl_rows = [[f"{ttl:g}", f"{ratio:.3f}"] for ttl, ratio in zip(curves["ttls"], curves["ttl"])]
+    print_table("TTL only", ["ttl", "hit ratio"], ttl_rows)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(curves, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
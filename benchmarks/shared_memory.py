@@ -0,0 +1,116 @@
+"""
+Per-worker ManagedIdentityMaps against one SharedIdentityMap for a pool of forked workers.
+
+    python -m py_tool_kit.benchmarks.shared_memory
+    python -m py_tool_kit.benchmarks.shared_memory --workers 8 --keys 50000 --size 5000
+
+Every worker replays its own Zipf trace over the same key space through get_or_fetch, the loader building a
+value of VALUE_BYTES. Reported: the hit rate over all workers, the throughput of the pool and the memory of
+the pool (parent and workers, measured while all of them are alive) against a run without a cache. Memory is
+the proportional set size (Pss: shared pages split between the processes mapping them, so the sum is the real
+total) where /proc/self/smaps_rollup exists, the sum of maximum RSS, which counts shared pages repeatedly,
+otherwise.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import time
+from typing import Any
+
+from ..data_types import ManagedIdentityMap, SharedIdentityMap
+from .timing import print_table
+from .workloads import zipf_keys
+
+WORKERS = 4
+OPS = 100_000
+KEYS = 20_000
+SIZE = 2_000
+VALUE_BYTES = 256
+
+
+def memory_kib() -> tuple[str, int]:
+    try:
+        with open("/proc/self/smaps_rollup") as file:
+            for line in file:
+                if line.startswith("Pss:"):
+                    return "Pss", int(line.split()[1])
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    return "max RSS", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class NoCache:
+    def get_or_fetch(self, key: Any, loader) -> Any:
+        return loader()
+
+
+def worker(make_map, keys: list[int], results, barrier) -> None:
+    identity_map = make_map()
+    hits = 0
+    started = time.perf_counter()
+    for key in keys:
+        loaded = False
+
+        def loader(key=key):
+            nonlocal loaded
+            loaded = True
+            return (key, b"x" * VALUE_BYTES)
+
+        identity_map.get_or_fetch(key, loader)
+        hits += not loaded
+    elapsed = time.perf_counter() - started
+    results.put((hits, elapsed, memory_kib()))
+    # Stay alive until everybody has measured: Pss shares grow as processes exit.
+    barrier.wait()
+
+
+def run(name: str, make_map, traces: list[list[int]]) -> list[Any]:
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    barrier = context.Barrier(len(traces) + 1)
+    processes = [context.Process(target=worker, args=(make_map, keys, results, barrier)) for keys in traces]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    kind, memory = memory_kib()
+    barrier.wait()
+    for process in processes:
+        process.join()
+    hits = sum(report[0] for report in reports)
+    ops = sum(len(keys) for keys in traces)
+    elapsed = max(report[1] for report in reports)
+    memory += sum(report[2][1] for report in reports)
+    return [name, f"{hits / ops:.3f}", f"{ops / elapsed:,.0f}", f"{memory / 1024:.1f}", kind]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--ops", type=int, default=OPS, help="per worker")
+    parser.add_argument("--keys", type=int, default=KEYS)
+    parser.add_argument("--size", type=int, default=SIZE, help="items per cache")
+    args = parser.parse_args()
+
+    traces = [zipf_keys(args.ops, args.keys, seed=seed) for seed in range(1, args.workers + 1)]
+    name = f"ptk_benchmark_{os.getpid()}"
+    # Sized for the pickled (key, value) tuples plus their keys.
+    shared = SharedIdentityMap(name, max_items=args.size, max_bytes=args.size * (VALUE_BYTES + 64))
+    try:
+        rows = [
+            run("no cache", NoCache, traces),
+            run("per-worker", lambda: ManagedIdentityMap(max_items=args.size), traces),
+            run("shared", lambda: SharedIdentityMap(name), traces),
+        ]
+    finally:
+        shared.close()
+        shared.unlink()
+    title = (
+        f"{args.workers} workers x {args.ops:,} Zipf lookups over {args.keys:,} keys, {args.size:,} items per cache"
+    )
+    print_table(title, ["cache", "hit rate", "ops/sec", "pool MiB", "memory"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+ManagedIdentityMap under the synthetic workloads of benchmarks.workloads, at several cache sizes.
+
+    python -m py_tool_kit.benchmarks.suite --output before.json
+    python -m py_tool_kit.benchmarks.suite --compare before.json
+
+Every workload and cache size is replayed twice on a fresh map: once timing each operation (ops/sec, p50 and
+p99 latency per operation type, hit rate), once under tracemalloc for the peak memory of the map. --output
+saves the results as JSON; --compare prints the change of throughput and latencies against such a file.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any
+
+from ..data_types import GCType, ManagedIdentityMap
+from .timing import print_table
+from .workloads import ADD, GET, INVALIDATE, REMOVE, WORKLOADS, Trace
+
+OPS = 200_000
+KEYS = 100_000
+# Cache sizes as shares of the key space.
+SIZES = (0.01, 0.1, 0.5)
+GC_TYPES = {"lru": GCType.TTL | GCType.LRU, "lfru": GCType.TTL | GCType.LFRU}
+
+
+def replay(identity_map: ManagedIdentityMap, trace: Trace, latencies: dict[str, list[int]] | None = None) -> None:
+    clock = time.perf_counter_ns
+    for operation, argument, params in trace:
+        started = clock() if latencies is not None else 0
+        if operation is GET:
+            identity_map.get_or_fetch(argument, lambda: argument, **params)
+        elif operation is ADD:
+            identity_map.add(argument, argument, **params)
+        elif operation is REMOVE:
+            identity_map.remove(argument)
+        elif operation is INVALIDATE:
+            identity_map.invalidate_tag(argument)
+        if latencies is not None:
+            latencies[operation].append(clock() - started)
+
+
+def percentile(ordered: list[int], share: float) -> int:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def run(workload: str, trace: Trace, size: int, gc_types: int) -> dict[str, Any]:
+    latencies = {operation: [] for operation in (GET, ADD, REMOVE, INVALIDATE)}
+    identity_map = ManagedIdentityMap(max_items=size, gc_types=gc_types)
+    started = time.perf_counter()
+    replay(identity_map, trace, latencies)
+    elapsed = time.perf_counter() - started
+    stats = identity_map.stats()
+    del identity_map
+
+    identity_map = ManagedIdentityMap(max_items=size, gc_types=gc_types)
+    tracemalloc.start()
+    try:
+        replay(identity_map, trace)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latency = {}
+    for operation, values in latencies.items():
+        if values:
+            values.sort()
+            latency[operation] = {"count": len(values), "p50": percentile(values, 0.5), "p99": percentile(values, 0.99)}
+    return {
+        "workload": workload,
+        "size": size,
+        "ops": len(trace),
+        "ops_per_sec": len(trace) / elapsed,
+        "latency_ns": latency,
+        "peak_bytes": peak,
+        "hit_rate": stats["hit_rate"],
+        "evictions": stats["evictions"],
+    }
+
+
+def run_suite(workloads: list[str], ops: int, keys: int, sizes: list[float], gc: str) -> dict[str, Any]:
+    results = []
+    for workload in workloads:
+        trace = WORKLOADS[workload](ops, keys)
+        for share in sizes:
+            results.append(run(workload, trace, max(1, int(keys * share)), GC_TYPES[gc]))
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "ops": ops,
+            "keys": keys,
+            "gc": gc,
+        },
+        "results": results,
+    }
+
+
+def print_results(suite: dict[str, Any]) -> None:
+    rows = []
+    for result in suite["results"]:
+        get = result["latency_ns"].get(GET, {})
+        rows.append(
+            [
+                result["workload"],
+                result["size"],
+                f"{result['ops_per_sec']:,.0f}",
+                get.get("p50", "-"),
+                get.get("p99", "-"),
+                f"{result['peak_bytes'] / 2**20:.1f}",
+                f"{result['hit_rate']:.3f}",
+            ]
+        )
+    header = ["workload", "size", "ops/sec", "get p50 ns", "get p99 ns", "peak MiB", "hit rate"]
+    print_table(f"{suite['meta']['ops']:,} ops over {suite['meta']['keys']:,} keys", header, rows)
+
+
+def print_comparison(suite: dict[str, Any], baseline: dict[str, Any]) -> None:
+    before = {(result["workload"], result["size"]): result for result in baseline["results"]}
+    rows = []
+    for result in suite["results"]:
+        old = before.get((result["workload"], result["size"]))
+        if old is None:
+            continue
+        throughput = f"{result['ops_per_sec'] / old['ops_per_sec'] - 1:+.1%}"
+        for operation, latency in result["latency_ns"].items():
+            old_latency = old["latency_ns"].get(operation)
+            if old_latency is not None:
+                p50 = f"{latency['p50'] / old_latency['p50'] - 1:+.1%}"
+                p99 = f"{latency['p99'] / old_latency['p99'] - 1:+.1%}"
+                rows.append([result["workload"], result["size"], throughput, operation, p50, p99])
+    print_table("change against the baseline", ["workload", "size", "ops/sec", "operation", "p50", "p99"], rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workloads", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument("--ops", type=int, default=OPS)
+    parser.add_argument("--keys", type=int, default=KEYS)
+    parser.add_argument("--sizes", nargs="+", type=float, default=list(SIZES), help="shares of the key space")
+    parser.add_argument("--gc", choices=list(GC_TYPES), default="lru")
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    args = parser.parse_args()
+
+    suite = run_suite(args.workloads, args.ops, args.keys, args.sizes, args.gc)
+    print_results(suite)
+    if args.compare:
+        with open(args.compare) as file:
+            print_comparison(suite, json.load(file))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(suite, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import time
+from typing import Callable
+
+
+def ns_per_op(func: Callable[[], None], ops: int, repeat: int = 3) -> float:
+    """Run func (which performs ops operations) repeat times and return the best ns/op."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        func()
+        elapsed = time.perf_counter_ns() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / ops
+
+
+def print_table(title: str, header: list[str], rows: list[list]) -> None:
+    print(title)
+    widths = [max(len(str(cell)) for cell in column) for column in zip(header, *rows)]
+    for row in (header, *rows):
+        print("  ".join(str(cell).rjust(width) for cell, width in zip(row, widths)))
+    print()
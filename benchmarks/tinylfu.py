@@ -0,0 +1,41 @@
+"""
+Hit rate of plain LRU against W-TinyLFU admission (GCType.LFRU) on a Zipf workload interleaved with scans.
+
+    python -m py_tool_kit.benchmarks.tinylfu
+
+The scans touch every key of a large, otherwise unused range once, like a nightly batch job walking all
+entities; LRU flushes its hot set for them, TinyLFU rejects them at admission.
+"""
+from ..data_types import GCType, ManagedIdentityMap
+from .timing import print_table
+from .workloads import scan_keys
+
+KEYS = 100_000
+ACCESSES = 300_000
+SCAN_EVERY = 50_000
+SCAN_LENGTH = 20_000
+CAPACITIES = (500, 2_000, 10_000)
+
+
+def scan_with_zipf() -> list[int]:
+    return scan_keys(ACCESSES, KEYS, SCAN_EVERY, SCAN_LENGTH)
+
+
+def hit_rate(identity_map: ManagedIdentityMap, trace: list[int]) -> float:
+    for key in trace:
+        identity_map.get_or_fetch(key, lambda: key)
+    return identity_map.stats()["hit_rate"]
+
+
+def main() -> None:
+    trace = scan_with_zipf()
+    rows = []
+    for capacity in CAPACITIES:
+        lru = hit_rate(ManagedIdentityMap(max_items=capacity), trace)
+        tiny_lfu = hit_rate(ManagedIdentityMap(max_items=capacity, gc_types=GCType.LFRU, gc_possibility=0), trace)
+        rows.append([capacity, f"{lru:.3f}", f"{tiny_lfu:.3f}"])
+    print_table(f"hit rate, {len(trace):,} accesses", ["capacity", "LRU", "W-TinyLFU"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Synthetic workloads: seeded traces of (operation, argument, add params) triples replayed against a map.
+
+    "get"        get_or_fetch(argument), the loader returning the key itself
+    "add"        add(argument, argument)
+    "remove"     remove(argument)
+    "invalidate" invalidate_tag(argument)
+
+The add params of "get" and "add" are shared dicts (ttl, tags), so a long trace costs one tuple per operation.
+"""
+import bisect
+import itertools
+import random
+from typing import Any, Callable
+
+GET, ADD, REMOVE, INVALIDATE = "get", "add", "remove", "invalidate"
+NO_PARAMS: dict[str, Any] = {}
+
+# TTL of the ttl_churn entries: short enough for most of them to expire and be reloaded during a run.
+CHURN_TTL = 0.005
+# Tag groups of the tag_invalidation workload; one group is invalidated every INVALIDATE_EVERY operations.
+TAG_GROUPS = 100
+INVALIDATE_EVERY = 200
+# The scan workload walks SCAN_LENGTH new keys every SCAN_EVERY Zipf accesses.
+SCAN_EVERY = 50_000
+SCAN_LENGTH = 20_000
+
+Trace = list[tuple[str, Any, dict[str, Any]]]
+
+
+def uniform_keys(count: int, keys: int, seed: int = 1) -> list[int]:
+    rnd = random.Random(seed)
+    return [rnd.randrange(keys) for _ in range(count)]
+
+
+def zipf_keys(count: int, keys: int, s: float = 0.9, seed: int = 1) -> list[int]:
+    weights = [1 / (rank**s) for rank in range(1, keys + 1)]
+    cdf = list(itertools.accumulate(weights))
+    rnd = random.Random(seed)
+    return [bisect.bisect_left(cdf, rnd.random() * cdf[-1]) for _ in range(count)]
+
+
+def scan_keys(count: int, keys: int, scan_every: int = SCAN_EVERY, scan_length: int = SCAN_LENGTH) -> list[int]:
+    """Zipf accesses interrupted by scans of keys beyond the Zipf range, each key of a scan touched once."""
+    trace = []
+    scan_start = keys
+    for index, key in enumerate(zipf_keys(count, keys)):
+        if index and index % scan_every == 0:
+            trace.extend(range(scan_start, scan_start + scan_length))
+            scan_start += scan_length
+        trace.append(key)
+    return trace
+
+
+def reads(keys: list[int], params: dict[str, Any] = NO_PARAMS) -> Trace:
+    return [(GET, key, params) for key in keys]
+
+
+def uniform(count: int, keys: int) -> Trace:
+    return reads(uniform_keys(count, keys))
+
+
+def zipf(count: int, keys: int) -> Trace:
+    return reads(zipf_keys(count, keys))
+
+
+def scan(count: int, keys: int) -> Trace:
+    return reads(scan_keys(count, keys, min(SCAN_EVERY, max(1, count // 4)), min(SCAN_LENGTH, keys // 5)))
+
+
+def ttl_churn(count: int, keys: int) -> Trace:
+    return reads(zipf_keys(count, keys), {"ttl": CHURN_TTL})
+
+
+def tag_invalidation(count: int, keys: int) -> Trace:
+    params = [{"tags": (f"group:{group}",)} for group in range(TAG_GROUPS)]
+    rnd = random.Random(2)
+    trace = []
+    for index, key in enumerate(zipf_keys(count, keys)):
+        if index and index % INVALIDATE_EVERY == 0:
+            trace.append((INVALIDATE, f"group:{rnd.randrange(TAG_GROUPS)}", NO_PARAMS))
+        trace.append((GET, key, params[key % TAG_GROUPS]))
+    return trace
+
+
+def mixed(count: int, keys: int) -> Trace:
+    """75% reads, 20% writes and 5% removals of Zipf keys."""
+    rnd = random.Random(3)
+    trace = []
+    for key in zipf_keys(count, keys):
+        draw = rnd.random()
+        operation = GET if draw < 0.75 else ADD if draw < 0.95 else REMOVE
+        trace.append((operation, key, NO_PARAMS))
+    return trace
+
+
+WORKLOADS: dict[str, Callable[[int, int], Trace]] = {
+    "uniform": uniform,
+    "zipf": zipf,
+    "scan": scan,
+    "ttl_churn": ttl_churn,
+    "tag_invalidation": tag_invalidation,
+    "mixed": mixed,
+}
@@ -1,7 +1,25 @@
+from .metrics import CacheMetrics, Counter, Histogram, map_label, merge_snapshots, to_prometheus
 from .hits_misses import HitsMisses
+from .hooks import EVENTS as HOOK_EVENTS, Hooks, SamplingProfiler
 from .identity_map import IdentityMap
 from .lru_list import LRUList
 from .tags_manager import TagsManager
 from .ttl_manager import TTLManager
-from .gc_operator import GCType, GCOperator
-from .managed_identity_map import ManagedIdentityMap, IdentityMapsCollection, IdentityMapInfo
+from .gc_operator import GCType, GCBudget, GCOperator
+from .single_flight import SingleFlight
+from .frequency_sketch import FrequencySketch
+from .sizers import Sizer, deep_sizeof, dunder_sizeof, shallow_sizeof
+from .entry_list import Entry, EntryList
+from .snapshot import SnapshotRestore, read_frames, save_snapshot
+from .disk_tier import DiskTier
+from .collection_budget import BudgetPolicy, CollectionBudget
+from .managed_identity_map import (
+    ManagedIdentityMap,
+    ShardedManagedIdentityMap,
+    IdentityMapsCollection,
+    IdentityMapInfo,
+)
+from .shared_identity_map import SharedIdentityMap
+from .access_trace import AccessTrace, AccessTraceRecorder, hit_ratio_curves
+from .gc_scheduler import BaseGCScheduler, GCScheduler, AsyncGCScheduler
+from .async_identity_map import AsyncManagedIdentityMap, AsyncIdentityMapsCollection
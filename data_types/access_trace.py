@@ -0,0 +1,246 @@
+import mmap
+import struct
+import threading
+import time
+from collections import Counter
+from typing import Any, Iterable, Iterator
+
+from .gc_operator import GCType
+from .managed_identity_map import ManagedIdentityMap
+
+MAGIC = b"PTKTRACE"
+VERSION = 1
+# magic, version, sample rate, wall clock time of the first record
+HEADER = struct.Struct("<8sHdd")
+# key hash, milliseconds since the start (wrapping at 2**32), operation
+RECORD = struct.Struct("<QIB")
+OP_HIT, OP_MISS = 0, 1
+
+_HASH_MASK = 2**64 - 1
+# Fibonacci hashing spreads consecutive keys (ints hash to themselves) over the whole 64-bit range.
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+# Capacities and TTLs (seconds) hit_ratio_curves() simulates by default.
+CAPACITIES = tuple(2**power for power in range(6, 21))
+TTLS = (1, 5, 15, 60, 300, 900, 3600)
+
+
+def key_hash(key: Any) -> int:
+    return (hash(key) * _HASH_MULTIPLIER) & _HASH_MASK
+
+
+class AccessTraceRecorder:
+    """
+    Hook listener writing the lookups of a map (key hash, time, hit or miss) to a compact binary trace,
+    13 bytes a lookup, for replay with hit_ratio_curves().
+
+        with AccessTraceRecorder("users.trace", sample_rate=0.1) as recorder:
+            identity_map.add_listener(recorder)
+            ...
+            identity_map.remove_listener(recorder)
+
+    sample_rate samples keys, not lookups: a key's hash decides whether all or none of its lookups are
+    recorded, so reuse distances survive sampling and the replay scales capacities by the rate. Sampled
+    curves are estimates: they get noisy when a handful of keys take most of the lookups.
+    Records are buffered and written buffer_size bytes at a time.
+    """
+
+    def __init__(self, path: str, sample_rate: float = 1.0, buffer_size: int = 64 * 1024):
+        if not 0 < sample_rate <= 1:
+            raise ValueError(f"sample_rate must be in (0, 1], not {sample_rate}")
+        self._threshold: int = int(sample_rate * 2**64)
+        self._buffer_size: int = buffer_size
+        self._buffer: bytearray = bytearray()
+        self._lock: threading.Lock = threading.Lock()
+        self._started: int = time.monotonic_ns()
+        self._records: int = 0
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, sample_rate, time.time()))
+
+    @property
+    def records(self) -> int:
+        return self._records
+
+    def _record(self, key: Any, operation: int) -> None:
+        hashed = key_hash(key)
+        if hashed >= self._threshold:
+            return
+        with self._lock:
+            if self._file is None:
+                return
+            # Timestamps are taken under the lock, so records of concurrent threads stay in time order.
+            elapsed = (time.monotonic_ns() - self._started) // 1_000_000 & 0xFFFFFFFF
+            self._buffer += RECORD.pack(hashed, elapsed, operation)
+            self._records += 1
+            if len(self._buffer) >= self._buffer_size:
+                self._flush()
+
+    def on_hit(self, key: Any) -> None:
+        self._record(key, OP_HIT)
+
+    def on_miss(self, key: Any) -> None:
+        self._record(key, OP_MISS)
+
+    def _flush(self) -> None:
+        self._file.write(self._buffer)
+        self._buffer.clear()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+                self._file.close()
+                self._file = None
+
+    def __enter__(self) -> "AccessTraceRecorder":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class AccessTrace:
+    """A recorded trace, read through mmap; iterating yields (key hash, milliseconds, operation)."""
+
+    def __init__(self, path: str):
+        self._path: str = path
+        with open(path, "rb") as file:
+            magic, version, self.sample_rate, self.started = HEADER.unpack(file.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not an access trace of version {VERSION}")
+            file.seek(0, 2)
+            # A recorder that was not closed may leave a partial record behind.
+            self.records: int = (file.tell() - HEADER.size) // RECORD.size
+
+    def __len__(self) -> int:
+        return self.records
+
+    def __iter__(self) -> Iterator[tuple[int, int, int]]:
+        if not self.records:
+            return
+        with open(self._path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)[HEADER.size : HEADER.size + self.records * RECORD.size]
+            try:
+                wraps, previous = 0, 0
+                for hashed, elapsed, operation in RECORD.iter_unpack(view):
+                    if elapsed < previous:
+                        wraps += 1 << 32
+                    previous = elapsed
+                    yield hashed, wraps + elapsed, operation
+            finally:
+                view.release()
+
+
+class _StackDistances:
+    """
+    Mattson's stack algorithm: the LRU stack distance of every access, i.e. the smallest LRU capacity that
+    makes it a hit, which gives the hit ratio of all capacities at once. A Fenwick tree over access times
+    marks the latest access of every key; the distance of an access is the number of marks after the
+    previous access of its key.
+    """
+
+    def __init__(self, accesses: int):
+        self._tree: list[int] = [0] * (accesses + 1)
+        self._last: dict[int, int] = {}
+        self._time: int = 0
+        self.distances: Counter = Counter()
+
+    def _add(self, position: int, delta: int) -> None:
+        tree, size = self._tree, len(self._tree)
+        position += 1
+        while position < size:
+            tree[position] += delta
+            position += position & -position
+
+    def _prefix(self, position: int) -> int:
+        tree, total = self._tree, 0
+        position += 1
+        while position > 0:
+            total += tree[position]
+            position -= position & -position
+        return total
+
+    def access(self, key: int) -> None:
+        previous = self._last.get(key)
+        if previous is None:
+            self.distances[None] += 1
+        else:
+            self.distances[len(self._last) - self._prefix(previous) + 1] += 1
+            self._add(previous, -1)
+        self._last[key] = self._time
+        self._add(self._time, 1)
+        self._time += 1
+
+    @property
+    def keys(self) -> int:
+        return len(self._last)
+
+    def hits(self, capacities: Iterable[int]) -> list[int]:
+        finite = sorted((distance, count) for distance, count in self.distances.items() if distance is not None)
+        hits = []
+        for capacity in capacities:
+            hits.append(sum(count for distance, count in finite if distance <= capacity))
+        return hits
+
+
+def hit_ratio_curves(
+    trace: AccessTrace, capacities: Iterable[int] = CAPACITIES, ttls: Iterable[float] = TTLS, lfru: bool = True
+) -> dict[str, Any]:
+    """
+    Replay trace in one pass and return the hit ratio of LRU and LFRU (W-TinyLFU, simulated with a
+    ManagedIdentityMap per capacity) for each capacity, and of TTL-only expiry (no capacity bound) for each
+    TTL, next to the hit ratio the trace observed. Capacities are in keys of the full, unsampled key space.
+    """
+    capacities, ttls = list(capacities), list(ttls)
+    rate = trace.sample_rate
+    sampled = [max(1, round(capacity * rate)) for capacity in capacities]
+    stack = _StackDistances(len(trace))
+    maps = []
+    if lfru:
+        maps = [ManagedIdentityMap(max_items=size, gc_types=GCType.LFRU, gc_possibility=0) for size in sampled]
+    lfru_hits = [0] * len(maps)
+    # TTL-only: per TTL, when each key was last loaded.
+    ttl_ms = [ttl * 1000 for ttl in ttls]
+    loaded_at = [{} for _ in ttls]
+    ttl_hits = [0] * len(ttls)
+    accesses = observed = 0
+
+    for hashed, elapsed, operation in trace:
+        accesses += 1
+        observed += operation == OP_HIT
+        stack.access(hashed)
+        for index, identity_map in enumerate(maps):
+            if identity_map.get(hashed) is None:
+                identity_map.add(hashed, True)
+            else:
+                lfru_hits[index] += 1
+        for index, loaded in enumerate(loaded_at):
+            at = loaded.get(hashed)
+            if at is not None and elapsed - at < ttl_ms[index]:
+                ttl_hits[index] += 1
+            else:
+                loaded[hashed] = elapsed
+
+    def ratios(hits: list[int]) -> list[float]:
+        return [count / accesses if accesses else 0 for count in hits]
+
+    curves = {
+        "accesses": accesses,
+        # Distinct keys, estimated for the whole key space when sampled.
+        "keys": round(stack.keys / rate),
+        "sample_rate": rate,
+        "observed": observed / accesses if accesses else 0,
+        "capacities": capacities,
+        "lru": ratios(stack.hits(sampled)),
+        "ttls": ttls,
+        "ttl": ratios(ttl_hits),
+    }
+    if lfru:
+        curves["lfru"] = ratios(lfru_hits)
+    return curves
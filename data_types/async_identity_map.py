@@ -0,0 +1,408 @@
+import asyncio
+import inspect
+import time
+from typing import Any, Awaitable, Callable, Iterable, Iterator, Mapping, Unpack
+
+from .managed_identity_map import (
+    IdentityMapAddParams,
+    IdentityMapsCollection,
+    ManagedIdentityMap,
+    ShardedManagedIdentityMap,
+)
+from .gc_scheduler import AsyncGCScheduler
+from .metrics import CacheMetrics, map_label, merge_snapshots, to_prometheus
+from .hooks import Hooks, change_hooks
+from .snapshot import SnapshotRestore
+
+
+class _AsyncFlight:
+    __slots__ = ("task", "waiters", "many")
+
+    def __init__(self, task: asyncio.Task, many: bool = False):
+        self.task: asyncio.Task = task
+        self.waiters: int = 0
+        # A batch flight is shared by all of its keys and its task results in a {key: item} dict.
+        self.many: bool = many
+
+
+class AsyncManagedIdentityMap:
+    """
+    asyncio front of a ManagedIdentityMap. Lookups stay synchronous, get_or_fetch() awaits coroutine loaders
+    and coalesces concurrent misses per key into one loader task. A waiter that is cancelled or times out
+    leaves the load running for the others; the load itself is cancelled once nobody waits for it.
+    Refresh-ahead and stale reloads of the map (refresh_ahead, stale_ttl) run as tasks of the loop.
+    """
+
+    def __init__(
+        self,
+        internal_type: str | None = None,
+        identity_map: ManagedIdentityMap | ShardedManagedIdentityMap | None = None,
+        **kwargs: Any,
+    ):
+        if identity_map is None:
+            identity_map = ManagedIdentityMap(internal_type=internal_type, **kwargs)
+        self._map: ManagedIdentityMap | ShardedManagedIdentityMap = identity_map
+        self._flights: dict[str | int, _AsyncFlight] = {}
+        self._coalesced: int = 0
+        # Loads and refreshes run here; lookups are counted by the wrapped map.
+        self._metrics: CacheMetrics = CacheMetrics()
+        self._hooks: Hooks | None = None
+        self._gc_task: asyncio.Task | None = None
+        self._previous_inline_gc: bool | None = None
+
+    @property
+    def identity_map(self) -> ManagedIdentityMap | ShardedManagedIdentityMap:
+        return self._map
+
+    @property
+    def internal_type(self) -> str:
+        return self._map.internal_type
+
+    def has(self, key: str | int) -> bool:
+        return self._map.has(key)
+
+    def get(self, key: str | int) -> Any | None:
+        return self._map.get(key)
+
+    def add(self, key: str | int, data: Any, **kwargs: Unpack[IdentityMapAddParams]) -> None:
+        self._map.add(key, data, **kwargs)
+
+    def remove(self, key: str | int) -> None:
+        self._map.remove(key)
+
+    def is_absent(self, key: str | int) -> bool:
+        return self._map.is_absent(key)
+
+    def add_absent(self, key: str | int) -> None:
+        self._map.add_absent(key)
+
+    def get_many(self, keys: Iterable[str | int]) -> dict[str | int, Any]:
+        return self._map.get_many(keys)
+
+    def add_hook(self, event: str, handler: Callable[..., Any]) -> None:
+        """Register handler on the wrapped map and on the loads awaited here."""
+        self._hooks = change_hooks(self._hooks, lambda hooks: hooks.add(event, handler))
+        self._map.add_hook(event, handler)
+
+    def remove_hook(self, event: str, handler: Callable[..., Any]) -> None:
+        self._hooks = change_hooks(self._hooks, lambda hooks: hooks.remove(event, handler))
+        self._map.remove_hook(event, handler)
+
+    def add_listener(self, listener: Any) -> None:
+        self._hooks = change_hooks(self._hooks, lambda hooks: hooks.add_listener(listener))
+        self._map.add_listener(listener)
+
+    def remove_listener(self, listener: Any) -> None:
+        self._hooks = change_hooks(self._hooks, lambda hooks: hooks.remove_listener(listener))
+        self._map.remove_listener(listener)
+
+    def add_many(self, items: Mapping[str | int, Any], **kwargs: Unpack[IdentityMapAddParams]) -> None:
+        self._map.add_many(items, **kwargs)
+
+    def remove_many(self, keys: Iterable[str | int]) -> None:
+        self._map.remove_many(keys)
+
+    def invalidate_tag(self, tag: str) -> None:
+        self._map.invalidate_tag(tag)
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        self._map.invalidate_tags(tags)
+
+    def clear(self) -> None:
+        self._map.clear()
+
+    async def get_or_fetch(
+        self,
+        key: str | int,
+        loader: Callable[[], Awaitable[Any] | Any],
+        timeout: float | None = None,
+        **kwargs: Unpack[IdentityMapAddParams],
+    ) -> Any:
+        data, refresh = self._map.lookup(key)
+        if refresh and key not in self._flights:
+            # Reload in a task of its own and serve the current item meanwhile.
+            self._fly(key, loader, kwargs, refresh=True).task.add_done_callback(self._refreshed)
+        if data is not None or self._map.is_absent(key):
+            return data
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._fly(key, loader, kwargs)
+        else:
+            self._coalesced += 1
+
+        data = await self._wait([flight], timeout)
+        return data.get(key) if flight.many else data
+
+    async def get_or_fetch_many(
+        self,
+        keys: Iterable[str | int],
+        loader: Callable[[list[str | int]], Awaitable[Mapping[str | int, Any]] | Mapping[str | int, Any]],
+        timeout: float | None = None,
+        **kwargs: Unpack[IdentityMapAddParams],
+    ) -> dict[str | int, Any]:
+        """Await one bulk loader(missing_keys) -> {key: item} call for all misses not already being loaded."""
+        keys = list(keys)
+        found = self._map.get_many(keys)
+        missing = [key for key in dict.fromkeys(keys) if key not in found and not self._map.is_absent(key)]
+        flights = {key: self._flights[key] for key in missing if key in self._flights}
+        self._coalesced += len(flights)
+        led = [key for key in missing if key not in flights]
+        if led:
+            flight = _AsyncFlight(asyncio.ensure_future(self._load_many(led, loader, kwargs)), many=True)
+            for key in led:
+                self._flights[key] = flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._land_many(led, flight))
+
+        unique = list({id(flight): flight for flight in flights.values()}.values())
+        if unique:
+            await self._wait(unique, timeout)
+        for key, flight in flights.items():
+            data = flight.task.result()
+            data = data.get(key) if flight.many else data
+            if data is not None:
+                found[key] = data
+        return found
+
+    def _fly(
+        self,
+        key: str | int,
+        loader: Callable[[], Awaitable[Any] | Any],
+        kwargs: IdentityMapAddParams,
+        refresh: bool = False,
+    ) -> _AsyncFlight:
+        flight = self._flights[key] = _AsyncFlight(asyncio.ensure_future(self._load(key, loader, kwargs, refresh)))
+        flight.task.add_done_callback(lambda _: self._land(key, flight))
+        return flight
+
+    def _refreshed(self, task: asyncio.Task) -> None:
+        # Nobody may await a background refresh: retrieve its outcome so a failure is counted, not logged.
+        if task.cancelled() or task.exception() is not None:
+            self._metrics.refresh_errors.inc()
+        else:
+            self._metrics.refreshes.inc()
+
+    async def _wait(self, flights: list[_AsyncFlight], timeout: float | None) -> Any:
+        for flight in flights:
+            flight.waiters += 1
+        try:
+            waiting = asyncio.gather(*(asyncio.shield(flight.task) for flight in flights))
+            if timeout is None:
+                results = await waiting
+            else:
+                results = await asyncio.wait_for(waiting, timeout)
+            return results[0] if len(results) == 1 else results
+        finally:
+            for flight in flights:
+                flight.waiters -= 1
+                if flight.waiters == 0 and not flight.task.done():
+                    flight.task.cancel()
+
+    def _land(self, key: str | int, flight: _AsyncFlight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _land_many(self, keys: list[str | int], flight: _AsyncFlight) -> None:
+        for key in keys:
+            self._land(key, flight)
+
+    async def _load(
+        self,
+        key: str | int,
+        loader: Callable[[], Awaitable[Any] | Any],
+        kwargs: IdentityMapAddParams,
+        refresh: bool = False,
+    ) -> Any:
+        # A refreshed key is still in the map, so the L2 cannot hold it.
+        if self._map.l2 is not None and not refresh:
+            # The L2 reads SQLite: keep the loop serving meanwhile.
+            data = await asyncio.get_running_loop().run_in_executor(None, self._map.load_from_l2, key)
+            if data is not None:
+                return data
+        started = time.perf_counter()
+        try:
+            data = loader()
+            if inspect.isawaitable(data):
+                data = await data
+        except BaseException as exc:
+            self._loaded(key, time.perf_counter() - started, exc)
+            raise
+        self._loaded(key, time.perf_counter() - started)
+        if data is None:
+            self._map.add_absent(key)
+        else:
+            self._map.add(key, data, **kwargs)
+        return data
+
+    async def _load_many(
+        self,
+        keys: list[str | int],
+        loader: Callable[[list[str | int]], Awaitable[Mapping[str | int, Any]] | Mapping[str | int, Any]],
+        kwargs: IdentityMapAddParams,
+    ) -> dict[str | int, Any]:
+        promoted = {}
+        if self._map.l2 is not None:
+            promoted = await asyncio.get_running_loop().run_in_executor(None, self._load_many_from_l2, keys)
+            keys = [key for key in keys if key not in promoted]
+            if not keys:
+                return promoted
+        started = time.perf_counter()
+        try:
+            loaded = loader(keys)
+            if inspect.isawaitable(loaded):
+                loaded = await loaded
+        except BaseException as exc:
+            self._loaded(keys, time.perf_counter() - started, exc)
+            raise
+        self._loaded(keys, time.perf_counter() - started)
+        loaded = {key: data for key, data in loaded.items() if data is not None}
+        self._map.add_many(loaded, **kwargs)
+        self._map.add_absent_many(key for key in keys if key not in loaded)
+        return promoted | loaded
+
+    def _load_many_from_l2(self, keys: list[str | int]) -> dict[str | int, Any]:
+        return {key: data for key in keys if (data := self._map.load_from_l2(key)) is not None}
+
+    def _loaded(self, key: Any, seconds: float, error: BaseException | None = None) -> None:
+        self._metrics.record_load(seconds, error is not None)
+        if self._hooks is not None:
+            self._hooks.fire("on_load", key, seconds, error)
+
+    def start_gc(self, interval: float = 1.0) -> None:
+        """Run the map's GC as a task of the running loop instead of inline in add()."""
+        if self._gc_task is not None and not self._gc_task.done():
+            return
+        self._previous_inline_gc = self._map.inline_gc
+        self._map.inline_gc = False
+        self._gc_task = asyncio.get_running_loop().create_task(self._gc_loop(interval))
+
+    async def stop_gc(self) -> None:
+        if self._gc_task is None:
+            return
+        self._gc_task.cancel()
+        try:
+            await self._gc_task
+        except asyncio.CancelledError:
+            pass
+        self._gc_task = None
+        if self._previous_inline_gc is not None:
+            self._map.inline_gc = self._previous_inline_gc
+            self._previous_inline_gc = None
+
+    async def _gc_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self._map.gc_run()
+
+    def snapshot(self, path: str) -> int:
+        return self._map.snapshot(path)
+
+    def warm_start(self, path: str) -> SnapshotRestore:
+        """Restore a snapshot on a daemon thread; the loop keeps serving from the map meanwhile."""
+        return self._map.warm_start(path)
+
+    def metrics_snapshot(self) -> dict[str, Any]:
+        return merge_snapshots([self._map.metrics_snapshot(), self._metrics.snapshot()])
+
+    def prometheus(self) -> str:
+        return to_prometheus({map_label(self.internal_type): self.metrics_snapshot()})
+
+    def stats(self) -> dict[str, Any] | None:
+        stats = self._map.stats()
+        stats["coalesced"] += self._coalesced
+        stats["loads"] += self._metrics.loads.value
+        stats["refreshes"] += self._metrics.refreshes.value
+        stats["refresh_errors"] += self._metrics.refresh_errors.value
+        return stats
+
+    def __len__(self) -> int:
+        return len(self._map)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._map)
+
+
+class AsyncIdentityMapsCollection:
+    """
+    asyncio counterpart of IdentityMapsCollection: hands out AsyncManagedIdentityMap views of its maps and
+    sweeps them from an AsyncGCScheduler task while started.
+    """
+
+    def __init__(self, gc_interval: float = 1.0, **kwargs: Any):
+        self._collection: IdentityMapsCollection = IdentityMapsCollection(**kwargs)
+        self._maps: dict[str, AsyncManagedIdentityMap] = {}
+        self._listeners: list[Any] = []
+        self._scheduler: AsyncGCScheduler = AsyncGCScheduler(self._collection, interval=gc_interval)
+
+    @property
+    def collection(self) -> IdentityMapsCollection:
+        return self._collection
+
+    @property
+    def scheduler(self) -> AsyncGCScheduler:
+        return self._scheduler
+
+    def get_map(
+        self, items_type: str, max_items: int | None = None, max_bytes: int | None = None
+    ) -> AsyncManagedIdentityMap:
+        if items_type not in self._maps:
+            one_map = AsyncManagedIdentityMap(identity_map=self._collection.get_map(items_type, max_items, max_bytes))
+            for listener in self._listeners:
+                one_map.add_listener(listener)
+            self._maps[items_type] = one_map
+        return self._maps[items_type]
+
+    def add_listener(self, listener: Any) -> None:
+        """Register the on_* methods of listener on every map handed out, including later ones."""
+        self._listeners.append(listener)
+        for one_map in self._maps.values():
+            one_map.add_listener(listener)
+
+    def remove_listener(self, listener: Any) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+        for one_map in self._maps.values():
+            one_map.remove_listener(listener)
+
+    def start(self) -> None:
+        self._scheduler.start()
+
+    async def stop(self) -> None:
+        await self._scheduler.stop()
+
+    async def run_gc(self) -> int:
+        return await self._scheduler.sweep()
+
+    def clear_map(self, items_type: str) -> None:
+        self._collection.clear_map(items_type)
+
+    def snapshot(self, path: str) -> int:
+        return self._collection.snapshot(path)
+
+    def warm_start(self, path: str) -> SnapshotRestore:
+        return self._collection.warm_start(path)
+
+    def clear(self) -> None:
+        self._collection.clear()
+
+    def stats(self) -> dict[str, Any]:
+        maps = {one_map.internal_type: one_map.stats() for one_map in self._maps.values()}
+        return {
+            "hits": sum(one["hits"] for one in maps.values()),
+            "misses": sum(one["misses"] for one in maps.values()),
+            "maps": maps,
+            "gc": self._scheduler.stats(),
+        }
+
+    async def __aenter__(self) -> "AsyncIdentityMapsCollection":
+        self.start()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.stop()
+
+    def __len__(self) -> int:
+        return len(self._collection)
+
+    def __iter__(self) -> Iterator[AsyncManagedIdentityMap]:
+        return iter(self._maps.values())
@@ -0,0 +1,246 @@
+import enum
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Mapping
+
+
+@enum.unique
+class BudgetPolicy(enum.Enum):
+    # Shares follow the weights.
+    STATIC = "static"
+    # Shares follow the hits each map served since the previous rebalance.
+    HIT_RATE = "hit_rate"
+    # Room moves step by step from the map that would lose the fewest hits to the one that would gain the most.
+    MARGINAL = "marginal"
+
+    def __str__(self):
+        return self.value
+
+
+class _Ghosts:
+    """Hook listener keeping the keys a map evicted lately: a miss on one is a hit the map lost for lack of room."""
+
+    def __init__(self, capacity: int):
+        self.capacity: int = capacity
+        self.hits: int = 0
+        self._keys: OrderedDict[Any, None] = OrderedDict()
+        # Segments of a sharded map fire from their own locks.
+        self._lock: threading.Lock = threading.Lock()
+
+    def on_evict(self, key: Any, reason: str) -> None:
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.capacity:
+                self._keys.popitem(last=False)
+
+    def on_miss(self, key: Any) -> None:
+        with self._lock:
+            if key in self._keys:
+                del self._keys[key]
+                self.hits += 1
+
+
+class CollectionBudget:
+    """
+    A limit of items and/or bytes for all the maps of an IdentityMapsCollection together, split into their
+    max_items and max_bytes by a policy (see BudgetPolicy; weights are per items type, 1 by default) and
+    rebalanced by the collection's GC sweeps every rebalance_interval seconds, or by rebalance().
+
+    MARGINAL tracks the keys every map evicted lately (GHOST_RATIO of its entries): misses on them measure the
+    hits a map would gain with more room, per item or, with a byte budget, per byte. Each rebalance moves
+    STEP of the budget from the map with the fewest such hits to the one with the most, so eviction pressure
+    falls on the map whose entries are the least valuable. No map gets less than MIN_SHARE of the budget.
+    """
+
+    REBALANCE_INTERVAL = 10.0
+    # Floor of every share, lowered to half an even split when there are too many maps for it.
+    MIN_SHARE = 0.02
+    # HIT_RATE: how far shares move towards their target at each rebalance, damping swings of traffic.
+    SMOOTHING = 0.5
+    # MARGINAL: share of the budget moved per rebalance, and ghost keys per map as a share of its entries.
+    STEP = 0.05
+    GHOST_RATIO = 0.1
+    GHOST_MIN = 16
+
+    def __init__(
+        self,
+        max_items: int | None = None,
+        max_bytes: int | None = None,
+        policy: BudgetPolicy | str = BudgetPolicy.STATIC,
+        weights: Mapping[Any, float] | None = None,
+        rebalance_interval: float = REBALANCE_INTERVAL,
+    ):
+        if max_items is None and max_bytes is None:
+            raise ValueError("A budget needs max_items, max_bytes or both")
+        if max_items is not None and max_items < 1:
+            raise ValueError(f"max_items must be a positive integer, not {max_items}")
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError(f"max_bytes must be a positive integer, not {max_bytes}")
+        self._max_items: int | None = max_items
+        self._max_bytes: int | None = max_bytes
+        self._policy: BudgetPolicy = BudgetPolicy(policy)
+        self._weights: dict[Any, float] = dict(weights or {})
+        self._rebalance_interval: float = rebalance_interval
+        self._lock: threading.RLock = threading.RLock()
+        self._maps: dict[Any, Any] = {}
+        self._shares: dict[Any, float] = {}
+        self._scores: dict[Any, float] = {}
+        self._hits: dict[Any, int] = {}
+        self._ghosts: dict[Any, _Ghosts] = {}
+        self._rebalances: int = 0
+        self._moved_items: int = 0
+        self._moved_bytes: int = 0
+        self._last_rebalance: float = time.monotonic()
+
+    @property
+    def policy(self) -> BudgetPolicy:
+        return self._policy
+
+    @property
+    def max_items(self) -> int | None:
+        return self._max_items
+
+    @property
+    def max_bytes(self) -> int | None:
+        return self._max_bytes
+
+    def _weight(self, items_type: Any) -> float:
+        return self._weights.get(items_type, 1.0)
+
+    def _floor(self, count: int) -> float:
+        return min(self.MIN_SHARE, 0.5 / count)
+
+    def _spread(self, values: Mapping[Any, float]) -> dict[Any, float]:
+        """Shares proportional to values, each at least the floor."""
+        floor = self._floor(len(values))
+        total = sum(values.values())
+        if total <= 0:
+            return {items_type: 1 / len(values) for items_type in values}
+        return {items_type: floor + (1 - floor * len(values)) * value / total for items_type, value in values.items()}
+
+    def _limits(self, share: float) -> tuple[int | None, int | None]:
+        items = max(1, int(self._max_items * share)) if self._max_items is not None else None
+        size = max(1, int(self._max_bytes * share)) if self._max_bytes is not None else None
+        return items, size
+
+    def admit(self, items_type: Any) -> tuple[int | None, int | None]:
+        """Make room for a new map and return its (max_items, max_bytes); attach() it once created."""
+        with self._lock:
+            if self._policy is BudgetPolicy.STATIC:
+                shares = self._spread({one: self._weight(one) for one in (*self._shares, items_type)})
+            else:
+                # The newcomer starts with an even share, taken from the others in proportion.
+                share = 1 / (len(self._shares) + 1)
+                shares = {one: value * (1 - share) for one, value in self._shares.items()}
+                shares[items_type] = share
+            self._shares = shares
+            return self._limits(shares[items_type])
+
+    def attach(self, items_type: Any, one_map: Any) -> None:
+        with self._lock:
+            self._maps[items_type] = one_map
+            self._hits[items_type] = one_map.metrics_snapshot()["hits"]
+            if self._policy is BudgetPolicy.MARGINAL:
+                self._ghosts[items_type] = _Ghosts(self.GHOST_MIN)
+                one_map.add_listener(self._ghosts[items_type])
+            self._apply()
+
+    def rebalance_if_due(self) -> bool:
+        if time.monotonic() - self._last_rebalance < self._rebalance_interval:
+            return False
+        self.rebalance()
+        return True
+
+    def rebalance(self) -> None:
+        """Recompute the shares from the traffic since the previous rebalance and resize the maps."""
+        with self._lock:
+            self._last_rebalance = time.monotonic()
+            if not self._maps:
+                return
+            self._scores = self._score()
+            if self._policy is BudgetPolicy.STATIC:
+                self._shares = self._spread(self._scores)
+            elif self._policy is BudgetPolicy.HIT_RATE:
+                if sum(self._scores.values()) > 0:
+                    target = self._spread(self._scores)
+                    shares = self._shares
+                    self._shares = {one: shares[one] + self.SMOOTHING * (target[one] - shares[one]) for one in target}
+            else:
+                self._step()
+            self._rebalances += 1
+            self._apply()
+
+    def _score(self) -> dict[Any, float]:
+        scores = {}
+        for items_type, one_map in self._maps.items():
+            weight = self._weight(items_type)
+            if self._policy is BudgetPolicy.STATIC:
+                scores[items_type] = weight
+            elif self._policy is BudgetPolicy.HIT_RATE:
+                hits = one_map.metrics_snapshot()["hits"]
+                scores[items_type] = weight * (hits - self._hits[items_type])
+                self._hits[items_type] = hits
+            else:
+                ghosts = self._ghosts[items_type]
+                # Ghost hits per item the map would get, or per byte with a byte budget.
+                room = ghosts.capacity
+                if self._max_bytes is not None and len(one_map):
+                    room *= max(1, one_map.bytes / len(one_map))
+                scores[items_type] = weight * ghosts.hits / room
+                ghosts.hits = 0
+                ghosts.capacity = max(self.GHOST_MIN, int(len(one_map) * self.GHOST_RATIO))
+        return scores
+
+    def _step(self) -> None:
+        if len(self._shares) < 2:
+            return
+        poorest = min(self._scores, key=self._scores.get)
+        richest = max(self._scores, key=self._scores.get)
+        if self._scores[richest] <= self._scores[poorest]:
+            return
+        moved = min(self.STEP, self._shares[poorest] - self._floor(len(self._shares)))
+        if moved > 0:
+            self._shares[poorest] -= moved
+            self._shares[richest] += moved
+
+    def _apply(self) -> None:
+        limits = {items_type: self._limits(self._shares[items_type]) for items_type in self._maps}
+
+        def growth(items_type: Any) -> int:
+            max_items, max_bytes = limits[items_type]
+            if max_items is not None:
+                return max_items - (self._maps[items_type].max_items or 0)
+            return max_bytes - (self._maps[items_type].max_bytes or 0)
+
+        # Shrink before growing, so the maps never hold more than the budget together.
+        for items_type in sorted(limits, key=growth):
+            one_map = self._maps[items_type]
+            max_items, max_bytes = limits[items_type]
+            if max_items is not None and one_map.max_items is not None and max_items > one_map.max_items:
+                self._moved_items += max_items - one_map.max_items
+            if max_bytes is not None and one_map.max_bytes is not None and max_bytes > one_map.max_bytes:
+                self._moved_bytes += max_bytes - one_map.max_bytes
+            one_map.resize(max_items, max_bytes)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "policy": str(self._policy),
+                "max_items": self._max_items,
+                "max_bytes": self._max_bytes,
+                "rebalances": self._rebalances,
+                # Room handed from map to map, summed over all the rebalances.
+                "moved_items": self._moved_items,
+                "moved_bytes": self._moved_bytes,
+                "maps": {
+                    items_type: {
+                        "share": self._shares[items_type],
+                        "max_items": one_map.max_items,
+                        "max_bytes": one_map.max_bytes,
+                        "score": self._scores.get(items_type),
+                    }
+                    for items_type, one_map in self._maps.items()
+                },
+            }
@@ -0,0 +1,329 @@
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any
+
+# (value, deadline in time.monotonic() seconds or None, tags or None, tag epoch), or None for a row to delete.
+_Pending = tuple[Any, float | None, tuple[str, ...] | None, int] | None
+
+_logger = logging.getLogger(__name__)
+
+
+def _encode_key(key: str | int) -> bytes:
+    return pickle.dumps(key, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class DiskTier:
+    """
+    Second level of a ManagedIdentityMap (its l2 argument): a local SQLite file the map demotes the entries
+    it evicts to, and looks missed keys up in before calling the loader. A key lives in one level at a time:
+    found in the L2, it moves back to the map.
+
+    Demoted entries are queued in memory and written batch_size at a time, or every flush_interval seconds,
+    by a daemon thread, so evictions never wait for the disk; lookups see the queue. Keys, deadlines and
+    sizes are indexed in memory, so a key the L2 does not hold costs no query. The L2 keeps at most max_items
+    entries and max_bytes of pickled data, dropping the earliest demoted when a batch is written; entries
+    stay at most ttl seconds, and never past the TTL they had in the map: the thread purges the expired ones
+    every purge_interval seconds.
+
+    The file is a spill area of this process, not a persistent cache (snapshots carry a cache over a restart):
+    the path must not exist or be an empty file, and close() deletes it. A file left by a crashed process is
+    refused like any other; delete it first.
+    """
+
+    BATCH_SIZE = 256
+    FLUSH_INTERVAL = 1.0
+    PURGE_INTERVAL = 30.0
+
+    def __init__(
+        self,
+        path: str,
+        max_items: int | None = None,
+        max_bytes: int | None = None,
+        ttl: float | None = None,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        purge_interval: float = PURGE_INTERVAL,
+        name: str = "identity-map-l2",
+    ):
+        if max_items is not None and max_items < 1:
+            raise ValueError(f"max_items must be a positive integer, not {max_items}")
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError(f"max_bytes must be a positive integer, not {max_bytes}")
+        if ttl is not None and ttl <= 0:
+            raise ValueError(f"ttl must be positive, not {ttl}")
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            raise FileExistsError(f"{path} exists and the L2 would overwrite it, give the L2 a file of its own")
+        self._path: str = path
+        self._max_items: int | None = max_items
+        self._max_bytes: int | None = max_bytes
+        self._ttl: float | None = ttl
+        self._batch_size: int = max(1, batch_size)
+        self._flush_interval: float = flush_interval
+        self._purge_interval: float = purge_interval
+        # Guards the queue and the index; never held while the database is used.
+        self._lock: threading.Lock = threading.Lock()
+        # Serializes the use of the connection, and batch writes with each other.
+        self._db_lock: threading.Lock = threading.Lock()
+        # Demotions and deletions not written yet, oldest first, and the batch being written.
+        self._pending: dict[str | int, _Pending] = {}
+        self._writing: dict[str | int, _Pending] = {}
+        # Keys stored in the file: key -> (deadline, size), earliest demoted first.
+        self._index: dict[str | int, tuple[float | None, int]] = {}
+        self._bytes: int = 0
+        self._hits: int = 0
+        self._misses: int = 0
+        self._expired: int = 0
+        self._evicted: int = 0
+        self._rejected: int = 0
+        self._errors: int = 0
+        self._batches: int = 0
+        self._written: int = 0
+
+        # A cache file needs neither a journal nor fsync: a crash loses nothing the map cannot reload.
+        self._db: sqlite3.Connection = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("CREATE TABLE entries (key BLOB PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID")
+        self._db.commit()
+
+        self._wake: threading.Event = threading.Event()
+        self._closed: bool = False
+        self._thread: threading.Thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def max_items(self) -> int | None:
+        return self._max_items
+
+    @property
+    def max_bytes(self) -> int | None:
+        return self._max_bytes
+
+    @property
+    def ttl(self) -> float | None:
+        return self._ttl
+
+    @property
+    def bytes(self) -> int:
+        """Pickled size of the entries written to the file."""
+        return self._bytes
+
+    def put(
+        self,
+        key: str | int,
+        value: Any,
+        ttl: float | None = None,
+        tags: tuple[str, ...] | None = None,
+        epoch: int = 0,
+    ) -> None:
+        """Queue value for key, replacing what the L2 holds for it; ttl is what remains of the map's TTL."""
+        if self._ttl is not None:
+            ttl = self._ttl if ttl is None else min(ttl, self._ttl)
+        deadline = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._forget(key)
+            self._pending.pop(key, None)
+            self._pending[key] = (value, deadline, tags, epoch)
+            if len(self._pending) >= self._batch_size:
+                self._wake.set()
+
+    def take(self, key: str | int) -> tuple[Any, float | None, tuple[str, ...] | None, int] | None:
+        """Remove key and return its (value, remaining ttl, tags, tag epoch), None when missing or expired."""
+        now = time.monotonic()
+        with self._lock:
+            record = self._pending[key] if key in self._pending else self._writing.get(key)
+            if record is not None:
+                self._forget(key)
+            else:
+                indexed = self._index.pop(key, None)
+                if indexed is None:
+                    self._misses += 1
+                    return None
+                self._bytes -= indexed[1]
+                if indexed[0] is not None and indexed[0] <= now:
+                    self._pending[key] = None
+                    record = (None, indexed[0], None, 0)
+        if record is None:
+            # Out of the index, the row stays in the file until its deletion is queued.
+            with self._db_lock:
+                row = self._db.execute("SELECT value FROM entries WHERE key = ?", (_encode_key(key),)).fetchone()
+            with self._lock:
+                if key not in self._pending:
+                    self._pending[key] = None
+                if row is None:
+                    # Cleared meanwhile.
+                    self._misses += 1
+                    return None
+            value, tags, epoch = pickle.loads(row[0])
+            record = (value, indexed[0], tags, epoch)
+        value, deadline, tags, epoch = record
+        with self._lock:
+            if deadline is not None and deadline <= now:
+                self._expired += 1
+                self._misses += 1
+                return None
+            self._hits += 1
+        return value, None if deadline is None else deadline - now, tags, epoch
+
+    def discard(self, key: str | int) -> None:
+        with self._lock:
+            self._forget(key)
+
+    def _forget(self, key: str | int) -> None:
+        indexed = self._index.pop(key, None)
+        if indexed is not None:
+            self._bytes -= indexed[1]
+        if indexed is not None or key in self._writing:
+            # The row is (or is being) written: delete it with the next batch.
+            self._pending[key] = None
+        elif self._pending.get(key) is not None:
+            del self._pending[key]
+
+    def flush(self) -> None:
+        """Write the queued demotions and deletions now, on the caller's thread."""
+        with self._db_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                self._writing, self._pending = self._pending, {}
+            deleted, rows, sizes, rejected = [], [], {}, 0
+            for key, record in self._writing.items():
+                if record is None:
+                    try:
+                        deleted.append((_encode_key(key),))
+                    except Exception:
+                        # A key that cannot be pickled never made it to the file.
+                        pass
+                    continue
+                value, _, tags, epoch = record
+                try:
+                    row = (_encode_key(key), pickle.dumps((value, tags, epoch), protocol=pickle.HIGHEST_PROTOCOL))
+                except Exception:
+                    # Not picklable: it just does not make it to the L2.
+                    rejected += 1
+                    continue
+                rows.append(row)
+                sizes[key] = len(row[1])
+            try:
+                with self._db:
+                    self._db.executemany("DELETE FROM entries WHERE key = ?", deleted)
+                    self._db.executemany("INSERT OR REPLACE INTO entries (key, value) VALUES (?, ?)", rows)
+            except Exception:
+                # The batch is lost, which only costs the loads of its entries.
+                with self._lock:
+                    self._writing = {}
+                    self._errors += 1
+                raise
+            with self._lock:
+                for key, size in sizes.items():
+                    # Taken, discarded or demoted again while the batch was written.
+                    if key in self._pending:
+                        continue
+                    self._index[key] = (self._writing[key][1], size)
+                    self._bytes += size
+                self._writing = {}
+                self._rejected += rejected
+                self._batches += 1
+                self._written += len(rows)
+                self._evict_overflow()
+
+    def _evict_overflow(self) -> None:
+        while self._index and (
+            (self._max_items is not None and len(self._index) > self._max_items)
+            or (self._max_bytes is not None and self._bytes > self._max_bytes)
+        ):
+            key = next(iter(self._index))
+            self._bytes -= self._index.pop(key)[1]
+            self._pending[key] = None
+            self._evicted += 1
+
+    def purge_expired(self) -> int:
+        """Drop the expired entries from the index (their rows go with the next batch) and return how many."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (deadline, _) in self._index.items() if deadline is not None and deadline <= now]
+            for key in expired:
+                self._forget(key)
+            self._expired += len(expired)
+            return len(expired)
+
+    def clear(self) -> None:
+        with self._db_lock:
+            with self._lock:
+                self._pending.clear()
+                self._index.clear()
+                self._bytes = 0
+            with self._db:
+                self._db.execute("DELETE FROM entries")
+
+    def _run(self) -> None:
+        purged = time.monotonic()
+        while not self._closed:
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            if self._closed:
+                break
+            # The thread must outlive a failing batch: the next ones may succeed, and evictions keep queueing.
+            try:
+                if time.monotonic() - purged >= self._purge_interval:
+                    purged = time.monotonic()
+                    self.purge_expired()
+                self.flush()
+            except Exception:
+                _logger.exception("The L2 %s failed to write a batch", self._path)
+
+    def close(self) -> None:
+        """Stop the writer thread, close the file and delete it."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        with self._db_lock:
+            self._db.close()
+        with self._lock:
+            self._pending.clear()
+            self._index.clear()
+            self._bytes = 0
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            hits, misses = self._hits, self._misses
+            return {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits else 0,
+                "count": len(self._index) + sum(record is not None for record in self._pending.values()),
+                "pending": len(self._pending),
+                "max_items": self._max_items,
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "expired": self._expired,
+                "evictions": self._evicted,
+                "rejections": self._rejected,
+                "errors": self._errors,
+                "batches": self._batches,
+                "written": self._written,
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index) + sum(record is not None for record in self._pending.values())
+
+    def __enter__(self) -> "DiskTier":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,99 @@
+from typing import Any, Iterator
+
+
+class Entry:
+    """
+    Everything a managed map keeps about one key in a single slotted record: the value, its TTL deadline,
+    its tags with the tag epoch they were set at, its measured size and its links in an EntryList.
+    """
+
+    __slots__ = ("prev", "next", "key", "value", "deadline", "tags", "epoch", "size")
+
+    def __init__(self, key: Any, value: Any):
+        self.prev: Entry | EntryList | None = None
+        self.next: Entry | EntryList | None = None
+        self.key: Any = key
+        self.value: Any = value
+        self.deadline: int | None = None
+        self.tags: tuple[str, ...] | None = None
+        self.epoch: int = 0
+        self.size: int = 0
+
+
+class EntryList:
+    """
+    Intrusive circular doubly linked list of Entry records in LRU order, the list itself being the sentinel:
+    moving, adding and removing an entry only rewires its links, without any lookup or allocation.
+    """
+
+    __slots__ = ("prev", "next", "count")
+
+    def __init__(self):
+        self.prev: Entry | EntryList = self
+        self.next: Entry | EntryList = self
+        self.count: int = 0
+
+    def append(self, entry: Entry) -> None:
+        last = self.prev
+        entry.prev = last
+        entry.next = self
+        last.next = entry
+        self.prev = entry
+        self.count += 1
+
+    def prepend(self, entry: Entry) -> None:
+        """Add entry as the least recently used one."""
+        first = self.next
+        entry.prev = self
+        entry.next = first
+        first.prev = entry
+        self.next = entry
+        self.count += 1
+
+    def remove(self, entry: Entry) -> None:
+        entry.prev.next = entry.next
+        entry.next.prev = entry.prev
+        entry.prev = entry.next = None
+        self.count -= 1
+
+    def move_to_end(self, entry: Entry) -> None:
+        if entry.next is self:
+            return
+        entry.prev.next = entry.next
+        entry.next.prev = entry.prev
+        last = self.prev
+        entry.prev = last
+        entry.next = self
+        last.next = entry
+        self.prev = entry
+
+    def first(self) -> Entry | None:
+        """The least recently used entry."""
+        return self.next if self.next is not self else None
+
+    def get_first(self, count: int) -> list[Entry]:
+        entries = []
+        entry = self.next
+        while entry is not self and len(entries) < count:
+            entries.append(entry)
+            entry = entry.next
+        return entries
+
+    def clear(self) -> None:
+        self.prev = self.next = self
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[Entry]:
+        entry = self.next
+        while entry is not self:
+            yield entry
+            entry = entry.next
+
+    def __reversed__(self) -> Iterator[Entry]:
+        entry = self.prev
+        while entry is not self:
+            yield entry
+            entry = entry.prev
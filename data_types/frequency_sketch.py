@@ -0,0 +1,68 @@
+from typing import Hashable
+
+_MASK64 = (1 << 64) - 1
+_SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+_MAX_COUNT = 15
+_HALVE = bytes(count >> 1 for count in range(256))
+
+
+class FrequencySketch:
+    """
+    Count-min sketch of access frequencies with 4-bit saturating counters (stored one per byte).
+
+    Each row has width_factor counters per tracked entry; a key maps to one counter per row, an increment bumps
+    only the row counters that hold the current minimum (conservative update) and the estimate is the minimum
+    of them. After sample_factor increments per tracked entry every counter is halved, so the sketch keeps
+    tracking recent popularity instead of all-time counts.
+    """
+
+    def __init__(self, capacity: int, depth: int = 4, width_factor: int = 4, sample_factor: int = 10):
+        if not 1 <= depth <= len(_SEEDS):
+            raise ValueError(f"depth must be between 1 and {len(_SEEDS)}, not {depth}")
+        capacity = max(1, capacity)
+        self._bits: int = max(4, (capacity * width_factor - 1).bit_length())
+        self._width: int = 1 << self._bits
+        self._seeds: tuple[int, ...] = _SEEDS[:depth]
+        self._table: bytearray = bytearray(self._width * depth)
+        self._sample_size: int = capacity * sample_factor
+        self._additions: int = 0
+        self._resets: int = 0
+
+    @property
+    def width(self) -> int:
+        return self._width
+
+    @property
+    def resets(self) -> int:
+        return self._resets
+
+    def _indexes(self, key: Hashable) -> list[int]:
+        h = hash(key) & _MASK64
+        shift = 64 - self._bits
+        width = self._width
+        return [row * width + (((h * seed) & _MASK64) >> shift) for row, seed in enumerate(self._seeds)]
+
+    def increment(self, key: Hashable) -> None:
+        table = self._table
+        indexes = self._indexes(key)
+        current = min(table[index] for index in indexes)
+        if current < _MAX_COUNT:
+            for index in indexes:
+                if table[index] == current:
+                    table[index] = current + 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._age()
+
+    def estimate(self, key: Hashable) -> int:
+        table = self._table
+        return min(table[index] for index in self._indexes(key))
+
+    def _age(self) -> None:
+        self._table = bytearray(self._table.translate(_HALVE))
+        self._additions //= 2
+        self._resets += 1
+
+    def clear(self) -> None:
+        self._table = bytearray(len(self._table))
+        self._additions = 0
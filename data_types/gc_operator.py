@@ -1,5 +1,6 @@
 import enum
 import random
+import time
 from typing import Callable
 
 
@@ -15,8 +16,47 @@ class GCType(enum.IntEnum):
         return str(self.value)
 
 
+class GCBudget:
+    """Limits a single GC pass by the number of reclaimed entries and/or by wall time in microseconds."""
+
+    def __init__(self, max_entries: int | None = None, max_time_us: int | None = None):
+        self._max_entries: int | None = max_entries
+        self._deadline: int | None = None
+        if max_time_us is not None:
+            self._deadline = time.perf_counter_ns() + max_time_us * 1000
+        self._spent: int = 0
+
+    @property
+    def spent(self) -> int:
+        return self._spent
+
+    def spend(self, count: int = 1) -> None:
+        self._spent += count
+
+    def remaining_entries(self, wanted: int) -> int:
+        if self._max_entries is None:
+            return wanted
+        return max(0, min(wanted, self._max_entries - self._spent))
+
+    def exhausted(self) -> bool:
+        if self._max_entries is not None and self._spent >= self._max_entries:
+            return True
+        if self._deadline is not None and time.perf_counter_ns() >= self._deadline:
+            return True
+        return False
+
+
 class GCOperator:
-    def __init__(self, gc_types: int | tuple[GCType] = None, possibility: float = 0.5, func: Callable | None = None):
+    DEFAULT_POSSIBILITY = 0.5
+
+    def __init__(
+        self,
+        gc_types: int | tuple[GCType] = None,
+        possibility: float | None = None,
+        func: Callable[[GCBudget], object] | None = None,
+        max_entries: int | None = None,
+        max_time_us: int | None = None,
+    ):
         if gc_types is None:
             self._gc_types = tuple()
         elif isinstance(gc_types, int):
@@ -26,9 +66,11 @@ class GCOperator:
         else:
             raise TypeError(f"gc_types must be of type int or tuple, not {type(gc_types)}")
 
-        self._func: Callable | None = func
+        self._func: Callable[[GCBudget], object] | None = func
 
-        self.possibility: float = possibility
+        self.possibility: float = possibility if possibility is not None else self.DEFAULT_POSSIBILITY
+        self.max_entries: int | None = max_entries
+        self.max_time_us: int | None = max_time_us
 
     @property
     def gc_types(self) -> tuple[GCType]:
@@ -56,11 +98,14 @@ class GCOperator:
     def __iter__(self):
         yield from self.gc_types
 
-    def is_possible(self) -> tuple[GCType]:
+    def budget(self) -> GCBudget:
+        return GCBudget(self.max_entries, self.max_time_us)
+
+    def is_possible(self) -> bool:
         return random.random() < self.possibility
 
     def run(self) -> None:
-        if self.func is not None:
+        if self.func is not None and self.gc_types:
             if self.is_possible():
                 if callable(self.func):
-                    self.func()  # pylint: disable=E1102
+                    self.func(self.budget())  # pylint: disable=E1102
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable
+
+from .managed_identity_map import IdentityMapsCollection
+
+_logger = logging.getLogger(__name__)
+
+
+class BaseGCScheduler:
+    """
+    Sweeps every map of an IdentityMapsCollection every interval seconds, or sooner when the collection
+    is under memory pressure. While a scheduler is running, the maps stop rolling GC inside add().
+    """
+
+    def __init__(
+        self,
+        collection: IdentityMapsCollection,
+        interval: float = 1.0,
+        pressure_interval: float | None = None,
+        pressure: Callable[[], bool] | None = None,
+    ):
+        if interval <= 0:
+            raise ValueError(f"interval must be positive, not {interval}")
+        self._collection: IdentityMapsCollection = collection
+        self._interval: float = interval
+        # How often the memory pressure is checked between two regular sweeps.
+        self._pressure_interval: float = pressure_interval if pressure_interval is not None else interval
+        self._pressure: Callable[[], bool] | None = pressure
+        self._previous_inline_gc: bool | None = None
+        self._sweeps: int = 0
+        self._reclaimed: int = 0
+
+    @property
+    def collection(self) -> IdentityMapsCollection:
+        return self._collection
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    def under_pressure(self) -> bool:
+        if self._pressure is not None and self._pressure():
+            return True
+        return self._collection.gc_pending()
+
+    def _detach_inline_gc(self) -> None:
+        self._previous_inline_gc = self._collection.inline_gc
+        self._collection.inline_gc = False
+
+    def _restore_inline_gc(self) -> None:
+        if self._previous_inline_gc is not None:
+            self._collection.inline_gc = self._previous_inline_gc
+            self._previous_inline_gc = None
+
+    def _account(self, reclaimed: int) -> int:
+        self._sweeps += 1
+        self._reclaimed += reclaimed
+        return reclaimed
+
+    def stats(self) -> dict:
+        return {
+            "sweeps": self._sweeps,
+            "reclaimed": self._reclaimed,
+            "interval": self._interval,
+        }
+
+
+class GCScheduler(BaseGCScheduler):
+    """Runs the sweeps on a daemon thread."""
+
+    def __init__(
+        self,
+        collection: IdentityMapsCollection,
+        interval: float = 1.0,
+        pressure_interval: float | None = None,
+        pressure: Callable[[], bool] | None = None,
+        name: str = "identity-maps-gc",
+    ):
+        super().__init__(collection, interval, pressure_interval, pressure)
+        self._name: str = name
+        self._thread: threading.Thread | None = None
+        self._stop_event: threading.Event = threading.Event()
+        self._sweep_lock: threading.Lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._detach_inline_gc()
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self._restore_inline_gc()
+
+    def sweep(self) -> int:
+        """Run one budgeted GC pass over every map."""
+        with self._sweep_lock:
+            return self._account(self._collection.run_gc())
+
+    def flush(self) -> int:
+        """Sweep on the caller's thread until there is nothing left to reclaim."""
+        reclaimed = 0
+        while count := self.sweep():
+            reclaimed += count
+        return reclaimed
+
+    def _run(self) -> None:
+        next_sweep = time.monotonic() + self._interval
+        while not self._stop_event.wait(min(self._pressure_interval, self._interval)):
+            # A failing hook, L2 or pressure check must not end the thread: the maps rely on it for their GC.
+            try:
+                if time.monotonic() >= next_sweep or self.under_pressure():
+                    next_sweep = time.monotonic() + self._interval
+                    self.sweep()
+            except Exception:
+                _logger.exception("GC sweep failed")
+
+    def __enter__(self) -> "GCScheduler":
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+class AsyncGCScheduler(BaseGCScheduler):
+    """Runs the sweeps as a task of the running asyncio loop, yielding to it between maps."""
+
+    def __init__(
+        self,
+        collection: IdentityMapsCollection,
+        interval: float = 1.0,
+        pressure_interval: float | None = None,
+        pressure: Callable[[], bool] | None = None,
+    ):
+        super().__init__(collection, interval, pressure_interval, pressure)
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._detach_inline_gc()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._restore_inline_gc()
+
+    async def sweep(self) -> int:
+        # IdentityMapsCollection.run_gc() without blocking the loop for all the maps at once.
+        self._collection.rebalance_if_due()
+        reclaimed = 0
+        for one_map in self._collection.maps():
+            reclaimed += one_map.gc_run()
+            await asyncio.sleep(0)
+        return self._account(reclaimed)
+
+    async def flush(self) -> int:
+        reclaimed = 0
+        while count := await self.sweep():
+            reclaimed += count
+        return reclaimed
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_sweep = loop.time() + self._interval
+        while True:
+            await asyncio.sleep(min(self._pressure_interval, self._interval))
+            try:
+                if loop.time() >= next_sweep or self.under_pressure():
+                    next_sweep = loop.time() + self._interval
+                    await self.sweep()
+            except Exception:
+                _logger.exception("GC sweep failed")
+
+    async def __aenter__(self) -> "AsyncGCScheduler":
+        self.start()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.stop()
@@ -1,40 +1,59 @@
+from .metrics import Counter
+
+
 class HitsMisses:
+    """Hit and miss counters; thread-safe, every thread counts into its own accumulator."""
+
     def __init__(self):
-        self._hits = 0
-        self._misses = 0
+        self._hits: Counter = Counter()
+        self._misses: Counter = Counter()
+        self._negative_hits: Counter = Counter()
 
     @property
     def hits(self) -> int:
-        return self._hits
+        return self._hits.value
 
     @property
     def misses(self) -> int:
-        return self._misses
+        return self._misses.value
+
+    @property
+    def negative_hits(self) -> int:
+        """Lookups answered by a cached "known absent" entry; counted neither as hits nor as misses."""
+        return self._negative_hits.value
 
     def hit(self) -> None:
-        self._hits += 1
+        self._hits.inc()
 
     def miss(self) -> None:
-        self._misses += 1
+        self._misses.inc()
+
+    def negative_hit(self) -> None:
+        self._negative_hits.inc()
 
     def get_hit_rate(self) -> float:
-        if self._hits == 0:
+        hits = self.hits
+        if hits == 0:
             return 0
-        return self._hits / (self._hits + self._misses)
+        return hits / (hits + self.misses)
 
     def get_miss_rate(self) -> float:
-        if self._misses == 0:
+        misses = self.misses
+        if misses == 0:
             return 0
-        return self._misses / (self._hits + self._misses)
+        return misses / (self.hits + misses)
 
     def clear_hit_miss_rate(self) -> None:
-        self._hits = 0
-        self._misses = 0
+        self._hits.reset()
+        self._misses.reset()
+        self._negative_hits.reset()
 
     def metrics(self) -> dict:
+        hits, misses = self.hits, self.misses
         return {
-            "hits": self._hits,
-            "misses": self._misses,
-            "hit_rate": self.get_hit_rate(),
-            "miss_rate": self.get_miss_rate(),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits else 0,
+            "miss_rate": misses / (hits + misses) if misses else 0,
+            "negative_hits": self.negative_hits,
         }
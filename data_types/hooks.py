@@ -0,0 +1,131 @@
+import heapq
+import random
+import threading
+import time
+from typing import Any, Callable
+
+# Event -> handler signature:
+#   on_hit(key), on_miss(key)
+#   on_load(key, seconds, error) - key is the list of keys for bulk loads, error the exception raised or None
+#   on_evict(key, reason) - reason is "capacity", "bytes" or "gc"
+#   on_expire(key)
+#   on_gc(seconds, reclaimed)
+EVENTS = ("on_hit", "on_miss", "on_load", "on_evict", "on_expire", "on_gc")
+
+
+class Hooks:
+    """
+    Handlers registered per event. A map keeps no Hooks at all until the first handler is added, so
+    instrumentation costs nothing while unused. Handlers run synchronously: on_load in the loading thread (on the
+    event loop for AsyncIdentityMap) right after the loader returns, outside the map's lock, as loaders run; the
+    other events under the map's lock, so their handlers must not call back into the map from another thread.
+    """
+
+    def __init__(self):
+        self._handlers: dict[str, tuple[Callable[..., Any], ...]] = {event: () for event in EVENTS}
+
+    @staticmethod
+    def _check(event: str) -> None:
+        if event not in EVENTS:
+            raise ValueError(f"Unknown hook event {event!r}, expected one of {', '.join(EVENTS)}")
+
+    def add(self, event: str, handler: Callable[..., Any]) -> None:
+        self._check(event)
+        self._handlers[event] += (handler,)
+
+    def remove(self, event: str, handler: Callable[..., Any]) -> None:
+        self._check(event)
+        self._handlers[event] = tuple(one for one in self._handlers[event] if one != handler)
+
+    def add_listener(self, listener: Any) -> None:
+        """Register every on_* method of listener."""
+        for event in EVENTS:
+            if callable(handler := getattr(listener, event, None)):
+                self.add(event, handler)
+
+    def remove_listener(self, listener: Any) -> None:
+        for event in EVENTS:
+            if callable(handler := getattr(listener, event, None)):
+                self.remove(event, handler)
+
+    def has(self, *events: str) -> bool:
+        return any(self._handlers[event] for event in events)
+
+    def __bool__(self) -> bool:
+        return any(self._handlers.values())
+
+    def fire(self, event: str, *args: Any) -> None:
+        for handler in self._handlers[event]:
+            handler(*args)
+
+
+def change_hooks(hooks: Hooks | None, change: Callable[[Hooks], None]) -> Hooks | None:
+    """Apply change to a copy of hooks (None meaning no handlers) and return the result, None when empty."""
+    changed = Hooks()
+    if hooks is not None:
+        changed._handlers.update(hooks._handlers)
+    change(changed)
+    return changed if changed else None
+
+
+class SamplingProfiler:
+    """
+    Hook listener keeping the slowest sampled loads and GC passes. sample_rate is the share of events
+    looked at, so the profiler can stay attached in production at a fraction of its cost.
+
+        profiler = SamplingProfiler(top=10, sample_rate=0.1)
+        identity_map.add_listener(profiler)
+        ...
+        profiler.report()
+    """
+
+    def __init__(self, top: int = 10, sample_rate: float = 1.0):
+        if not 0 < sample_rate <= 1:
+            raise ValueError(f"sample_rate must be in (0, 1], not {sample_rate}")
+        self._top: int = top
+        self._sample_rate: float = sample_rate
+        self._lock: threading.Lock = threading.Lock()
+        # Min-heaps of (seconds, sequence, details); the root is the fastest of the slowest, replaced first.
+        self._loads: list[tuple[float, int, dict[str, Any]]] = []
+        self._gc: list[tuple[float, int, dict[str, Any]]] = []
+        self._sequence: int = 0
+        self._sampled: int = 0
+
+    def _sample(self) -> bool:
+        return self._sample_rate >= 1 or random.random() < self._sample_rate
+
+    def _record(self, heap: list, seconds: float, details: dict[str, Any]) -> None:
+        with self._lock:
+            self._sampled += 1
+            self._sequence += 1
+            item = (seconds, self._sequence, details)
+            if len(heap) < self._top:
+                heapq.heappush(heap, item)
+            elif seconds > heap[0][0]:
+                heapq.heapreplace(heap, item)
+
+    def on_load(self, key: Any, seconds: float, error: BaseException | None) -> None:
+        if self._sample():
+            details = {"key": key, "seconds": seconds, "error": repr(error) if error else None, "at": time.time()}
+            self._record(self._loads, seconds, details)
+
+    def on_gc(self, seconds: float, reclaimed: int) -> None:
+        if self._sample():
+            self._record(self._gc, seconds, {"seconds": seconds, "reclaimed": reclaimed, "at": time.time()})
+
+    def slowest_loads(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return [details for _, _, details in sorted(self._loads, reverse=True)]
+
+    def slowest_gc(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return [details for _, _, details in sorted(self._gc, reverse=True)]
+
+    def report(self) -> dict[str, Any]:
+        return {"sampled": self._sampled, "loads": self.slowest_loads(), "gc": self.slowest_gc()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._loads.clear()
+            self._gc.clear()
+            self._sampled = 0
@@ -1,33 +1,106 @@
+import time
+import weakref
+from collections import OrderedDict
 from typing import Iterator, Any, Callable
 
 
 class IdentityMap:
-    def __init__(self):
-        self._items = {}
+    """
+    With negative_ttl set, get_or_fetch() remembers keys its loader returned None for as "known absent" for
+    negative_ttl seconds, so looking them up again does not call the loader. At most max_negative_items
+    such keys are kept, the oldest are forgotten first.
+
+    With weak_values set, the map only holds weak references: an item leaves it once nothing else references
+    it, except for the keep_alive most recently used items, which the map keeps alive itself. Items must
+    support weak references (a class with __slots__ needs a "__weakref__" slot).
+    """
+
+    NEGATIVE_MAX_ITEMS = 10_000
+
+    def __init__(
+        self,
+        negative_ttl: float | None = None,
+        max_negative_items: int | None = None,
+        weak_values: bool = False,
+        keep_alive: int | None = None,
+    ):
+        self._items = weakref.WeakValueDictionary() if weak_values else {}
+        self._negative_ttl: float | None = negative_ttl
+        self._max_negative_items: int = max_negative_items or self.NEGATIVE_MAX_ITEMS
+        self._absent: OrderedDict[str | int, float] = OrderedDict()
+        # Strong references to the most recently used items of a weak map.
+        self._keep_alive: OrderedDict[str | int, Any] | None = OrderedDict() if weak_values and keep_alive else None
+        self._keep_alive_items: int = keep_alive or 0
+
+    @property
+    def weak_values(self) -> bool:
+        return isinstance(self._items, weakref.WeakValueDictionary)
 
     def has(self, key: str | int) -> bool:
         return key in self._items
 
     def get(self, key: str | int) -> Any | None:
-        return self._items.get(key)
+        data = self._items.get(key)
+        if self._keep_alive is not None and data is not None:
+            self._keep(key, data)
+        return data
+
+    def _keep(self, key: str | int, data: Any) -> None:
+        self._keep_alive[key] = data
+        self._keep_alive.move_to_end(key)
+        if len(self._keep_alive) > self._keep_alive_items:
+            self._keep_alive.popitem(last=False)
 
     def get_or_fetch(self, key: str | int, loader: Callable[[], Any]) -> Any:
         data = self.get(key)
-        if data is not None:
+        if data is not None or self.is_absent(key):
             return data
 
         data = loader()
-        self.add(key, data)
+        if data is None:
+            self.add_absent(key)
+        else:
+            self.add(key, data)
         return data
 
+    def is_absent(self, key: str | int) -> bool:
+        """Whether key is cached as known absent."""
+        deadline = self._absent.get(key)
+        if deadline is None:
+            return False
+        if deadline <= time.monotonic():
+            del self._absent[key]
+            return False
+        return True
+
+    def add_absent(self, key: str | int) -> None:
+        """Cache key as known absent for negative_ttl seconds; does nothing without negative_ttl."""
+        if self._negative_ttl is None:
+            return
+        self._items.pop(key, None)
+        self._absent[key] = time.monotonic() + self._negative_ttl
+        self._absent.move_to_end(key)
+        while len(self._absent) > self._max_negative_items:
+            self._absent.popitem(last=False)
+
     def add(self, key: str | int, data: Any) -> None:
         self._items[key] = data
+        if self._keep_alive is not None:
+            self._keep(key, data)
+        if self._absent:
+            self._absent.pop(key, None)
 
     def update(self, key: str | int, data: Any) -> None:
         if key in self._items:
             self._items[key] = data
+            if self._keep_alive is not None:
+                self._keep(key, data)
 
     def remove(self, key: str | int) -> bool:
+        if self._absent:
+            self._absent.pop(key, None)
+        if self._keep_alive is not None:
+            self._keep_alive.pop(key, None)
         if key in self._items:
             del self._items[key]
             return True
@@ -35,6 +108,9 @@ class IdentityMap:
 
     def clear(self) -> None:
         self._items.clear()
+        self._absent.clear()
+        if self._keep_alive is not None:
+            self._keep_alive.clear()
 
     def keys(self):
         return self._items.keys()
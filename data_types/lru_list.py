@@ -1,35 +1,41 @@
-from collections import deque
+from collections import OrderedDict
+from itertools import islice
 from typing import Iterator, List, Any
 
 
 class LRUList:
     def __init__(self):
-        self._lru = deque()
+        # OrderedDict keeps a hash index over a doubly linked list, so every
+        # operation below is O(1) (or O(count) for the bulk ones).
+        self._lru: OrderedDict[Any, None] = OrderedDict()
 
     def has(self, key: str | int) -> bool:
         return key in self._lru
 
     def add(self, key: str | int) -> bool:
-        if self.has(key):
+        if key in self._lru:
             return False
-        self._lru.append(key)
+        self._lru[key] = None
         return True
 
     def remove(self, key: str | int) -> bool:
         try:
-            self._lru.remove(key)
+            del self._lru[key]
             return True
-        except ValueError:
+        except KeyError:
             return False
 
     def update(self, key) -> bool:
-        if not self.has(key):
+        try:
+            self._lru.move_to_end(key)
+            return True
+        except KeyError:
             return False
-        self.remove(key)
-        return self.add(key)
 
     def upsert(self, key) -> bool:
-        return self.update(key) or self.add(key)
+        self._lru[key] = None
+        self._lru.move_to_end(key)
+        return True
 
     def get_last(self, count: int) -> List[Any]:
         """
@@ -38,7 +44,11 @@ class LRUList:
         The elements are returned in the order in which they were added or accessed,
         with the most recent key at the end of the returned list.
         """
-        return list(self._lru)[-count:]
+        if count <= 0:
+            return []
+        keys = list(islice(reversed(self._lru), count))
+        keys.reverse()
+        return keys
 
     def get_first(self, count: int) -> List[Any]:
         """
@@ -47,12 +57,28 @@ class LRUList:
         The elements are returned in the order in which they were added or accessed,
         with the least recent key at the beginning of the returned list.
         """
-        return list(self._lru)[:count]
+        if count <= 0:
+            return []
+        return list(islice(self._lru, count))
+
+    def pop_first(self, count: int = 1) -> List[Any]:
+        """
+        Remove and return up to count least recently used elements, the least recent key first.
+        Each popped key costs O(1), regardless of the size of the LRUList.
+        """
+        keys = []
+        popitem = self._lru.popitem
+        for _ in range(min(count, len(self._lru))):
+            keys.append(popitem(last=False)[0])
+        return keys
 
     def __len__(self) -> int:
         """Return the count of objects in the LRUList."""
         return len(self._lru)
 
+    def __contains__(self, key: str | int) -> bool:
+        return key in self._lru
+
     def data(self) -> List[str]:
         return list(self._lru)
 
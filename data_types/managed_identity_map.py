@@ -1,23 +1,90 @@
-from typing import Any, Callable, Iterator, List, TypedDict, Unpack
+import heapq
+import math
+import threading
+import time
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from itertools import chain
+from collections import OrderedDict, defaultdict, deque
+from typing import Any, Callable, Iterable, Iterator, List, Mapping, TypedDict, Unpack
 
-from .import HitsMisses, IdentityMap, LRUList, TagsManager, TTLManager, GCType, GCOperator
+from .import (
+    TagsManager,
+    TTLManager,
+    GCType,
+    GCBudget,
+    GCOperator,
+    SingleFlight,
+    FrequencySketch,
+    Entry,
+    EntryList,
+)
+from .sizers import Sizer, deep_sizeof
+from .metrics import CacheMetrics, map_label, merge_snapshots, to_prometheus
+from .hooks import Hooks, change_hooks
+from .snapshot import Record, SnapshotRestore, save_snapshot
+from .disk_tier import DiskTier
+from .collection_budget import CollectionBudget
+
+# Returned by lookups internally for keys cached as known absent.
+_ABSENT = object()
+
+_refresh_executor: ThreadPoolExecutor | None = None
+_refresh_executor_lock = threading.Lock()
+
+
+def _shared_refresh_executor() -> ThreadPoolExecutor:
+    """Thread pool running the background refreshes of maps not given an executor of their own."""
+    global _refresh_executor
+    if _refresh_executor is None:
+        with _refresh_executor_lock:
+            if _refresh_executor is None:
+                _refresh_executor = ThreadPoolExecutor(
+                    ManagedIdentityMap.REFRESH_WORKERS, thread_name_prefix="identity-map-refresh"
+                )
+    return _refresh_executor
 
 
 class IdentityMapAddParams(TypedDict):
-    ttl: int | None
+    ttl: int | float | None
     tags: List[str] | tuple[str] | None
 
 
 class IdentityMapInfo:
+    """
+    What a map tells an item declaring an identity_map_info attribute about its entry. Slotted, with stats
+    created on first use, as every write to a map stores one on its item.
+    """
+
+    __slots__ = ("is_deleted", "_is_expired", "_stats")
+
     def __init__(
         self,
         is_expired: Callable[[], bool] | None | bool = None,
         is_deleted: bool = False,
         stats: dict[str, Any] | None = None,
     ):
-        self.id_deleted: bool = is_deleted
+        self.is_deleted: bool = is_deleted
         self._is_expired: Callable[[], bool] | None | bool = is_expired
-        self.stats: dict[str, Any] | None = stats
+        self._stats: dict[str, Any] | None = stats
+
+    @property
+    def id_deleted(self) -> bool:
+        return self.is_deleted
+
+    @id_deleted.setter
+    def id_deleted(self, value: bool) -> None:
+        self.is_deleted = value
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        if self._stats is None:
+            self._stats = {}
+        return self._stats
+
+    @stats.setter
+    def stats(self, value: dict[str, Any] | None) -> None:
+        self._stats = value
 
     @property
     def is_expired(self) -> bool:
@@ -33,37 +100,185 @@ class IdentityMapInfo:
 
 
 class ManagedIdentityMap:
+    """
+    Each key is one slotted Entry record in a single dict: value, TTL deadline, tags, size and LRU links live
+    together, so get() costs one dict lookup. The TTL wheel and the tag reverse index only hold the keys that
+    have a TTL or tags; the wheel keeps no key index, a removed entry is unscheduled by its deadline.
+
+    With weak_values, entries hold weak references to their items and go once nothing else references an
+    item, except for the keep_alive most recently used items, which the map keeps alive itself. Entries of
+    collected items are dropped by the next lookup or GC run; items must support weak references.
+    """
+
+    # LFRU picks its victims among this many times more LRU candidates than it has to evict.
+    LFRU_CANDIDATES_FACTOR = 4
+    # The TTL pass streams expired keys out of the TTL index in batches of this size.
+    TTL_BATCH_SIZE = 64
+    # Share of max_items kept in the LFRU admission window.
+    LFRU_WINDOW_RATIO = 0.01
+    # Frequency sketch width when LFRU runs without max_items.
+    LFRU_SKETCH_CAPACITY = 1024
+    # How many of the largest entries stats() lists when sizes are tracked.
+    STATS_LARGEST = 5
+    # Known absent keys kept by default when negative caching is on.
+    NEGATIVE_MAX_ITEMS = 10_000
+    # Threads of the shared pool running background refreshes.
+    REFRESH_WORKERS = 4
+
     def __init__(
         self,
         internal_type: str | None = None,
         gc_types: int | tuple[GCType] | None = None,
         gc_possibility: float | None = None,
+        max_items: int | None = None,
+        gc_target_items: int | None = None,
+        gc_max_entries: int | None = None,
+        gc_max_time_us: int | None = None,
+        inline_gc: bool = True,
+        max_bytes: int | None = None,
+        sizer: Sizer | None = None,
+        negative_ttl: float | None = None,
+        max_negative_items: int | None = None,
+        refresh_ahead: float | None = None,
+        stale_ttl: float | None = None,
+        refresh_executor: Executor | None = None,
+        l2: DiskTier | None = None,
+        weak_values: bool = False,
+        keep_alive: int | None = None,
     ):
+        if max_items is not None and max_items < 1:
+            raise ValueError(f"max_items must be a positive integer, not {max_items}")
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError(f"max_bytes must be a positive integer, not {max_bytes}")
+        if refresh_ahead is not None and not 0 < refresh_ahead <= 1:
+            raise ValueError(f"refresh_ahead must be a fraction of the TTL in (0, 1], not {refresh_ahead}")
+        if stale_ttl is not None and stale_ttl < 0:
+            raise ValueError(f"stale_ttl must not be negative, not {stale_ttl}")
+        if keep_alive is not None and keep_alive < 0:
+            raise ValueError(f"keep_alive must not be negative, not {keep_alive}")
+
         self._internal_type: str = internal_type
         self._gc_types: int | None = gc_types
+        self._max_items: int | None = max_items
+        self._gc_target_items: int | None = gc_target_items
+        self._inline_gc: bool = inline_gc
+        self._lock: threading.RLock = threading.RLock()
+        self._single_flight: SingleFlight = SingleFlight()
 
-        self._identity_map_: IdentityMap = IdentityMap()
-        self._hits_misses_counter_: HitsMisses = HitsMisses()
-        self._lru_list_: LRUList = LRUList()
+        self._entries: dict[str | int, Entry] = {}
+        self._lru: EntryList = EntryList()
+        self._metrics: CacheMetrics = CacheMetrics()
+        self._metrics.gauge("entries", self.__len__)
         self._tags_manager_: TagsManager | None = None
+        self._last_tags: tuple[str, ...] = ()
         self._ttl_manager_: TTLManager = None
-        self._gc_operator_: GCOperator = GCOperator(gc_types, gc_possibility, self.gc_run())
+        self._gc_operator_: GCOperator = GCOperator(
+            gc_types, gc_possibility, self.gc_run, max_entries=gc_max_entries, max_time_us=gc_max_time_us
+        )
+        # Entry sizes are measured once, on insert, whenever a byte budget or a sizer is given.
+        self._max_bytes: int | None = max_bytes
+        self._sizer: Sizer | None = sizer or (deep_sizeof if max_bytes is not None else None)
+        self._bytes: int = 0
+        self._peak_bytes: int = 0
+        self._sketch: FrequencySketch | None = None
+        self._window: EntryList | None = None
+        # The entries of the window, a few percent of them, rather than a flag taking room in every entry.
+        self._in_window: set[Entry] = set()
+        self._window_size: int = 0
+        if self._gc_operator_.in_gc(GCType.LFRU):
+            self._sketch = FrequencySketch(max_items or self.LFRU_SKETCH_CAPACITY)
+            if max_items is not None:
+                # W-TinyLFU: new keys enter a small LRU window; leaving it they must out-score the
+                # main region's LRU victim in the frequency sketch to be admitted.
+                self._window = EntryList()
+                self._window_size = max(1, int(max_items * self.LFRU_WINDOW_RATIO))
+        # Negative caching: keys the loader found nothing for, with their deadline, oldest first. They live
+        # apart from the entries, under their own TTL and limit, and are answered without calling the loader.
+        self._absent: OrderedDict[str | int, int] | None = None
+        self._negative_ttl: float | None = negative_ttl
+        self._max_negative_items: int = max_negative_items or self.NEGATIVE_MAX_ITEMS
+        if negative_ttl is not None:
+            self._absent = OrderedDict()
+        # get_or_fetch() reloads an entry in the background once refresh_ahead of its TTL has passed, and
+        # serves it stale for stale_ttl seconds after it expired while the reload runs.
+        self._refresh_ahead: float | None = refresh_ahead
+        self._refresh_at: dict[str | int, int] | None = {} if refresh_ahead is not None else None
+        self._stale_ms: int = math.ceil(stale_ttl * 1000) if stale_ttl else 0
+        self._refresh_executor: Executor | None = refresh_executor
+        self._refreshing: set[str | int] = set()
+        if self._sizer is not None:
+            self._metrics.gauge("bytes", lambda: self._bytes)
+        # None until a hook is registered: unhooked maps only pay an "is not None" test off the lookup path.
+        self._hooks: Hooks | None = None
+        # While a snapshot is restored: the keys removed meanwhile, which it must not bring back, and the tag
+        # epoch its entries are stamped with, so that invalidations made meanwhile apply to them.
+        self._restoring: set[str | int] | None = None
+        self._restore_epoch: int = 0
+        # Evicted entries are demoted to the L2 and missed keys looked up there before calling the loader.
+        self._l2: DiskTier | None = l2
+        # Keys being moved back from the L2 -> whether they were written or removed meanwhile.
+        self._promoting: dict[str | int, bool] = {}
+        # Weak mode: entry values are weakref.KeyedRef; the collector queues the dead ones in _dead from any
+        # thread, and the map drops their entries under its lock. keep_alive holds the most recently used items.
+        self._weak_values: bool = weak_values
+        self._dead: deque[weakref.KeyedRef] = deque()
+        self._keep_alive: OrderedDict[str | int, Any] | None = OrderedDict() if weak_values and keep_alive else None
+        self._keep_alive_items: int = keep_alive or 0
+        if weak_values:
+            self._get = self._weak_get
 
     @property
     def internal_type(self) -> str:
         return self._internal_type
 
     @property
-    def _identity_map(self) -> IdentityMap:
-        return self._identity_map_
+    def max_items(self) -> int | None:
+        return self._max_items
+
+    @property
+    def max_bytes(self) -> int | None:
+        return self._max_bytes
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    @property
+    def peak_bytes(self) -> int:
+        return self._peak_bytes
+
+    @property
+    def evictions(self) -> int:
+        return self._metrics.eviction_count
+
+    @property
+    def expirations(self) -> int:
+        return self._metrics.expirations.value
+
+    @property
+    def invalidations(self) -> int:
+        return self._metrics.invalidations.value
+
+    @property
+    def l2(self) -> DiskTier | None:
+        return self._l2
+
+    @property
+    def weak_values(self) -> bool:
+        return self._weak_values
 
     @property
-    def _hits_misses_counter(self) -> HitsMisses:
-        return self._hits_misses_counter_
+    def gc_target_items(self) -> int | None:
+        return self._gc_target_items if self._gc_target_items is not None else self._max_items
 
     @property
-    def _lru_list(self) -> LRUList:
-        return self._lru_list_
+    def inline_gc(self) -> bool:
+        """Whether add() rolls the GC on the caller's thread; a GC scheduler switches it off."""
+        return self._inline_gc
+
+    @inline_gc.setter
+    def inline_gc(self, value: bool) -> None:
+        self._inline_gc = value
 
     @property
     def _tags_manager(self) -> TagsManager:
@@ -74,7 +289,8 @@ class ManagedIdentityMap:
     @property
     def _ttl_manager(self) -> TTLManager:
         if self._ttl_manager_ is None:
-            self._ttl_manager_ = TTLManager()
+            # Deadlines live on the entries, the wheel only schedules them.
+            self._ttl_manager_ = TTLManager(index_keys=False)
         return self._ttl_manager_
 
     @property
@@ -93,133 +309,1481 @@ class ManagedIdentityMap:
         return True
 
     def has(self, key: str | int) -> bool:
-        return self._identity_map.has(key)
+        return key in self._entries
 
     def get(self, key: str | int) -> Any | None:
-        item = self._identity_map.get(key)
-        if item is not None:
-            self._hits_misses_counter.hit()
-            self._lru_list.upsert(key)
-            return item
-        self._hits_misses_counter.miss()
+        with self._lock:
+            item = self._get(key)
+        return None if item is _ABSENT else item
+
+    def get_many(self, keys: Iterable[str | int]) -> dict[str | int, Any]:
+        """Return the cached items among keys, updating all indexes under a single lock acquisition."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                item = self._get(key)
+                if item is not None and item is not _ABSENT:
+                    found[key] = item
+        return found
+
+    def _get(self, key: str | int) -> Any | None:
+        if self._sketch is not None:
+            self._sketch.increment(key)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.deadline is not None and entry.deadline <= self._ttl_manager_.now():
+                # Within the stale window the entry is kept for get_or_fetch() to serve while it reloads.
+                if not self._stale_ms or entry.deadline + self._stale_ms <= self._ttl_manager_.now():
+                    self._expire(entry)
+            elif entry.tags is not None and self._tags_manager_.is_stale_since(entry.tags, entry.epoch):
+                self._remove_entry(entry)
+                self._metrics.invalidated.inc()
+            else:
+                self._metrics.hits.inc()
+                self._touch(entry)
+                return entry.value
+        if self._absent and self._is_absent(key):
+            self._metrics.negative_hits.inc()
+            return _ABSENT
+        self._metrics.misses.inc()
         return None
 
-    def _mark_item(self, key: str | int, is_deleted: bool = False) -> bool:
-        data = self._identity_map.get(key)
-        if data is None:
+    def _weak_get(self, key: str | int) -> Any | None:
+        # Stands in for _get() in weak mode: dereferences the entry's item, an entry whose item died is a miss.
+        if self._dead:
+            self._reap()
+        ref = type(self)._get(self, key)
+        if ref is None or ref is _ABSENT:
+            return ref
+        item = ref()
+        if item is None:
+            # Collected since the reap above.
+            self._reap()
+            self._metrics.hits.inc(-1)
+            self._metrics.misses.inc()
+            return None
+        if self._keep_alive is not None:
+            self._keep(key, item)
+        return item
+
+    def _keep(self, key: str | int, item: Any) -> None:
+        self._keep_alive[key] = item
+        self._keep_alive.move_to_end(key)
+        if len(self._keep_alive) > self._keep_alive_items:
+            self._keep_alive.popitem(last=False)
+
+    def _item(self, entry: Entry) -> Any | None:
+        """The entry's item, None when a weak entry's item was collected."""
+        return entry.value() if self._weak_values else entry.value
+
+    def _reap(self) -> int:
+        """Drop the entries whose item was collected and return how many."""
+        reaped = 0
+        while self._dead:
+            ref = self._dead.popleft()
+            entry = self._entries.get(ref.key)
+            # The key may have been written again since.
+            if entry is not None and entry.value is ref:
+                self._drop(entry)
+                reaped += 1
+        self._metrics.collected.inc(reaped)
+        return reaped
+
+    def _hooked_get(self, key: str | int) -> Any | None:
+        # Stands in for _get() while on_hit or on_miss handlers are registered; negative hits fire neither.
+        item = self._weak_get(key) if self._weak_values else type(self)._get(self, key)
+        if item is None:
+            self._hooks.fire("on_miss", key)
+        elif item is not _ABSENT:
+            self._hooks.fire("on_hit", key)
+        return item
+
+    def add_hook(self, event: str, handler: Callable[..., Any]) -> None:
+        """
+        Call handler on event, one of hooks.EVENTS. Handlers run synchronously under the map's lock, so they
+        should be quick and must not wait for other threads using the map.
+        """
+        self._change_hooks(lambda hooks: hooks.add(event, handler))
+
+    def remove_hook(self, event: str, handler: Callable[..., Any]) -> None:
+        self._change_hooks(lambda hooks: hooks.remove(event, handler))
+
+    def add_listener(self, listener: Any) -> None:
+        """Register every on_* method of listener, e.g. a SamplingProfiler."""
+        self._change_hooks(lambda hooks: hooks.add_listener(listener))
+
+    def remove_listener(self, listener: Any) -> None:
+        self._change_hooks(lambda hooks: hooks.remove_listener(listener))
+
+    def _change_hooks(self, change: Callable[[Hooks], None]) -> None:
+        with self._lock:
+            # Copy on write: handlers being fired on other threads keep the set they started with.
+            self._hooks = change_hooks(self._hooks, change)
+            # Lookups are only rerouted through _hooked_get() while someone listens to them.
+            if self._hooks is not None and self._hooks.has("on_hit", "on_miss"):
+                self._get = self._hooked_get
+            elif self._weak_values:
+                self._get = self._weak_get
+            else:
+                self.__dict__.pop("_get", None)
+
+    def lookup(self, key: str | int) -> tuple[Any | None, bool]:
+        """
+        get() for loaders: return (item, refresh), where item may also be an expired item still within the
+        stale window and refresh tells whether the item is stale or due for a refresh-ahead reload.
+        """
+        with self._lock:
+            item, refresh = self._lookup(key)
+        return (None if item is _ABSENT else item), refresh
+
+    def _lookup(self, key: str | int) -> tuple[Any | None, bool]:
+        item = self._get(key)
+        if item is None:
+            entry = self._entries.get(key)
+            if entry is not None and (item := self._item(entry)) is not None:
+                # Only an expired entry in its stale window outlives a miss.
+                self._metrics.stale_hits.inc()
+                return item, True
+            return None, False
+        if item is _ABSENT or not self._refresh_at:
+            return item, False
+        refresh_at = self._refresh_at.get(key)
+        return item, refresh_at is not None and refresh_at <= self._ttl_manager_.now()
+
+    def is_absent(self, key: str | int) -> bool:
+        """Whether key is cached as known absent."""
+        with self._lock:
+            return self._absent is not None and self._is_absent(key)
+
+    def _is_absent(self, key: str | int) -> bool:
+        deadline = self._absent.get(key)
+        if deadline is None:
+            return False
+        if deadline <= self._ttl_manager.now():
+            del self._absent[key]
+            return False
+        return True
+
+    def add_absent(self, key: str | int) -> None:
+        """Cache key as known absent, replacing its entry; does nothing unless negative_ttl is set."""
+        with self._lock:
+            self._add_absent(key)
+
+    def add_absent_many(self, keys: Iterable[str | int]) -> None:
+        with self._lock:
+            for key in keys:
+                self._add_absent(key)
+
+    def _add_absent(self, key: str | int) -> None:
+        if self._absent is None:
+            return
+        self._remove(key)
+        self._absent[key] = self._ttl_manager.now() + math.ceil(self._negative_ttl * 1000)
+        self._absent.move_to_end(key)
+        while len(self._absent) > self._max_negative_items:
+            self._absent.popitem(last=False)
+
+    def _is_live(self, entry: Entry) -> bool:
+        if entry.deadline is not None and entry.deadline <= self._ttl_manager_.now():
             return False
+        return entry.tags is None or not self._tags_manager_.is_stale_since(entry.tags, entry.epoch)
+
+    def _mark_item(self, entry: Entry, is_deleted: bool = False) -> bool:
         try:
-            if data.identity_map_info is None:
-                data.identity_map_info = {}
-            data.identity_map_info = IdentityMapInfo(
-                is_expired=self._ttl_manager.is_expired(key), is_deleted=is_deleted, stats={}
-            )
+            item = self._item(entry)
+            info = item.identity_map_info
+            is_expired = entry.deadline is not None and entry.deadline <= self._ttl_manager_.now()
+            if type(info) is IdentityMapInfo:
+                # A rewritten item: reset its info rather than allocate another one.
+                info.is_deleted, info._is_expired, info._stats = is_deleted, is_expired, None
+            else:
+                item.identity_map_info = IdentityMapInfo(is_expired=is_expired, is_deleted=is_deleted)
             return True
         except AttributeError:
             return False
 
-    def _mark_item_deleted(self, key: str | int) -> bool:
-        data = self._identity_map.get(key)
-        if data is None:
-            return False
+    def _mark_item_deleted(self, entry: Entry) -> bool:
         try:
-            if data.identity_map_info is None:
-                if not self._mark_item(key, is_deleted=True):
+            item = self._item(entry)
+            if item.identity_map_info is None:
+                if not self._mark_item(entry, is_deleted=True):
                     return False
-            data.identity_map_info.is_deleted = True
+            item.identity_map_info.is_deleted = True
             return True
         except AttributeError:
             return False
 
     def add(self, key: str | int, data: Any, **kwargs: Unpack[IdentityMapAddParams]) -> None:
         self._validate_item_or_raise(data)
-        self._identity_map.add(key, data)
-        self._mark_item(key, data)
-        self._lru_list.upsert(key)
+        size = self._size_of(data)
+        with self._lock:
+            self._add(key, data, kwargs, size)
+            self._evict_overflow()
+            self._reclaim_invalidated(1)
+            if self._inline_gc:
+                self._gc_operator.run()
+
+    def add_many(self, items: Mapping[str | int, Any], **kwargs: Unpack[IdentityMapAddParams]) -> None:
+        """Add all items with the same ttl/tags; eviction and GC run once for the whole batch."""
+        for data in items.values():
+            self._validate_item_or_raise(data)
+        sizes = {key: self._size_of(data) for key, data in items.items()}
+        with self._lock:
+            for key, data in items.items():
+                self._add(key, data, kwargs, sizes[key])
+            self._evict_overflow()
+            self._reclaim_invalidated(len(items))
+            if self._inline_gc:
+                self._gc_operator.run()
+
+    def _reclaim_invalidated(self, writes: int) -> None:
+        # The keys of invalidated tags wait for the GC, which may never run (no gc_types, no scheduler): every
+        # write reclaims a batch of them, so they cannot outgrow the entries written meanwhile.
+        if self._tags_manager_ is not None and self._tags_manager_.has_invalidated():
+            self._gc_invalidated(GCBudget(self.TTL_BATCH_SIZE * writes))
+
+    def _size_of(self, data: Any) -> int:
+        # Measured outside the lock: a deep sizer may walk a large object graph.
+        return self._sizer(data) if self._sizer is not None else 0
+
+    def _touch(self, entry: Entry) -> None:
+        if self._in_window and entry in self._in_window:
+            self._window.move_to_end(entry)
+        else:
+            self._lru.move_to_end(entry)
+
+    def _add(self, key: str | int, data: Any, kwargs: IdentityMapAddParams, size: int = 0) -> None:
+        if self._max_bytes is not None and size > self._max_bytes:
+            # It could only be stored by evicting everything else, and then itself.
+            self._remove(key)
+            self._metrics.rejections.inc()
+            return
+        value = data
+        if self._weak_values:
+            # Raises TypeError, before anything changed, for items that do not support weak references.
+            value = weakref.KeyedRef(data, self._dead.append, key)
+            if self._keep_alive is not None:
+                self._keep(key, data)
+        if self._absent:
+            self._absent.pop(key, None)
+        entry = self._entries.get(key)
+        if entry is None:
+            if self._l2 is not None:
+                self._supersede_l2(key)
+            entry = self._entries[key] = Entry(key, value)
+            if self._window is not None:
+                self._in_window.add(entry)
+                self._window.append(entry)
+            else:
+                self._lru.append(entry)
+        else:
+            entry.value = value
+            self._touch(entry)
+        self._mark_item(entry)
+        if self._sizer is not None:
+            self._bytes += size - entry.size
+            entry.size = size
+            if self._bytes > self._peak_bytes:
+                self._peak_bytes = self._bytes
         if ttl := kwargs.get("ttl"):
-            self._ttl_manager.set_ttd(key, ttl)
-        if tags := kwargs.get("tags"):
-            for tag in tags:
-                self._tags_manager.set_tag(key, tag)
+            if entry.deadline is not None:
+                self._unschedule(entry)
+            entry.deadline = self._ttl_manager.set_ttd(key, ttl)
+            if self._refresh_at is not None:
+                self._refresh_at[key] = entry.deadline - math.ceil(ttl * 1000 * (1 - self._refresh_ahead))
+        tags = kwargs.get("tags")
+        if tags or entry.tags is not None:
+            # A write is fresh for the tags it is given, or else for the tags the entry already had.
+            tags_manager = self._tags_manager
+            if entry.tags is not None:
+                tags_manager.unlink(key, entry.tags)
+            if tags:
+                entry.tags = self._tags_tuple(tags)
+            tags_manager.link(key, entry.tags)
+            entry.epoch = tags_manager.epoch
+
+    def _tags_tuple(self, tags: Iterable[str]) -> tuple[str, ...]:
+        # Consecutive writes mostly carry the same tags, their entries share one tuple.
+        tags = tuple(tags)
+        if tags != self._last_tags:
+            self._last_tags = tags
+        return self._last_tags
 
     def remove(self, key: str | int) -> None:
-        self._identity_map.remove(key)
-        self._lru_list.remove(key)
-        self._ttl_manager.remove_ttd(key)
-        self._tags_manager.remove_key(key)
-        self._mark_item_deleted(key)
-
-    def get_or_fetch(self, key: str | int, loader: Callable[[], Any], **kwargs: Unpack[IdentityMapAddParams]) -> Any:
-        data = self.get(key)
+        with self._lock:
+            self._remove(key)
+
+    def remove_many(self, keys: Iterable[str | int]) -> None:
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def _remove(self, key: str | int) -> None:
+        if self._absent:
+            self._absent.pop(key, None)
+        if self._restoring is not None:
+            self._restoring.add(key)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._remove_entry(entry)
+        elif self._l2 is not None:
+            self._supersede_l2(key)
+
+    def _supersede_l2(self, key: str | int) -> None:
+        # Whatever the L2 holds for the key, or is moving back from it, is older than this write or removal.
+        self._l2.discard(key)
+        if key in self._promoting:
+            self._promoting[key] = True
+
+    def _remove_entry(self, entry: Entry) -> None:
+        self._mark_item_deleted(entry)
+        self._drop(entry)
+
+    def _drop(self, entry: Entry) -> None:
+        """Remove the entry from the map, its LRU list and the tag index."""
+        del self._entries[entry.key]
+        if self._in_window and entry in self._in_window:
+            self._in_window.remove(entry)
+            self._window.remove(entry)
+        else:
+            self._lru.remove(entry)
+        if entry.tags is not None:
+            self._tags_manager_.unlink(entry.key, entry.tags)
+        if entry.deadline is not None:
+            self._unschedule(entry)
+        if self._refresh_at:
+            self._refresh_at.pop(entry.key, None)
+        if self._keep_alive:
+            self._keep_alive.pop(entry.key, None)
+        self._bytes -= entry.size
+
+    def _unschedule(self, entry: Entry) -> None:
+        # The wheel keeps no key index: the deadline finds the slot, or the deadline pushed back by _gc_ttl().
+        self._ttl_manager_.unschedule(entry.key, entry.deadline)
+        if self._stale_ms:
+            self._ttl_manager_.unschedule(entry.key, entry.deadline + self._stale_ms)
+
+    def _expire(self, entry: Entry) -> None:
+        self._remove_entry(entry)
+        self._metrics.expirations.inc()
+        if self._hooks is not None:
+            self._hooks.fire("on_expire", entry.key)
+
+    def _evict(self, entry: Entry, reason: str) -> None:
+        if self._l2 is not None:
+            # Before the entry is dropped: that may release the last reference to a weak entry's item.
+            self._demote(entry)
+        self._remove_entry(entry)
+        self._metrics.evictions[reason].inc()
+        if self._hooks is not None:
+            self._hooks.fire("on_evict", entry.key, reason)
+
+    def _demote(self, entry: Entry) -> None:
+        ttl = None
+        if entry.deadline is not None:
+            ttl = (entry.deadline - self._ttl_manager_.now()) / 1000
+            if ttl <= 0:
+                return
+        if entry.tags is not None and self._tags_manager_.is_stale_since(entry.tags, entry.epoch):
+            return
+        item = self._item(entry)
+        if item is not None:
+            self._l2.put(entry.key, item, ttl, entry.tags, entry.epoch)
+
+    def resize(self, max_items: int | None = None, max_bytes: int | None = None) -> int:
+        """
+        Change max_items and/or max_bytes (None keeps a limit as it is) and evict down to the new limits at once;
+        return the number of evicted entries. A byte limit needs measured entries: max_bytes or a sizer given
+        when the map was created.
+        """
+        if max_items is not None and max_items < 1:
+            raise ValueError(f"max_items must be a positive integer, not {max_items}")
+        if max_bytes is not None:
+            if max_bytes < 1:
+                raise ValueError(f"max_bytes must be a positive integer, not {max_bytes}")
+            if self._sizer is None:
+                raise ValueError("max_bytes needs entry sizes: create the map with max_bytes or a sizer")
+        with self._lock:
+            if max_items is not None:
+                self._max_items = max_items
+                if self._window is not None:
+                    self._window_size = max(1, int(max_items * self.LFRU_WINDOW_RATIO))
+            if max_bytes is not None:
+                self._max_bytes = max_bytes
+            return self._evict_overflow()
+
+    def _lru_victim(self) -> Entry | None:
+        victim = self._lru.first()
+        if victim is None and self._window is not None:
+            victim = self._window.first()
+        return victim
+
+    def _evict_overflow(self) -> int:
+        evicted = 0
+        if self._window is not None:
+            evicted += self._evict_window_overflow()
+        elif self._max_items is not None:
+            while len(self._entries) > self._max_items:
+                self._evict(self._lru.first(), "capacity")
+                evicted += 1
+        if self._max_bytes is not None:
+            while self._bytes > self._max_bytes:
+                victim = self._lru_victim()
+                if victim is None:
+                    break
+                self._evict(victim, "bytes")
+                evicted += 1
+        return evicted
+
+    def _promote(self, entry: Entry) -> None:
+        self._window.remove(entry)
+        self._in_window.remove(entry)
+        self._lru.append(entry)
+
+    def _evict_window_overflow(self) -> int:
+        evicted = 0
+        while len(self._window) > self._window_size:
+            candidate = self._window.first()
+            if len(self._entries) <= self._max_items:
+                self._promote(candidate)
+                continue
+            victim = self._lru.first()
+            if victim is None or self._sketch.estimate(candidate.key) > self._sketch.estimate(victim.key):
+                self._promote(candidate)
+                candidate = victim
+            else:
+                self._metrics.rejections.inc()
+            if candidate is not None:
+                self._evict(candidate, "capacity")
+                evicted += 1
+        while len(self._entries) > self._max_items:
+            self._evict(self._lru_victim(), "capacity")
+            evicted += 1
+        return evicted
+
+    def get_or_fetch(
+        self,
+        key: str | int,
+        loader: Callable[[], Any],
+        timeout: float | None = None,
+        **kwargs: Unpack[IdentityMapAddParams],
+    ) -> Any:
+        """
+        Concurrent misses on the same key share a single loader call; the other callers wait for it
+        up to timeout seconds (TimeoutError) and get its result or its exception. With negative_ttl set,
+        a loader returning None caches the key as known absent and later calls return None right away.
+        With refresh_ahead or stale_ttl set, a hit due for a refresh or a stale item is returned at once
+        and reloaded in the background, one reload per key at a time.
+        """
+        with self._lock:
+            data, refresh = self._lookup(key)
+        if refresh:
+            self._refresh(key, loader, kwargs)
+        if data is _ABSENT:
+            return None
         if data is not None:
             return data
 
-        data = loader()
-        self.add(key, data, **kwargs)
+        return self._single_flight.do(key, lambda: self._load(key, loader, kwargs), timeout)
+
+    def _refresh(self, key: str | int, loader: Callable[[], Any], kwargs: IdentityMapAddParams) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        executor = self._refresh_executor or _shared_refresh_executor()
+        executor.submit(self._run_refresh, key, loader, kwargs)
+
+    def _run_refresh(self, key: str | int, loader: Callable[[], Any], kwargs: IdentityMapAddParams) -> None:
+        try:
+            # Callers missing the key meanwhile wait for this reload instead of starting their own.
+            self._single_flight.do(key, lambda: self._reload(key, loader, kwargs))
+            refreshed = True
+        except Exception:
+            # The current item stays served until it expires (or leaves its stale window).
+            refreshed = False
+        with self._lock:
+            self._refreshing.discard(key)
+        if refreshed:
+            self._metrics.refreshes.inc()
+        else:
+            self._metrics.refresh_errors.inc()
+
+    def get_or_fetch_many(
+        self,
+        keys: Iterable[str | int],
+        loader: Callable[[list[str | int]], Mapping[str | int, Any]],
+        timeout: float | None = None,
+        **kwargs: Unpack[IdentityMapAddParams],
+    ) -> dict[str | int, Any]:
+        """
+        Return the items for keys, calling the bulk loader(missing_keys) -> {key: item} once for all misses.
+        Misses already being loaded by another caller are waited for instead; keys the loader does not
+        return are left out of the result (and cached as known absent with negative_ttl set).
+        """
+        keys = list(keys)
+        found = self.get_many(keys)
+        missing = [key for key in keys if key not in found and not self.is_absent(key)]
+        if missing:
+            loaded = self._single_flight.do_many(missing, lambda led: self._load_many(led, loader, kwargs), timeout)
+            found.update((key, data) for key, data in loaded.items() if data is not None)
+        return found
+
+    def _peek(self, key: str | int) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not self._is_live(entry) or (item := self._item(entry)) is None:
+                return _ABSENT if self._absent and self._is_absent(key) else None
+            return item
+
+    def _load_many(
+        self,
+        keys: list[str | int],
+        loader: Callable[[list[str | int]], Mapping[str | int, Any]],
+        kwargs: IdentityMapAddParams,
+    ) -> dict[str | int, Any]:
+        found = {}
+        for key in keys:
+            data = self._peek(key)
+            if data is not None:
+                found[key] = data
+        if self._l2 is not None:
+            for key in keys:
+                if key not in found and (data := self.load_from_l2(key)) is not None:
+                    found[key] = data
+        missing = [key for key in keys if key not in found]
+        if missing:
+            loaded = self._call_loader(missing, loader, missing)
+            loaded = {key: data for key, data in loaded.items() if data is not None}
+            self.add_many(loaded, **kwargs)
+            self.add_absent_many(key for key in missing if key not in loaded)
+            found.update(loaded)
+        return {key: data for key, data in found.items() if data is not _ABSENT}
+
+    def _call_loader(self, key: Any, loader: Callable[..., Any], *args: Any) -> Any:
+        """Call loader(*args) for key (the list of keys of a bulk load), recording its duration."""
+        started = time.perf_counter()
+        error = None
+        try:
+            return loader(*args)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            self._metrics.record_load(seconds, error is not None)
+            if self._hooks is not None:
+                self._hooks.fire("on_load", key, seconds, error)
+
+    def _load(self, key: str | int, loader: Callable[[], Any], kwargs: IdentityMapAddParams) -> Any:
+        # Another flight may have stored the key between our miss and becoming the leader.
+        data = self._peek(key)
+        if data is _ABSENT:
+            return None
+        if data is not None:
+            return data
+        if self._l2 is not None:
+            data = self.load_from_l2(key)
+            if data is not None:
+                return data
+        return self._reload(key, loader, kwargs)
+
+    def load_from_l2(self, key: str | int) -> Any | None:
+        """Move key from the L2 back into the map and return its item; None when the L2 does not hold it."""
+        if self._l2 is None:
+            return None
+        with self._lock:
+            self._promoting[key] = False
+        record, size = None, 0
+        try:
+            record = self._l2.take(key)
+            if record is not None:
+                size = self._size_of(record[0])
+        finally:
+            with self._lock:
+                superseded = self._promoting.pop(key, True)
+                if record is not None:
+                    data, ttl, tags, epoch = record
+                    if superseded or key in self._entries:
+                        record = None
+                    elif tags is not None and self._tags_manager_.is_stale_since(tags, epoch):
+                        record = None
+                    else:
+                        self._add(key, data, {"ttl": ttl, "tags": tags}, size)
+                        self._evict_overflow()
+        if record is None:
+            self._metrics.l2_misses.inc()
+            return None
+        self._metrics.l2_hits.inc()
+        return data
+
+    def _reload(self, key: str | int, loader: Callable[[], Any], kwargs: IdentityMapAddParams) -> Any:
+        data = self._call_loader(key, loader)
+        if data is None:
+            self.add_absent(key)
+        else:
+            self.add(key, data, **kwargs)
         return data
 
     def clear(self) -> None:
-        self._identity_map.clear()
-        self._lru_list.clear()
-        self._ttl_manager.clear()
-        self._tags_manager.clear()
+        with self._lock:
+            self._entries.clear()
+            self._lru.clear()
+            self._ttl_manager.clear()
+            self._tags_manager.clear()
+            if self._window is not None:
+                self._window.clear()
+                self._in_window.clear()
+            if self._sketch is not None:
+                self._sketch.clear()
+            if self._absent is not None:
+                self._absent.clear()
+            if self._refresh_at is not None:
+                self._refresh_at.clear()
+            if self._keep_alive is not None:
+                self._keep_alive.clear()
+            self._dead.clear()
+            self._bytes = 0
+            # Clearing also calls off a warm start in progress.
+            self._restoring = None
+            if self._l2 is not None:
+                self._l2.clear()
+
+    def invalidate_tag(self, tag: str) -> None:
+        """
+        Invalidate every entry tagged with tag in O(1): the entries become misses for get() right away
+        and are reclaimed by the following GC runs.
+        """
+        self.invalidate_tags((tag,))
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        tags = list(tags)
+        self._invalidate_tags(tags)
+        self._metrics.invalidations.inc(len(tags))
+
+    def _invalidate_tags(self, tags: list[str]) -> None:
+        # Not counted: a sharded map counts its invalidations once, not once per segment.
+        with self._lock:
+            self._tags_manager.invalidate_tags(tags)
+
+    def snapshot(self, path: str) -> int:
+        """Save the live entries with their remaining TTL, tags and LRU order to path, see warm_start()."""
+        return save_snapshot(path, {None: self})
+
+    def warm_start(self, path: str, background: bool = True) -> SnapshotRestore:
+        """Restore a snapshot, on a daemon thread by default; the map serves (and loads) meanwhile."""
+        return SnapshotRestore(path, lambda _: self).start(background)
+
+    def _snapshot_records(self) -> list[Record]:
+        """The live entries, most recently used first."""
+        with self._lock:
+            now = self._ttl_manager_.now() if self._ttl_manager_ is not None else 0
+            lists = (self._window, self._lru) if self._window is not None else (self._lru,)
+            records = []
+            for entry in chain.from_iterable(reversed(one) for one in lists):
+                if self._is_live(entry) and (item := self._item(entry)) is not None:
+                    ttl = None if entry.deadline is None else (entry.deadline - now) / 1000
+                    records.append((entry.key, item, ttl, entry.tags))
+            return records
+
+    def _begin_restore(self) -> None:
+        with self._lock:
+            self._restoring = set()
+            self._restore_epoch = self._tags_manager.epoch
+
+    def _end_restore(self) -> None:
+        with self._lock:
+            self._restoring = None
+
+    def _restore_records(self, records: list[Record], age: float) -> tuple[int, bool]:
+        """
+        Add snapshot records taken age seconds ago, most recently used first, behind the cached entries.
+        Return how many were added and whether more fit; records that find the map full are left out.
+        """
+        sizes = [self._size_of(data) for _, data, _, _ in records] if self._sizer is not None else None
+        restored = 0
+        with self._lock:
+            for index, (key, data, ttl, tags) in enumerate(records):
+                if self._restoring is None:
+                    return restored, False
+                size = sizes[index] if sizes is not None else 0
+                if self._max_items is not None and len(self._entries) >= self._max_items:
+                    return restored, False
+                if self._max_bytes is not None and self._bytes + size > self._max_bytes:
+                    return restored, False
+                if self._weak_values and len(self._keep_alive or ()) >= self._keep_alive_items:
+                    # Nothing else references a restored item: out of the keep-alive window, it is collected at once.
+                    return restored, False
+                if key in self._entries or key in self._restoring or (self._absent and self._is_absent(key)):
+                    continue
+                if ttl is not None:
+                    ttl -= age
+                    if ttl <= 0:
+                        continue
+                if not self.validate_item(data):
+                    continue
+                self._add(key, data, {"ttl": ttl, "tags": tags}, size)
+                entry = self._entries[key]
+                # Older than anything cached meanwhile: the restored entries are the first to be evicted.
+                if entry in self._in_window:
+                    self._window.remove(entry)
+                    self._in_window.remove(entry)
+                else:
+                    self._lru.remove(entry)
+                self._lru.prepend(entry)
+                if self._keep_alive is not None:
+                    self._keep_alive.move_to_end(key, last=False)
+                if tags:
+                    entry.epoch = self._restore_epoch
+                restored += 1
+        return restored, True
+
+    def gc_run(self, budget: GCBudget | None = None) -> int:
+        """Run the configured GC passes within budget and return the number of reclaimed entries."""
+        if budget is None:
+            budget = self._gc_operator.budget()
+        started = time.perf_counter()
+        with self._lock:
+            reclaimed = self._gc_invalidated(budget)
+            if self._dead:
+                reclaimed += self._reap()
+            if self._absent:
+                reclaimed += self._gc_absent(budget)
+            if self._gc_operator.in_gc(GCType.TTL):
+                reclaimed += self._gc_ttl(budget)
+            if self._gc_operator.in_gc(GCType.LFRU):
+                reclaimed += self._gc_lfru(budget)
+            elif self._gc_operator.in_gc(GCType.LRU):
+                reclaimed += self._gc_lru(budget)
+            if self._hooks is not None:
+                self._hooks.fire("on_gc", time.perf_counter() - started, reclaimed)
+            return reclaimed
+
+    def gc_pending(self) -> bool:
+        """Whether invalidated entries wait for reclamation or the map has outgrown its GC target size."""
+        if self._tags_manager_ is not None and self._tags_manager_.has_invalidated():
+            return True
+        if self._dead:
+            return True
+        if not (self._gc_operator.in_gc(GCType.LRU) or self._gc_operator.in_gc(GCType.LFRU)):
+            return False
+        return self._gc_excess() > 0
+
+    def _is_stale_key(self, key: str | int) -> bool:
+        entry = self._entries.get(key)
+        if entry is None or entry.tags is None:
+            return False
+        return self._tags_manager_.is_stale_since(entry.tags, entry.epoch)
+
+    def _gc_invalidated(self, budget: GCBudget) -> int:
+        if self._tags_manager_ is None:
+            return 0
+        reclaimed = 0
+        while self._tags_manager_.has_invalidated() and not budget.exhausted():
+            limit = budget.remaining_entries(self.TTL_BATCH_SIZE)
+            keys = self._tags_manager_.pop_invalidated(limit, self._is_stale_key)
+            for key in keys:
+                self._remove(key)
+            budget.spend(limit)
+            reclaimed += len(keys)
+        self._metrics.invalidated.inc(reclaimed)
+        return reclaimed
+
+    def _gc_absent(self, budget: GCBudget) -> int:
+        # All known absent keys share one TTL, so the oldest are the first to expire.
+        now = self._ttl_manager.now()
+        reclaimed = 0
+        while self._absent and not budget.exhausted():
+            key, deadline = next(iter(self._absent.items()))
+            if deadline > now:
+                break
+            del self._absent[key]
+            budget.spend()
+            reclaimed += 1
+        return reclaimed
+
+    def _gc_ttl(self, budget: GCBudget) -> int:
+        if self._ttl_manager_ is None:
+            return 0
+        reclaimed = 0
+        while not budget.exhausted():
+            cascaded = self._ttl_manager_.cascaded
+            keys = self._ttl_manager_.pop_expired(budget.remaining_entries(self.TTL_BATCH_SIZE))
+            # Keys the wheel moved between slots to get there are work of the pass as well.
+            cascaded = self._ttl_manager_.cascaded - cascaded
+            if not keys and not cascaded:
+                break
+            now = self._ttl_manager_.now()
+            for key in keys:
+                # The wheel may hand out a key already gone or one whose deadline was pushed back.
+                entry = self._entries.get(key)
+                if entry is None or entry.deadline is None:
+                    continue
+                expires = entry.deadline + self._stale_ms
+                if expires <= now:
+                    self._expire(entry)
+                    reclaimed += 1
+                else:
+                    self._ttl_manager_.schedule(key, expires)
+            budget.spend(len(keys) + cascaded)
+        return reclaimed
+
+    def _gc_excess(self) -> int:
+        target = self.gc_target_items
+        if target is None:
+            return 0
+        return max(0, len(self._entries) - target)
 
-    def gc_run(self) -> None:
-        pass
+    def _gc_lru(self, budget: GCBudget) -> int:
+        reclaimed = 0
+        for _ in range(self._gc_excess()):
+            if budget.exhausted():
+                break
+            self._evict(self._lru_victim(), "gc")
+            budget.spend()
+            reclaimed += 1
+        return reclaimed
+
+    def _gc_lfru(self, budget: GCBudget) -> int:
+        excess = budget.remaining_entries(self._gc_excess())
+        if excess == 0:
+            return 0
+        # Least frequently used among the least recently used; sorted() is stable, so ties keep LRU order.
+        candidates = self._lru.get_first(excess * self.LFRU_CANDIDATES_FACTOR)
+        if self._sketch is not None:
+            candidates = sorted(candidates, key=lambda entry: self._sketch.estimate(entry.key))
+        reclaimed = 0
+        for entry in candidates[:excess]:
+            if budget.exhausted():
+                break
+            self._evict(entry, "gc")
+            budget.spend()
+            reclaimed += 1
+        return reclaimed
+
+    def get_keys_for_tag(self, tag: str) -> List[str | int]:
+        with self._lock:
+            if self._tags_manager_ is None:
+                return []
+            return self._tags_manager_.get_keys_for_tag(tag)
+
+    def get_tags_for_key(self, key: str | int) -> List[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.tags is None:
+                return []
+            return list(entry.tags)
+
+    def tags(self) -> set[str]:
+        with self._lock:
+            if self._tags_manager_ is None:
+                return set()
+            return self._tags_manager_.tags
+
+    def largest(self, count: int | None = None) -> list[tuple[str | int, int]]:
+        """The count largest entries as (key, size) pairs, largest first."""
+        if self._sizer is None:
+            return []
+        # Only the copy holds the lock: ranking every entry under it would stall lookups of large maps.
+        with self._lock:
+            entries = list(self._entries.values())
+        entries = heapq.nlargest(count or self.STATS_LARGEST, entries, key=lambda entry: entry.size)
+        return [(entry.key, entry.size) for entry in entries]
+
+    @property
+    def metrics(self) -> CacheMetrics:
+        return self._metrics
+
+    def metrics_snapshot(self) -> dict[str, Any]:
+        """Counters, loader latency histogram and gauges as a dict, see CacheMetrics.snapshot()."""
+        return self._metrics.snapshot()
+
+    def prometheus(self) -> str:
+        return to_prometheus({map_label(self._internal_type): self.metrics_snapshot()})
+
+    def stats(self) -> dict[str, Any] | None:
+        with self._lock:
+            metrics = self._metrics.snapshot()
+            hits, misses = metrics["hits"], metrics["misses"]
+            stats = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits else 0,
+                "miss_rate": misses / (hits + misses) if misses else 0,
+                "negative_hits": metrics["negative_hits"],
+                "count": len(self._entries),
+                "absent_count": len(self._absent) if self._absent is not None else 0,
+                "max_items": self._max_items,
+                "evictions": sum(metrics["evictions"].values()),
+                "rejections": metrics["rejections"],
+                "expirations": metrics["expirations"],
+                "coalesced": self._single_flight.coalesced,
+                "invalidations": metrics["invalidations"],
+                "invalidated": metrics["invalidated"],
+                "collected": metrics["collected"],
+                "tags_count": len(self._tags_manager),
+                "loads": metrics["loads"],
+                "refreshes": metrics["refreshes"],
+                "refresh_errors": metrics["refresh_errors"],
+                "stale_hits": metrics["stale_hits"],
+                "l2_hits": metrics["l2_hits"],
+                "l2_misses": metrics["l2_misses"],
+            }
+            if self._l2 is not None:
+                stats["l2"] = self._l2.stats()
+            if self._sizer is not None:
+                stats["bytes"] = self._bytes
+                stats["peak_bytes"] = self._peak_bytes
+                stats["max_bytes"] = self._max_bytes
+        if self._sizer is not None:
+            stats["largest"] = self.largest()
+        return stats
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[Any]:
+        with self._lock:
+            return iter(list(self._entries))
+
+
+class ShardedManagedIdentityMap:
+    """
+    Concurrent ManagedIdentityMap: keys are spread by hash over independently locked segments, each with
+    its own LRU, TTL index and counters, so threads working on different keys rarely wait for each other.
+    max_items, gc_target_items and keep_alive are split evenly between the segments.
+    """
+
+    def __init__(
+        self,
+        internal_type: str | None = None,
+        shards: int = 16,
+        max_items: int | None = None,
+        gc_target_items: int | None = None,
+        max_bytes: int | None = None,
+        max_negative_items: int | None = None,
+        keep_alive: int | None = None,
+        **kwargs: Any,
+    ):
+        if shards < 1:
+            raise ValueError(f"shards must be a positive integer, not {shards}")
+        self._internal_type: str = internal_type
+        self._max_items: int | None = max_items
+        self._max_bytes: int | None = max_bytes
+        self._segments: tuple[ManagedIdentityMap, ...] = tuple(
+            ManagedIdentityMap(
+                internal_type=internal_type,
+                max_items=self._per_segment(max_items, shards),
+                gc_target_items=self._per_segment(gc_target_items, shards),
+                max_bytes=self._per_segment(max_bytes, shards),
+                max_negative_items=self._per_segment(max_negative_items, shards),
+                keep_alive=self._per_segment(keep_alive, shards) if keep_alive else keep_alive,
+                **kwargs,
+            )
+            for _ in range(shards)
+        )
+        # Coalesces the bulk loads of get_or_fetch_many(), which may span several segments.
+        self._single_flight: SingleFlight = SingleFlight()
+        # Loads of get_or_fetch_many(); everything else is counted by the segments.
+        self._metrics: CacheMetrics = CacheMetrics()
+        self._hooks: Hooks | None = None
+        self._hooks_lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def _per_segment(value: int | None, shards: int) -> int | None:
+        if value is None:
+            return None
+        return max(1, math.ceil(value / shards))
+
+    @property
+    def internal_type(self) -> str:
+        return self._internal_type
+
+    @property
+    def max_items(self) -> int | None:
+        return self._max_items
+
+    @property
+    def max_bytes(self) -> int | None:
+        return self._max_bytes
+
+    @property
+    def bytes(self) -> int:
+        return sum(segment.bytes for segment in self._segments)
+
+    @property
+    def segments(self) -> tuple[ManagedIdentityMap, ...]:
+        return self._segments
+
+    @property
+    def evictions(self) -> int:
+        return sum(segment.evictions for segment in self._segments)
+
+    @property
+    def expirations(self) -> int:
+        return sum(segment.expirations for segment in self._segments)
+
+    @property
+    def inline_gc(self) -> bool:
+        return self._segments[0].inline_gc
+
+    @inline_gc.setter
+    def inline_gc(self, value: bool) -> None:
+        for segment in self._segments:
+            segment.inline_gc = value
+
+    @property
+    def l2(self) -> DiskTier | None:
+        """The L2 all the segments share, if given."""
+        return self._segments[0].l2
+
+    @property
+    def weak_values(self) -> bool:
+        return self._segments[0].weak_values
+
+    def segment_for(self, key: str | int) -> ManagedIdentityMap:
+        return self._segments[hash(key) % len(self._segments)]
+
+    def resize(self, max_items: int | None = None, max_bytes: int | None = None) -> int:
+        """Change the limits of the map, split evenly between the segments as in the constructor."""
+        shards = len(self._segments)
+        segment_items, segment_bytes = self._per_segment(max_items, shards), self._per_segment(max_bytes, shards)
+        evicted = sum(segment.resize(segment_items, segment_bytes) for segment in self._segments)
+        if max_items is not None:
+            self._max_items = max_items
+        if max_bytes is not None:
+            self._max_bytes = max_bytes
+        return evicted
+
+    def validate_item(self, data: Any) -> bool:
+        return self._segments[0].validate_item(data)
+
+    def has(self, key: str | int) -> bool:
+        return self.segment_for(key).has(key)
+
+    def get(self, key: str | int) -> Any | None:
+        return self.segment_for(key).get(key)
+
+    def add(self, key: str | int, data: Any, **kwargs: Unpack[IdentityMapAddParams]) -> None:
+        self.segment_for(key).add(key, data, **kwargs)
+
+    def remove(self, key: str | int) -> None:
+        self.segment_for(key).remove(key)
+
+    def lookup(self, key: str | int) -> tuple[Any | None, bool]:
+        return self.segment_for(key).lookup(key)
+
+    def is_absent(self, key: str | int) -> bool:
+        return self.segment_for(key).is_absent(key)
+
+    def load_from_l2(self, key: str | int) -> Any | None:
+        return self.segment_for(key).load_from_l2(key)
+
+    def add_absent(self, key: str | int) -> None:
+        self.segment_for(key).add_absent(key)
+
+    def add_absent_many(self, keys: Iterable[str | int]) -> None:
+        for segment, segment_keys in self._group(keys).items():
+            segment.add_absent_many(segment_keys)
+
+    def _group(self, keys: Iterable[str | int]) -> dict[ManagedIdentityMap, list[str | int]]:
+        groups = defaultdict(list)
+        for key in keys:
+            groups[self.segment_for(key)].append(key)
+        return groups
+
+    def get_many(self, keys: Iterable[str | int]) -> dict[str | int, Any]:
+        found = {}
+        for segment, segment_keys in self._group(keys).items():
+            found.update(segment.get_many(segment_keys))
+        return found
+
+    def add_many(self, items: Mapping[str | int, Any], **kwargs: Unpack[IdentityMapAddParams]) -> None:
+        for segment, segment_keys in self._group(items).items():
+            segment.add_many({key: items[key] for key in segment_keys}, **kwargs)
+
+    def remove_many(self, keys: Iterable[str | int]) -> None:
+        for segment, segment_keys in self._group(keys).items():
+            segment.remove_many(segment_keys)
+
+    def get_or_fetch_many(
+        self,
+        keys: Iterable[str | int],
+        loader: Callable[[list[str | int]], Mapping[str | int, Any]],
+        timeout: float | None = None,
+        **kwargs: Unpack[IdentityMapAddParams],
+    ) -> dict[str | int, Any]:
+        keys = list(keys)
+        found = self.get_many(keys)
+        missing = [key for key in keys if key not in found and not self.is_absent(key)]
+        if missing:
+            loaded = self._single_flight.do_many(missing, lambda led: self._load_many(led, loader, kwargs), timeout)
+            found.update((key, data) for key, data in loaded.items() if data is not None)
+        return found
+
+    def _load_many(
+        self,
+        keys: list[str | int],
+        loader: Callable[[list[str | int]], Mapping[str | int, Any]],
+        kwargs: IdentityMapAddParams,
+    ) -> dict[str | int, Any]:
+        promoted = {}
+        if self.l2 is not None:
+            for key in keys:
+                if (data := self.load_from_l2(key)) is not None:
+                    promoted[key] = data
+            keys = [key for key in keys if key not in promoted]
+            if not keys:
+                return promoted
+        started = time.perf_counter()
+        try:
+            loaded = loader(keys)
+        except BaseException as exc:
+            self._loaded(keys, time.perf_counter() - started, exc)
+            raise
+        self._loaded(keys, time.perf_counter() - started)
+        loaded = {key: data for key, data in loaded.items() if data is not None}
+        self.add_many(loaded, **kwargs)
+        self.add_absent_many(key for key in keys if key not in loaded)
+        return promoted | loaded
+
+    def _loaded(self, keys: list[str | int], seconds: float, error: BaseException | None = None) -> None:
+        self._metrics.record_load(seconds, error is not None)
+        if self._hooks is not None:
+            self._hooks.fire("on_load", keys, seconds, error)
+
+    def add_hook(self, event: str, handler: Callable[..., Any]) -> None:
+        """Register handler on every segment (and on the bulk loads run here)."""
+        self._change_hooks(lambda hooks: hooks.add(event, handler))
+        for segment in self._segments:
+            segment.add_hook(event, handler)
+
+    def remove_hook(self, event: str, handler: Callable[..., Any]) -> None:
+        self._change_hooks(lambda hooks: hooks.remove(event, handler))
+        for segment in self._segments:
+            segment.remove_hook(event, handler)
+
+    def add_listener(self, listener: Any) -> None:
+        self._change_hooks(lambda hooks: hooks.add_listener(listener))
+        for segment in self._segments:
+            segment.add_listener(listener)
+
+    def remove_listener(self, listener: Any) -> None:
+        self._change_hooks(lambda hooks: hooks.remove_listener(listener))
+        for segment in self._segments:
+            segment.remove_listener(listener)
+
+    def _change_hooks(self, change: Callable[[Hooks], None]) -> None:
+        with self._hooks_lock:
+            self._hooks = change_hooks(self._hooks, change)
+
+    def get_or_fetch(
+        self,
+        key: str | int,
+        loader: Callable[[], Any],
+        timeout: float | None = None,
+        **kwargs: Unpack[IdentityMapAddParams],
+    ) -> Any:
+        return self.segment_for(key).get_or_fetch(key, loader, timeout, **kwargs)
+
+    def clear(self) -> None:
+        for segment in self._segments:
+            segment.clear()
+
+    def invalidate_tag(self, tag: str) -> None:
+        self.invalidate_tags((tag,))
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        tags = list(tags)
+        for segment in self._segments:
+            segment._invalidate_tags(tags)
+        self._metrics.invalidations.inc(len(tags))
+
+    def snapshot(self, path: str) -> int:
+        return save_snapshot(path, {None: self})
+
+    def warm_start(self, path: str, background: bool = True) -> SnapshotRestore:
+        return SnapshotRestore(path, lambda _: self).start(background)
+
+    def _snapshot_records(self) -> list[Record]:
+        # Recency is kept per segment, and so is the order of the restored entries of a segment.
+        return list(chain.from_iterable(segment._snapshot_records() for segment in self._segments))
+
+    def _begin_restore(self) -> None:
+        for segment in self._segments:
+            segment._begin_restore()
+
+    def _end_restore(self) -> None:
+        for segment in self._segments:
+            segment._end_restore()
+
+    def _restore_records(self, records: list[Record], age: float) -> tuple[int, bool]:
+        grouped = defaultdict(list)
+        for record in records:
+            grouped[self.segment_for(record[0])].append(record)
+        restored, more = 0, False
+        for segment, segment_records in grouped.items():
+            count, segment_more = segment._restore_records(segment_records, age)
+            restored += count
+            more = more or segment_more
+        return restored, more
+
+    def gc_run(self, budget: GCBudget | None = None) -> int:
+        """Run GC on every segment; a given budget is shared by all of them."""
+        return sum(segment.gc_run(budget) for segment in self._segments)
+
+    def gc_pending(self) -> bool:
+        return any(segment.gc_pending() for segment in self._segments)
+
+    def get_keys_for_tag(self, tag: str) -> List[str | int]:
+        return list(chain.from_iterable(segment.get_keys_for_tag(tag) for segment in self._segments))
+
+    def get_tags_for_key(self, key: str | int) -> List[str]:
+        return self.segment_for(key).get_tags_for_key(key)
+
+    def tags(self) -> set[str]:
+        return set().union(*(segment.tags() for segment in self._segments))
+
+    def largest(self, count: int | None = None) -> list[tuple[str | int, int]]:
+        count = count or ManagedIdentityMap.STATS_LARGEST
+        entries = chain.from_iterable(segment.largest(count) for segment in self._segments)
+        return heapq.nlargest(count, entries, key=lambda item: item[1])
+
+    def metrics_snapshot(self) -> dict[str, Any]:
+        """Metrics of all segments added up."""
+        return merge_snapshots([*(segment.metrics_snapshot() for segment in self._segments), self._metrics.snapshot()])
+
+    def prometheus(self) -> str:
+        return to_prometheus({map_label(self._internal_type): self.metrics_snapshot()})
 
     def stats(self) -> dict[str, Any] | None:
+        segments = [segment.stats() for segment in self._segments]
+        hits = sum(one["hits"] for one in segments)
+        misses = sum(one["misses"] for one in segments)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if hits else 0,
+            "miss_rate": misses / total if misses else 0,
+            "negative_hits": sum(one["negative_hits"] for one in segments),
+            "count": sum(one["count"] for one in segments),
+            "absent_count": sum(one["absent_count"] for one in segments),
+            "max_items": self._max_items,
+            "evictions": sum(one["evictions"] for one in segments),
+            "rejections": sum(one["rejections"] for one in segments),
+            "expirations": sum(one["expirations"] for one in segments),
+            "coalesced": sum(one["coalesced"] for one in segments) + self._single_flight.coalesced,
+            "invalidations": self._metrics.invalidations.value,
+            "invalidated": sum(one["invalidated"] for one in segments),
+            "collected": sum(one["collected"] for one in segments),
+            "tags_count": len(self.tags()),
+            "loads": sum(one["loads"] for one in segments) + self._metrics.loads.value,
+            "refreshes": sum(one["refreshes"] for one in segments),
+            "refresh_errors": sum(one["refresh_errors"] for one in segments),
+            "stale_hits": sum(one["stale_hits"] for one in segments),
+            "l2_hits": sum(one["l2_hits"] for one in segments),
+            "l2_misses": sum(one["l2_misses"] for one in segments),
+            "shards": len(self._segments),
+        } | self._bytes_stats(segments) | self._l2_stats(segments)
+
+    def _bytes_stats(self, segments: list[dict[str, Any]]) -> dict[str, Any]:
+        if "bytes" not in segments[0]:
+            return {}
         return {
-            "hits": self._hits_misses_counter.hits,
-            "misses": self._hits_misses_counter.misses,
-            "hit_rate": self._hits_misses_counter.get_hit_rate(),
-            "miss_rate": self._hits_misses_counter.get_miss_rate(),
-            "count": len(self._identity_map),
-            "tags_count": len(self._tags_manager),
+            "bytes": sum(one["bytes"] for one in segments),
+            # Segments peak at different times, so their sum is an upper bound of the map's peak.
+            "peak_bytes": sum(one["peak_bytes"] for one in segments),
+            "max_bytes": self._max_bytes,
+            "largest": self.largest(),
         }
 
+    def _l2_stats(self, segments: list[dict[str, Any]]) -> dict[str, Any]:
+        # The segments share one L2.
+        return {"l2": segments[0]["l2"]} if "l2" in segments[0] else {}
+
     def __len__(self) -> int:
-        return len(self._identity_map)
+        return sum(len(segment) for segment in self._segments)
 
     def __iter__(self) -> Iterator[Any]:
-        return self._identity_map.__iter__()
+        return chain.from_iterable(self._segments)
 
 
 class IdentityMapsCollection:
-    def __init__(self, gc_type: int | None = None, gc_possibility: float | None = None):
-        self._maps: dict[str, ManagedIdentityMap] = {}
+    def __init__(
+        self,
+        gc_type: int | None = None,
+        gc_possibility: float | None = None,
+        max_items: int | None = None,
+        gc_max_entries: int | None = None,
+        gc_max_time_us: int | None = None,
+        shards: int | None = None,
+        max_bytes: int | None = None,
+        sizer: Sizer | None = None,
+        negative_ttl: float | None = None,
+        max_negative_items: int | None = None,
+        refresh_ahead: float | None = None,
+        stale_ttl: float | None = None,
+        l2: Callable[[str], DiskTier] | None = None,
+        budget: CollectionBudget | None = None,
+        weak_values: bool = False,
+        keep_alive: int | None = None,
+    ):
+        self._maps: dict[str, ManagedIdentityMap | ShardedManagedIdentityMap] = {}
         self._gc = gc_type
         self._gc_possibility = gc_possibility
+        self._max_items = max_items
+        self._gc_max_entries = gc_max_entries
+        self._gc_max_time_us = gc_max_time_us
+        self._shards = shards
+        self._max_bytes = max_bytes
+        self._sizer = sizer
+        self._negative_ttl = negative_ttl
+        self._max_negative_items = max_negative_items
+        self._refresh_ahead = refresh_ahead
+        self._stale_ttl = stale_ttl
+        # Called with the items type of every new map for the L2 of that map.
+        self._l2 = l2
+        # Split between the maps not given limits of their own in get_map().
+        self._budget = budget
+        self._weak_values = weak_values
+        self._keep_alive = keep_alive
+        self._inline_gc = True
+        self._listeners: list[Any] = []
+        self._lock = threading.Lock()
 
-    def get_map(self, items_type: str) -> ManagedIdentityMap:
+    @property
+    def inline_gc(self) -> bool:
+        return self._inline_gc
+
+    @inline_gc.setter
+    def inline_gc(self, value: bool) -> None:
+        with self._lock:
+            self._inline_gc = value
+            for one_map in self._maps.values():
+                one_map.inline_gc = value
+
+    def get_map(
+        self, items_type: str, max_items: int | None = None, max_bytes: int | None = None
+    ) -> ManagedIdentityMap | ShardedManagedIdentityMap:
         if items_type not in self._maps:
-            self._maps[items_type] = ManagedIdentityMap(
-                internal_type=items_type, gc_types=self._gc, gc_possibility=self._gc_possibility
-            )
+            with self._lock:
+                if items_type not in self._maps:
+                    one_map = self._create_map(items_type, max_items, max_bytes)
+                    for listener in self._listeners:
+                        one_map.add_listener(listener)
+                    self._maps[items_type] = one_map
+        return self._maps[items_type]
 
-    def run_gc(self) -> None:
-        for one_map in self._maps:
-            one_map.gc_run()
+    def add_listener(self, listener: Any) -> None:
+        """Register the on_* methods of listener on every map, including the maps created later."""
+        with self._lock:
+            self._listeners.append(listener)
+            for one_map in self._maps.values():
+                one_map.add_listener(listener)
+
+    def remove_listener(self, listener: Any) -> None:
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+            for one_map in self._maps.values():
+                one_map.remove_listener(listener)
+
+    def _create_map(
+        self, items_type: str, max_items: int | None, max_bytes: int | None
+    ) -> ManagedIdentityMap | ShardedManagedIdentityMap:
+        budgeted = self._budget is not None and max_items is None and max_bytes is None
+        if budgeted:
+            max_items, max_bytes = self._budget.admit(items_type)
+        params = {
+            "internal_type": items_type,
+            "gc_types": self._gc,
+            "gc_possibility": self._gc_possibility,
+            "max_items": max_items if max_items is not None else self._max_items,
+            "gc_max_entries": self._gc_max_entries,
+            "gc_max_time_us": self._gc_max_time_us,
+            "inline_gc": self._inline_gc,
+            "max_bytes": max_bytes if max_bytes is not None else self._max_bytes,
+            "sizer": self._sizer,
+            "negative_ttl": self._negative_ttl,
+            "max_negative_items": self._max_negative_items,
+            "refresh_ahead": self._refresh_ahead,
+            "stale_ttl": self._stale_ttl,
+            "l2": self._l2(items_type) if self._l2 is not None else None,
+            "weak_values": self._weak_values,
+            "keep_alive": self._keep_alive,
+        }
+        if self._shards is not None and self._shards > 1:
+            one_map = ShardedManagedIdentityMap(shards=self._shards, **params)
+        else:
+            one_map = ManagedIdentityMap(**params)
+        if budgeted:
+            self._budget.attach(items_type, one_map)
+        return one_map
+
+    @property
+    def budget(self) -> CollectionBudget | None:
+        return self._budget
+
+    def rebalance(self) -> None:
+        """Resize the maps sharing the budget to the shares its policy gives them now."""
+        if self._budget is not None:
+            self._budget.rebalance()
+
+    def rebalance_if_due(self) -> bool:
+        """rebalance() once the budget's rebalance_interval has passed since the previous one."""
+        return self._budget is not None and self._budget.rebalance_if_due()
+
+    def maps(self) -> list[ManagedIdentityMap | ShardedManagedIdentityMap]:
+        return list(self._maps.values())
+
+    def run_gc(self) -> int:
+        self.rebalance_if_due()
+        return sum(one_map.gc_run() for one_map in self.maps())
+
+    def gc_pending(self) -> bool:
+        return any(one_map.gc_pending() for one_map in self.maps())
 
     def clear_map(self, items_type: str) -> None:
         if items_type in self._maps:
             self._maps[items_type].clear()
 
     def clear(self) -> None:
-        for one_map in self._maps:
+        for one_map in self._maps.values():
             one_map.clear()
 
+    def snapshot(self, path: str) -> int:
+        """Save the entries of every map to one snapshot file, see ManagedIdentityMap.snapshot()."""
+        return save_snapshot(path, dict(self._maps))
+
+    def warm_start(self, path: str, background: bool = True) -> SnapshotRestore:
+        """Restore a snapshot of the collection, creating its maps with this collection's settings."""
+        return SnapshotRestore(path, self.get_map).start(background)
+
     def hits(self) -> int:
-        return sum(one_map.hits for one_map in self._maps.values())
+        return sum(one_map.metrics_snapshot()["hits"] for one_map in self.maps())
 
     def misses(self) -> int:
-        return sum(one_map.misses for one_map in self._maps.values())
+        return sum(one_map.metrics_snapshot()["misses"] for one_map in self.maps())
+
+    def metrics_snapshot(self) -> dict[str, Any]:
+        """Per-map metrics under "maps" (keyed by map type name) and their sum under "total"."""
+        maps = {map_label(items_type): one_map.metrics_snapshot() for items_type, one_map in list(self._maps.items())}
+        return {"maps": maps, "total": merge_snapshots(maps.values())}
+
+    def prometheus(self) -> str:
+        """Metrics of every map in the Prometheus text format, labelled with map="<type name>"."""
+        return to_prometheus(self.metrics_snapshot()["maps"])
 
     def stats(self) -> dict[str, Any]:
-        return {
+        stats = {
             "hits": self.hits(),
             "misses": self.misses(),
             "maps": {one_map.internal_type: one_map.stats() for one_map in self._maps.values()},
         }
+        if self._budget is not None:
+            stats["budget"] = self._budget.stats()
+        return stats
 
     def __len__(self) -> int:
         return len(self._maps)
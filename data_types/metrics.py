@@ -0,0 +1,270 @@
+import bisect
+import threading
+import weakref
+from typing import Any, Callable, Iterable, Mapping
+
+# Upper bounds (seconds) of the loader latency histogram buckets, as in the Prometheus client defaults.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _ThreadCells:
+    """
+    Per-thread accumulators: every thread adds into a cell (a list of numbers) only it writes to, so updates
+    need no lock; reads sum all cells. The cell of a finished thread is folded into the retired totals.
+    """
+
+    def __init__(self, width: int):
+        self._width: int = width
+        self._local: threading.local = threading.local()
+        self._lock: threading.Lock = threading.Lock()
+        # id(cell) -> (cell, weak reference to its thread, whose callback retires the cell).
+        self._cells: dict[int, tuple[list, weakref.ref]] = {}
+        self._retired: list = [0] * width
+
+    def _new_cell(self) -> list:
+        cell = [0] * self._width
+        self._local.cell = cell
+        thread_ref = weakref.ref(threading.current_thread(), lambda _: self._retire(cell))
+        with self._lock:
+            self._cells[id(cell)] = (cell, thread_ref)
+        return cell
+
+    def _retire(self, cell: list) -> None:
+        with self._lock:
+            if self._cells.pop(id(cell), None) is not None:
+                for index, value in enumerate(cell):
+                    self._retired[index] += value
+
+    def totals(self) -> list:
+        with self._lock:
+            cells = [cell for cell, _ in self._cells.values()]
+            totals = list(self._retired)
+        for cell in cells:
+            for index, value in enumerate(cell):
+                totals[index] += value
+        return totals
+
+    def reset(self) -> None:
+        with self._lock:
+            self._retired = [0] * self._width
+            for cell, _ in self._cells.values():
+                cell[:] = [0] * self._width
+
+
+class Counter(_ThreadCells):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount: int | float = 1) -> None:
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell[0] += amount
+
+    @property
+    def value(self) -> int | float:
+        return self.totals()[0]
+
+
+class Histogram(_ThreadCells):
+    """Bucketed distribution of observed values; a cell holds the bucket counts followed by the sum."""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self._bounds: tuple[float, ...] = tuple(sorted(buckets))
+        # One count per bound, one for +Inf and the sum of all observations.
+        super().__init__(len(self._bounds) + 2)
+
+    def observe(self, value: float) -> None:
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell[bisect.bisect_left(self._bounds, value)] += 1
+        cell[-1] += value
+
+    def snapshot(self) -> dict[str, Any]:
+        """Cumulative bucket counts keyed by upper bound (Prometheus "le"), the sum and the count."""
+        totals = self.totals()
+        buckets, count = {}, 0
+        for bound, bucket in zip((*self._bounds, float("inf")), totals):
+            count += bucket
+            buckets[bound] = count
+        return {"buckets": buckets, "sum": totals[-1], "count": count}
+
+
+class CacheMetrics:
+    """
+    Counters, the loader latency histogram and gauges of one map. Counters are per-thread accumulators, so
+    recording costs no lock; snapshot() reads everything into a plain dict, see merge_snapshots() and
+    to_prometheus() for aggregating and exporting it.
+    """
+
+    EVICTION_REASONS = ("capacity", "bytes", "gc")
+
+    def __init__(self):
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self.negative_hits: Counter = Counter()
+        self.stale_hits: Counter = Counter()
+        self.l2_hits: Counter = Counter()
+        self.l2_misses: Counter = Counter()
+        self.evictions: dict[str, Counter] = {reason: Counter() for reason in self.EVICTION_REASONS}
+        self.rejections: Counter = Counter()
+        self.expirations: Counter = Counter()
+        self.invalidations: Counter = Counter()
+        self.invalidated: Counter = Counter()
+        self.collected: Counter = Counter()
+        self.loads: Counter = Counter()
+        self.load_errors: Counter = Counter()
+        self.refreshes: Counter = Counter()
+        self.refresh_errors: Counter = Counter()
+        self.load_seconds: Histogram = Histogram()
+        self._gauges: dict[str, Callable[[], int | float]] = {}
+
+    def gauge(self, name: str, read: Callable[[], int | float]) -> None:
+        """Register a gauge, read when a snapshot is taken."""
+        self._gauges[name] = read
+
+    def record_load(self, seconds: float, failed: bool = False) -> None:
+        self.loads.inc()
+        if failed:
+            self.load_errors.inc()
+        self.load_seconds.observe(seconds)
+
+    @property
+    def eviction_count(self) -> int:
+        return sum(counter.value for counter in self.evictions.values())
+
+    def snapshot(self) -> dict[str, Any]:
+        snapshot = {
+            "hits": self.hits.value,
+            "misses": self.misses.value,
+            "negative_hits": self.negative_hits.value,
+            "stale_hits": self.stale_hits.value,
+            "l2_hits": self.l2_hits.value,
+            "l2_misses": self.l2_misses.value,
+            "evictions": {reason: counter.value for reason, counter in self.evictions.items()},
+            "rejections": self.rejections.value,
+            "expirations": self.expirations.value,
+            "invalidations": self.invalidations.value,
+            "invalidated": self.invalidated.value,
+            "collected": self.collected.value,
+            "loads": self.loads.value,
+            "load_errors": self.load_errors.value,
+            "refreshes": self.refreshes.value,
+            "refresh_errors": self.refresh_errors.value,
+            "load_seconds": self.load_seconds.snapshot(),
+        }
+        for name, read in self._gauges.items():
+            snapshot[name] = read()
+        return snapshot
+
+    def reset(self) -> None:
+        for counter in (
+            self.hits,
+            self.misses,
+            self.negative_hits,
+            self.stale_hits,
+            self.l2_hits,
+            self.l2_misses,
+            self.rejections,
+            self.expirations,
+            self.invalidations,
+            self.invalidated,
+            self.collected,
+            self.loads,
+            self.load_errors,
+            self.refreshes,
+            self.refresh_errors,
+            self.load_seconds,
+            *self.evictions.values(),
+        ):
+            counter.reset()
+
+
+def merge_snapshots(snapshots: Iterable[Mapping[str, Any]]) -> dict[str, Any]:
+    """Add snapshots up key by key (nested dicts included); gauges such as entries add up as well."""
+    merged: dict[str, Any] = {}
+    for snapshot in snapshots:
+        for name, value in snapshot.items():
+            if isinstance(value, Mapping):
+                merged[name] = merge_snapshots([merged.get(name, {}), value])
+            elif value is not None:
+                merged[name] = merged.get(name, 0) + value
+    return merged
+
+
+# Exported metrics: snapshot key -> (Prometheus type, help text).
+_METRICS = {
+    "hits": ("counter", "Lookups served from the cache."),
+    "misses": ("counter", "Lookups not served from the cache."),
+    "negative_hits": ("counter", "Lookups answered by a cached known absent key."),
+    "stale_hits": ("counter", "Expired items served while they were reloaded."),
+    "l2_hits": ("counter", "Misses served from the disk tier instead of the loader."),
+    "l2_misses": ("counter", "Misses the disk tier did not hold either."),
+    "evictions": ("counter", "Entries evicted, by reason."),
+    "rejections": ("counter", "Entries refused by admission or for exceeding max_bytes."),
+    "expirations": ("counter", "Entries removed after their TTL."),
+    "invalidations": ("counter", "Tag invalidations."),
+    "invalidated": ("counter", "Entries removed because one of their tags was invalidated."),
+    "collected": ("counter", "Entries of weak maps removed after their item was garbage collected."),
+    "loads": ("counter", "Loader calls."),
+    "load_errors": ("counter", "Loader calls that raised."),
+    "refreshes": ("counter", "Background reloads completed."),
+    "refresh_errors": ("counter", "Background reloads that failed."),
+    "load_seconds": ("histogram", "Loader latency in seconds."),
+    "entries": ("gauge", "Entries currently cached."),
+    "bytes": ("gauge", "Measured size of the cached entries."),
+}
+
+
+def map_label(internal_type: Any) -> str:
+    """Label value of a map: the name of its item type."""
+    return getattr(internal_type, "__name__", str(internal_type))
+
+
+def _labels(labels: Mapping[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: int | float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def to_prometheus(
+    snapshots: Mapping[str, Mapping[str, Any]], prefix: str = "identity_map", label: str = "map"
+) -> str:
+    """Render snapshots, keyed by the value of label, in the Prometheus text exposition format."""
+    lines = []
+    for name, (kind, help_text) in _METRICS.items():
+        metric = f"{prefix}_{name}_total" if kind == "counter" else f"{prefix}_{name}"
+        samples = []
+        for label_value, snapshot in snapshots.items():
+            if name not in snapshot:
+                continue
+            value, labels = snapshot[name], {label: label_value}
+            if kind == "histogram":
+                for bound, count in value["buckets"].items():
+                    samples.append(f"{metric}_bucket{_labels(labels | {'le': _number(bound)})} {count}")
+                samples.append(f"{metric}_sum{_labels(labels)} {_number(value['sum'])}")
+                samples.append(f"{metric}_count{_labels(labels)} {value['count']}")
+            elif isinstance(value, Mapping):
+                for reason, count in value.items():
+                    samples.append(f"{metric}{_labels(labels | {'reason': reason})} {_number(count)}")
+            else:
+                samples.append(f"{metric}{_labels(labels)} {_number(value)}")
+        if samples:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.extend(samples)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,452 @@
+import hashlib
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Iterator
+
+from .metrics import CacheMetrics
+
+try:
+    import fcntl
+except ImportError:
+    # Not POSIX: the module still imports, SharedIdentityMap refuses to be created.
+    fcntl = None
+
+MAGIC = b"PTKSHMAP"
+VERSION = 1
+
+# Header fields, one unsigned 64-bit integer each after the magic.
+_U64 = struct.Struct("<Q")
+_VERSION, _SLOTS, _DATA_SIZE, _MAX_ITEMS, _SEQUENCE, _COUNT, _DATA_END, _LIVE_BYTES, _HAND = range(8, 80, 8)
+HEADER_SIZE = 128
+# hash, data offset, key length, value length, deadline (monotonic ms, 0 for none), used, referenced
+_SLOT = struct.Struct("<QQIIqBB6x")
+_USED, _REFERENCED = 32, 33
+_EMPTY_SLOT = bytes(_SLOT.size)
+
+
+def _shared_memory(name: str, create: bool, size: int = 0) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name, create=create, size=size, track=False)
+    except TypeError:
+        # Before Python 3.13 every process attaching a segment would unlink it at exit.
+        memory = shared_memory.SharedMemory(name, create=create, size=size)
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+# Maps open in this process: a forked child reopens their lock files, see _after_fork_in_child().
+_open_maps: "weakref.WeakSet[SharedIdentityMap]" = weakref.WeakSet()
+
+
+def _after_fork_in_child() -> None:
+    for one_map in list(_open_maps):
+        one_map._reopen_lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _key_hash(key_bytes: bytes) -> int:
+    # Stable across processes, unlike hash() of a str.
+    return int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), "little")
+
+
+class SharedIdentityMap:
+    """
+    Identity map in a named shared memory segment, shared by the processes of a host (e.g. the pre-fork
+    workers of a server): one copy of every item and one hit rate instead of one per worker.
+
+    Keys and values are stored pickled, keys being compared by their pickled form, in a data area indexed
+    by an open addressing (linear probing) hash table. Writers serialize on a lock file (flock) and bump
+    a sequence number around every change; readers take no lock but retry when the sequence moved under
+    them (a seqlock). Full maps evict with CLOCK, readers marking the entries they hit as referenced.
+    A writer dying halfway leaves the sequence odd, and the next writer starts the map over empty.
+
+    The first process creates the segment with max_items and max_bytes, later ones attach to it and use its
+    geometry. It outlives the processes until unlink() is called. The lock file is {name}.lock in lock_dir,
+    the temporary directory by default; all the processes sharing the map must use the same one. A map created
+    before a fork (e.g. in the master of a preloading server) can be used as is by the children: each one
+    reopens the lock file, as flock does not exclude processes sharing an open file. Needs fcntl (POSIX).
+    """
+
+    LOAD_FACTOR = 0.75
+    # Data area per item when max_bytes is not given.
+    ENTRY_BYTES = 512
+    # Items larger than this share of the data area are not cached.
+    MAX_ENTRY_SHARE = 0.25
+    # Optimistic reads attempted before a reader falls back to the lock.
+    READ_RETRIES = 64
+
+    def __init__(
+        self,
+        name: str,
+        max_items: int = 10_000,
+        max_bytes: int | None = None,
+        internal_type: Any = None,
+        lock_dir: str | None = None,
+    ):
+        if fcntl is None:
+            raise RuntimeError("SharedIdentityMap needs fcntl.flock(), which this platform does not have")
+        if max_items < 1:
+            raise ValueError(f"max_items must be a positive integer, not {max_items}")
+        self._name: str = name
+        self._internal_type: Any = internal_type
+        self._thread_lock: threading.Lock = threading.Lock()
+        self._lock_path: str = os.path.join(lock_dir or tempfile.gettempdir(), f"{name}.lock")
+        self._lock_file = open(self._lock_path, "a+b")
+        self._metrics: CacheMetrics = CacheMetrics()
+        with self._locked():
+            try:
+                slots = 1 << max(3, (int(max_items / self.LOAD_FACTOR) - 1).bit_length())
+                data_size = max_bytes or max_items * self.ENTRY_BYTES
+                self._memory = _shared_memory(name, True, HEADER_SIZE + slots * _SLOT.size + data_size)
+                self._buffer: memoryview = self._memory.buf
+                self._buffer[:8] = MAGIC
+                for field, value in ((_VERSION, VERSION), (_SLOTS, slots), (_DATA_SIZE, data_size)):
+                    self._set(field, value)
+                self._set(_MAX_ITEMS, max_items)
+            except FileExistsError:
+                self._memory = _shared_memory(name, False)
+                self._buffer = self._memory.buf
+                if bytes(self._buffer[:8]) != MAGIC or self._get(_VERSION) != VERSION:
+                    self.close()
+                    raise ValueError(f"Shared memory {name!r} does not hold a SharedIdentityMap of version {VERSION}")
+        self._slots: int = self._get(_SLOTS)
+        self._mask: int = self._slots - 1
+        self._data_size: int = self._get(_DATA_SIZE)
+        self._max_items: int = self._get(_MAX_ITEMS)
+        self._data: int = HEADER_SIZE + self._slots * _SLOT.size
+        self._metrics.gauge("entries", self.__len__)
+        self._metrics.gauge("bytes", lambda: self._get(_LIVE_BYTES))
+        _open_maps.add(self)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def lock_path(self) -> str:
+        return self._lock_path
+
+    @property
+    def internal_type(self) -> Any:
+        return self._internal_type
+
+    @property
+    def max_items(self) -> int:
+        return self._max_items
+
+    @property
+    def max_bytes(self) -> int:
+        return self._data_size
+
+    @property
+    def bytes(self) -> int:
+        return self._get(_LIVE_BYTES)
+
+    def _get(self, field: int) -> int:
+        return _U64.unpack_from(self._buffer, field)[0]
+
+    def _set(self, field: int, value: int) -> None:
+        _U64.pack_into(self._buffer, field, value)
+
+    def _reopen_lock(self) -> None:
+        # The child of a fork shares the parent's open lock file, and flock() would let both write at once;
+        # the thread lock may have been copied held by a thread that does not exist in the child.
+        self._thread_lock = threading.Lock()
+        if not self._lock_file.closed:
+            self._lock_file.close()
+            self._lock_file = open(self._lock_path, "a+b")
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        # flock excludes other processes, the thread lock the other threads of this one.
+        with self._thread_lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        with self._locked():
+            sequence = self._get(_SEQUENCE)
+            if sequence & 1:
+                # The last writer died halfway: the index cannot be trusted.
+                self._reset()
+            else:
+                sequence += 1
+                self._set(_SEQUENCE, sequence)
+            try:
+                yield
+            finally:
+                self._set(_SEQUENCE, sequence + 1)
+
+    def validate_item(self, data: Any) -> bool:
+        return self._internal_type is None or isinstance(data, self._internal_type)
+
+    @staticmethod
+    def _now() -> int:
+        # CLOCK_MONOTONIC is system-wide, so deadlines mean the same in every process.
+        return time.monotonic_ns() // 1_000_000
+
+    def _slot(self, index: int) -> int:
+        return HEADER_SIZE + index * _SLOT.size
+
+    def _find(self, hashed: int, key_bytes: bytes) -> int:
+        buffer, data, index = self._buffer, self._data, hashed & self._mask
+        for _ in range(self._slots):
+            slot_hash, offset, key_length, _, _, used, _ = _SLOT.unpack_from(buffer, self._slot(index))
+            if not used:
+                return -1
+            if slot_hash == hashed and buffer[data + offset : data + offset + key_length] == key_bytes:
+                return index
+            index = (index + 1) & self._mask
+        return -1
+
+    def _entry(self, index: int) -> tuple[int, bytes, int]:
+        _, offset, key_length, value_length, deadline, _, _ = _SLOT.unpack_from(self._buffer, self._slot(index))
+        start = self._data + offset + key_length
+        return index, bytes(self._buffer[start : start + value_length]), deadline
+
+    def _read(self, hashed: int, key_bytes: bytes) -> tuple[int, bytes, int] | None:
+        """(slot, value bytes, deadline) of a key, None when missing."""
+        for _ in range(self.READ_RETRIES):
+            sequence = self._get(_SEQUENCE)
+            if sequence & 1:
+                time.sleep(0)
+                continue
+            found = self._find(hashed, key_bytes)
+            entry = self._entry(found) if found >= 0 else None
+            if self._get(_SEQUENCE) == sequence:
+                return entry
+        # Writers keep changing the map under us (or one died): read under the lock.
+        with self._writing():
+            found = self._find(hashed, key_bytes)
+            return self._entry(found) if found >= 0 else None
+
+    def has(self, key: Any) -> bool:
+        key_bytes = pickle.dumps(key, 5)
+        found = self._read(_key_hash(key_bytes), key_bytes)
+        return found is not None and not (found[2] and found[2] <= self._now())
+
+    def get(self, key: Any) -> Any | None:
+        key_bytes = pickle.dumps(key, 5)
+        found = self._read(_key_hash(key_bytes), key_bytes)
+        if found is None or (found[2] and found[2] <= self._now()):
+            self._metrics.misses.inc()
+            return None
+        # A racy single byte store: at worst it marks the entry that took the slot meanwhile.
+        self._buffer[self._slot(found[0]) + _REFERENCED] = 1
+        self._metrics.hits.inc()
+        return pickle.loads(found[1])
+
+    def add(self, key: Any, data: Any, ttl: int | float | None = None) -> None:
+        if not self.validate_item(data):
+            raise ValueError(f"Data must be instance of {self._internal_type}")
+        key_bytes, value_bytes = pickle.dumps(key, 5), pickle.dumps(data, 5)
+        size = len(key_bytes) + len(value_bytes)
+        hashed = _key_hash(key_bytes)
+        if size > self._data_size * self.MAX_ENTRY_SHARE:
+            self.remove(key)
+            self._metrics.rejections.inc()
+            return
+        deadline = self._now() + int(ttl * 1000) if ttl else 0
+        with self._writing():
+            found = self._find(hashed, key_bytes)
+            if found >= 0:
+                self._delete(found)
+            self._make_room(size)
+            offset = self._get(_DATA_END)
+            start = self._data + offset
+            self._buffer[start : start + len(key_bytes)] = key_bytes
+            self._buffer[start + len(key_bytes) : start + size] = value_bytes
+            self._set(_DATA_END, offset + size)
+            index = hashed & self._mask
+            while self._buffer[self._slot(index) + _USED]:
+                index = (index + 1) & self._mask
+            _SLOT.pack_into(
+                self._buffer, self._slot(index), hashed, offset, len(key_bytes), len(value_bytes), deadline, 1, 0
+            )
+            self._set(_COUNT, self._get(_COUNT) + 1)
+            self._set(_LIVE_BYTES, self._get(_LIVE_BYTES) + size)
+
+    def remove(self, key: Any) -> None:
+        key_bytes = pickle.dumps(key, 5)
+        hashed = _key_hash(key_bytes)
+        with self._writing():
+            found = self._find(hashed, key_bytes)
+            if found >= 0:
+                self._delete(found)
+
+    def get_or_fetch(self, key: Any, loader: Callable[[], Any], ttl: int | float | None = None) -> Any:
+        """
+        get(), calling loader() and adding its result on a miss. Misses are not coalesced across processes:
+        workers missing the same key at once each call the loader.
+        """
+        data = self.get(key)
+        if data is None:
+            started = time.perf_counter()
+            try:
+                data = loader()
+            except BaseException:
+                self._metrics.record_load(time.perf_counter() - started, failed=True)
+                raise
+            self._metrics.record_load(time.perf_counter() - started)
+            if data is not None:
+                self.add(key, data, ttl)
+        return data
+
+    def _delete(self, index: int) -> None:
+        """Empty a slot, shifting the following entries of its probe run back (no tombstones)."""
+        buffer, mask = self._buffer, self._mask
+        _, _, key_length, value_length, _, _, _ = _SLOT.unpack_from(buffer, self._slot(index))
+        self._set(_COUNT, self._get(_COUNT) - 1)
+        self._set(_LIVE_BYTES, self._get(_LIVE_BYTES) - key_length - value_length)
+        hole = following = index
+        while True:
+            following = (following + 1) & mask
+            position = self._slot(following)
+            if not buffer[position + _USED]:
+                break
+            home = _U64.unpack_from(buffer, position)[0] & mask
+            # The entry may fill the hole if the hole is not before its home slot in its probe run.
+            if (following - home) & mask >= (following - hole) & mask:
+                buffer[self._slot(hole) : self._slot(hole) + _SLOT.size] = buffer[position : position + _SLOT.size]
+                hole = following
+        buffer[self._slot(hole) : self._slot(hole) + _SLOT.size] = _EMPTY_SLOT
+
+    def _make_room(self, size: int) -> None:
+        now = self._now()
+        while self._get(_COUNT) >= self._max_items or self._get(_LIVE_BYTES) + size > self._data_size:
+            self._evict_one(now, "capacity" if self._get(_COUNT) >= self._max_items else "bytes")
+        if self._get(_DATA_END) + size > self._data_size:
+            self._compact()
+
+    def _evict_one(self, now: int, reason: str) -> None:
+        """CLOCK: sweep the slots, sparing referenced entries once; expired entries go first."""
+        buffer, hand = self._buffer, self._get(_HAND)
+        while True:
+            position = self._slot(hand)
+            _, _, _, _, deadline, used, referenced = _SLOT.unpack_from(buffer, position)
+            if used:
+                if deadline and deadline <= now:
+                    self._delete(hand)
+                    self._metrics.expirations.inc()
+                    break
+                if not referenced:
+                    self._delete(hand)
+                    self._metrics.evictions[reason].inc()
+                    break
+                buffer[position + _REFERENCED] = 0
+            hand = (hand + 1) & self._mask
+        # The deletion may have shifted another entry into the slot, it is looked at next.
+        self._set(_HAND, hand)
+
+    def _compact(self) -> None:
+        """Slide the live items to the start of the data area, closing the holes of removed ones."""
+        buffer, data = self._buffer, self._data
+        live = []
+        for index in range(self._slots):
+            _, offset, key_length, value_length, _, used, _ = _SLOT.unpack_from(buffer, self._slot(index))
+            if used:
+                live.append((offset, key_length + value_length, index))
+        end = 0
+        for offset, size, index in sorted(live):
+            if offset != end:
+                buffer[data + end : data + end + size] = bytes(buffer[data + offset : data + offset + size])
+                _U64.pack_into(buffer, self._slot(index) + 8, end)
+            end += size
+        self._set(_DATA_END, end)
+
+    def gc_run(self) -> int:
+        """Remove the expired entries and return how many there were."""
+        reclaimed = 0
+        with self._writing():
+            now = self._now()
+            index = 0
+            while index < self._slots:
+                _, _, _, _, deadline, used, _ = _SLOT.unpack_from(self._buffer, self._slot(index))
+                if used and deadline and deadline <= now:
+                    # The slot may now hold a shifted entry, so it is looked at again.
+                    self._delete(index)
+                    reclaimed += 1
+                else:
+                    index += 1
+        self._metrics.expirations.inc(reclaimed)
+        return reclaimed
+
+    def _reset(self) -> None:
+        self._buffer[HEADER_SIZE : self._data] = bytes(self._data - HEADER_SIZE)
+        for field in (_COUNT, _DATA_END, _LIVE_BYTES, _HAND):
+            self._set(field, 0)
+
+    def clear(self) -> None:
+        with self._writing():
+            self._reset()
+
+    def metrics_snapshot(self) -> dict[str, Any]:
+        """This process's counters, with the shared entry and byte counts."""
+        return self._metrics.snapshot()
+
+    def stats(self) -> dict[str, Any]:
+        metrics = self._metrics.snapshot()
+        hits, misses = metrics["hits"], metrics["misses"]
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits else 0,
+            "miss_rate": misses / (hits + misses) if misses else 0,
+            "count": len(self),
+            "max_items": self._max_items,
+            "bytes": self.bytes,
+            "max_bytes": self._data_size,
+            "evictions": sum(metrics["evictions"].values()),
+            "expirations": metrics["expirations"],
+            "rejections": metrics["rejections"],
+        }
+
+    def __len__(self) -> int:
+        return self._get(_COUNT)
+
+    def __iter__(self) -> Iterator[Any]:
+        keys = []
+        with self._locked():
+            for index in range(self._slots):
+                _, offset, key_length, _, _, used, _ = _SLOT.unpack_from(self._buffer, self._slot(index))
+                if used:
+                    keys.append(bytes(self._buffer[self._data + offset : self._data + offset + key_length]))
+        return iter([pickle.loads(key) for key in keys])
+
+    def close(self) -> None:
+        """Detach this process; the map lives on for the others."""
+        _open_maps.discard(self)
+        self._buffer = None
+        self._memory.close()
+        self._lock_file.close()
+
+    def unlink(self) -> None:
+        """Destroy the shared segment, once no process needs the map any more."""
+        if not hasattr(self._memory, "_track"):
+            # Before Python 3.13 unlink() unregisters the segment, which _shared_memory() already did.
+            resource_tracker.register(self._memory._name, "shared_memory")
+        self._memory.unlink()
+        try:
+            os.unlink(self._lock_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "SharedIdentityMap":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,110 @@
+import threading
+from typing import Any, Callable, Hashable, Iterable
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error", "waiters")
+
+    def __init__(self):
+        self.done: threading.Event = threading.Event()
+        self.value: Any = None
+        self.error: BaseException | None = None
+        self.waiters: int = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls per key: the first caller runs the function, callers arriving while it
+    runs wait for it and share its result or exception instead of calling the function again.
+    """
+
+    def __init__(self):
+        self._lock: threading.Lock = threading.Lock()
+        self._flights: dict[Hashable, _Flight] = {}
+        self._coalesced: int = 0
+
+    @property
+    def coalesced(self) -> int:
+        """How many calls waited on another caller's flight instead of running their own."""
+        return self._coalesced
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def do(self, key: Hashable, func: Callable[[], Any], timeout: float | None = None) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+            else:
+                flight.waiters += 1
+                self._coalesced += 1
+                leader = False
+
+        if leader:
+            try:
+                flight.value = func()
+            except BaseException as error:
+                flight.error = error
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+            return flight.value
+
+        if not flight.done.wait(timeout):
+            raise TimeoutError(f"Timed out after {timeout}s waiting for the in-flight load of {key!r}")
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def do_many(
+        self, keys: Iterable[Hashable], func: Callable[[list[Hashable]], dict], timeout: float | None = None
+    ) -> dict:
+        """
+        Batch variant of do(): func(keys) -> dict is called once for the keys nobody is loading yet,
+        keys already in flight (single or batch) are waited for. Keys missing from func's result map to None.
+        """
+        led: dict[Hashable, _Flight] = {}
+        waiting: dict[Hashable, _Flight] = {}
+        with self._lock:
+            for key in keys:
+                if key in led or key in waiting:
+                    continue
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = led[key] = self._flights[key] = _Flight()
+                else:
+                    flight.waiters += 1
+                    self._coalesced += 1
+                    waiting[key] = flight
+
+        results = {}
+        if led:
+            try:
+                loaded = func(list(led))
+                for key, flight in led.items():
+                    flight.value = results[key] = loaded.get(key)
+            except BaseException as error:
+                for flight in led.values():
+                    flight.error = error
+                raise
+            finally:
+                with self._lock:
+                    for key in led:
+                        del self._flights[key]
+                for flight in led.values():
+                    flight.done.set()
+
+        for key, flight in waiting.items():
+            if not flight.done.wait(timeout):
+                raise TimeoutError(f"Timed out after {timeout}s waiting for the in-flight load of {key!r}")
+            if flight.error is not None:
+                raise flight.error
+            results[key] = flight.value
+        return results
@@ -0,0 +1,67 @@
+import enum
+import logging
+import sys
+import types
+from typing import Any, Callable
+
+Sizer = Callable[[Any], int]
+
+# Objects the whole process shares rather than an entry owns: deep_sizeof() neither counts nor walks them.
+_SHARED_TYPES = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+    types.CodeType,
+    enum.Enum,
+    logging.Logger,
+    logging.LoggerAdapter,
+    logging.Handler,
+)
+
+
+def shallow_sizeof(data: Any) -> int:
+    """Size of the object itself, as reported by sys.getsizeof()."""
+    return sys.getsizeof(data)
+
+
+def dunder_sizeof(data: Any) -> int:
+    """Size reported by the object's own __sizeof__(), which lets entities account for their payload."""
+    return data.__sizeof__()
+
+
+def deep_sizeof(data: Any) -> int:
+    """
+    Size of the object and everything reachable through containers, __dict__ and __slots__, each counted once.
+    Modules, classes, functions, methods, enum members and loggers are left out, as pympler's asizeof() does.
+    An object shared by several entries is still charged to each of them: the sizes of a map's entries add up
+    to more than the memory they hold together.
+    """
+    seen: set[int] = set()
+    size = 0
+    stack = [data]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, _SHARED_TYPES):
+            continue
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        if hasattr(obj, "__dict__"):
+            stack.append(obj.__dict__)
+        for cls in type(obj).__mro__:
+            slots = getattr(cls, "__slots__", ())
+            for name in (slots,) if isinstance(slots, str) else slots:
+                if name not in ("__dict__", "__weakref__") and hasattr(obj, name):
+                    stack.append(getattr(obj, name))
+    return size
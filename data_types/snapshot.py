@@ -0,0 +1,179 @@
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from typing import Any, BinaryIO, Callable, Iterator, Mapping
+
+MAGIC = b"PTKSNAP\x00"
+VERSION = 1
+# magic, version
+HEADER = struct.Struct("<8sH")
+# pickle length, number of out-of-band buffers
+FRAME = struct.Struct("<QI")
+BUFFER = struct.Struct("<Q")
+# Out-of-band buffers start at this alignment, so array-like values can use them in place.
+BUFFER_ALIGNMENT = 64
+# Snapshot records pickled together in one frame.
+FRAME_ENTRIES = 512
+
+# (key, value, remaining TTL in seconds or None, tags or None)
+Record = tuple[Any, Any, float | None, tuple[str, ...] | None]
+
+
+class _FrameWriter:
+    def __init__(self, file: BinaryIO):
+        self._file: BinaryIO = file
+        self._file.write(HEADER.pack(MAGIC, VERSION))
+
+    def write(self, obj: Any) -> None:
+        buffers = []
+        data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+        raws = [buffer.raw() for buffer in buffers]
+        self._file.write(FRAME.pack(len(data), len(raws)))
+        self._file.write(data)
+        for raw in raws:
+            self._file.write(BUFFER.pack(raw.nbytes))
+            self._file.write(b"\0" * (-self._file.tell() % BUFFER_ALIGNMENT))
+            self._file.write(raw)
+
+
+def read_frames(path: str) -> Iterator[Any]:
+    """
+    Unpickle the frames of a snapshot one at a time from a read-only mmap of the file. Out-of-band buffers
+    are handed to pickle as views of the mapping, which stays open while unpickled values refer to it.
+    """
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    magic, version = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a snapshot of version {VERSION}")
+    offset = HEADER.size
+    while offset < len(view):
+        length, count = FRAME.unpack_from(view, offset)
+        offset += FRAME.size
+        data = view[offset : offset + length]
+        offset += length
+        buffers = []
+        for _ in range(count):
+            (size,) = BUFFER.unpack_from(view, offset)
+            offset += BUFFER.size
+            offset += -offset % BUFFER_ALIGNMENT
+            buffers.append(view[offset : offset + size])
+            offset += size
+        yield pickle.loads(data, buffers=buffers)
+
+
+def save_snapshot(path: str, maps: Mapping[Any, Any], frame_entries: int = FRAME_ENTRIES) -> int:
+    """
+    Write the live entries of maps ({items type: map}) to path and return how many were written. Each map's
+    entries are taken under its lock, newest first, then pickled outside of it; the file is written next to
+    path and moved over it when complete, so a crash never leaves a truncated snapshot behind.
+    """
+    temporary = f"{path}.tmp"
+    written = 0
+    with open(temporary, "wb") as file:
+        writer = _FrameWriter(file)
+        writer.write({"created": time.time(), "maps": list(maps)})
+        for items_type, one_map in maps.items():
+            records = one_map._snapshot_records()
+            captured = time.time()
+            for start in range(0, len(records), frame_entries):
+                writer.write((items_type, captured, records[start : start + frame_entries]))
+            written += len(records)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    return written
+
+
+class SnapshotRestore:
+    """
+    Warm start from a snapshot: frames are read and added to their maps one by one, on a daemon thread
+    unless started with background=False, while the maps already serve. Restored entries go behind the
+    cached ones, remaining TTLs keep running from the moment of the snapshot, and keys written, removed or
+    marked absent meanwhile, or whose tags get invalidated, are not restored.
+    """
+
+    def __init__(self, path: str, resolve: Callable[[Any], Any], name: str = "identity-maps-restore"):
+        self._path: str = path
+        # items type -> the map to restore it into
+        self._resolve: Callable[[Any], Any] = resolve
+        self._name: str = name
+        self._thread: threading.Thread | None = None
+        self._done: threading.Event = threading.Event()
+        self._cancelled: bool = False
+        self._restored: int = 0
+        self._skipped: int = 0
+        self._error: BaseException | None = None
+        self._started: float | None = None
+        self._finished: float | None = None
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def restored(self) -> int:
+        return self._restored
+
+    @property
+    def error(self) -> BaseException | None:
+        return self._error
+
+    def start(self, background: bool = True) -> "SnapshotRestore":
+        if background:
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+        else:
+            self._run()
+        return self
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._done.wait(timeout)
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+    def _run(self) -> None:
+        self._started = time.monotonic()
+        maps = {}
+        try:
+            frames = read_frames(self._path)
+            header = next(frames)
+            for items_type in header["maps"]:
+                maps[items_type] = self._resolve(items_type)
+                maps[items_type]._begin_restore()
+            full = set()
+            for items_type, captured, records in frames:
+                if self._cancelled:
+                    break
+                if items_type in full:
+                    self._skipped += len(records)
+                    continue
+                restored, more = maps[items_type]._restore_records(records, time.time() - captured)
+                self._restored += restored
+                self._skipped += len(records) - restored
+                if not more:
+                    full.add(items_type)
+        except Exception as exc:
+            self._error = exc
+        finally:
+            for one_map in maps.values():
+                one_map._end_restore()
+            self._finished = time.monotonic()
+            self._done.set()
+
+    def stats(self) -> dict[str, Any]:
+        elapsed = None
+        if self._started is not None:
+            elapsed = (self._finished or time.monotonic()) - self._started
+        return {
+            "done": self.done,
+            "restored": self._restored,
+            "skipped": self._skipped,
+            "seconds": elapsed,
+            "error": repr(self._error) if self._error is not None else None,
+        }
@@ -1,10 +1,23 @@
-from typing import List
+from collections import deque
+from typing import Callable, Iterable, List
 
 
 class TagsManager:
+    """
+    Forward and reverse tag indexes with tag generations: every key remembers the generation of each of its
+    tags, so invalidating a tag is O(1) - bump the generation and set the tag's keys aside. Keys tagged with an
+    older generation are stale; pop_invalidated() hands the set-aside keys out in batches for reclamation.
+
+    Generations are taken from a single epoch counter, so an owner keeping the tags of its keys itself can use
+    only the reverse index (link()/unlink()) and remember one epoch per key instead of one generation per tag.
+    """
+
     def __init__(self):
         self._tags: dict[str, set(str | int)] = {}
-        self._key_to_tags: dict[str | int, set(str)] = {}
+        self._key_to_tags: dict[str | int, dict[str, int]] = {}
+        self._generations: dict[str, int] = {}
+        self._epoch: int = 0
+        self._invalidated: deque[set[str | int]] = deque()
 
     @property
     def tags(self) -> set[str]:
@@ -20,21 +33,47 @@ class TagsManager:
     def key_exists(self, key: str | int) -> bool:
         return key in self._key_to_tags
 
+    @property
+    def epoch(self) -> int:
+        """Generation given to the latest invalidated tag."""
+        return self._epoch
+
+    def generation(self, tag: str) -> int:
+        return self._generations.get(tag, 0)
+
+    def link(self, key: str | int, tags: Iterable[str]) -> None:
+        """Add key to the reverse index of tags only."""
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is None:
+                keys = self._tags[tag] = set()
+            keys.add(key)
+
+    def unlink(self, key: str | int, tags: Iterable[str]) -> None:
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
     def set_tag(self, key: str | int, tag: str) -> None:
         if not self.tag_exists(tag):
             self._tags[tag] = set()
         self._tags[tag].add(key)
-        self._key_to_tags[key] = self._key_to_tags.get(key, set())
-        self._key_to_tags[key].add(tag)
+        self._key_to_tags[key] = self._key_to_tags.get(key, {})
+        self._key_to_tags[key][tag] = self.generation(tag)
 
     def remove_tag(self, key: str | int, tag: str, with_clean=True) -> None:
-        if self.tag_exists(tag) and key in self._key_to_tags.get(key, set()):
-            self._tags[tag].remove(key)
-            if with_clean:
-                self._key_to_tags[key].remove(tag)
+        if self.tag_exists(tag) and tag in self._key_to_tags.get(key, {}):
+            self._tags[tag].discard(key)
+            if not self._tags[tag]:
+                del self._tags[tag]
+        if with_clean and tag in self._key_to_tags.get(key, {}):
+            del self._key_to_tags[key][tag]
 
     def get_tags_for_key(self, key: str | int) -> List[str]:
-        return list(self._key_to_tags.get(key, set()))
+        return list(self._key_to_tags.get(key, {}))
 
     def get_keys_for_tag(self, tag: str) -> List[str]:
         return list(self._tags.get(tag, set()))
@@ -46,9 +85,65 @@ class TagsManager:
                 self.remove_tag(key, tag, with_clean=False)
             del self._key_to_tags[key]
 
+    def invalidate_tag(self, tag: str) -> None:
+        self._epoch += 1
+        self._generations[tag] = self._epoch
+        keys = self._tags.pop(tag, None)
+        if keys:
+            self._invalidated.append(keys)
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        for tag in tags:
+            self.invalidate_tag(tag)
+
+    def is_stale(self, key: str | int) -> bool:
+        """Whether one of the key's tags was invalidated after the key was tagged."""
+        tags = self._key_to_tags.get(key)
+        if not tags:
+            return False
+        generations = self._generations
+        for tag, generation in tags.items():
+            if generations.get(tag, 0) != generation:
+                return True
+        return False
+
+    def is_stale_since(self, tags: Iterable[str], epoch: int) -> bool:
+        """Whether one of tags was invalidated after the given epoch."""
+        if epoch == self._epoch:
+            return False
+        generations = self._generations
+        for tag in tags:
+            if generations.get(tag, 0) > epoch:
+                return True
+        return False
+
+    def has_invalidated(self) -> bool:
+        return len(self._invalidated) > 0
+
+    def pop_invalidated(
+        self, limit: int, is_stale: Callable[[str | int], bool] | None = None
+    ) -> List[str | int]:
+        """
+        Remove up to limit keys of invalidated tags and return those still stale (by is_stale if given); the others
+        were written again or removed since. The work is bounded by limit whatever the share of stale keys.
+        """
+        is_stale = is_stale or self.is_stale
+        keys = []
+        while self._invalidated and limit > 0:
+            pending = self._invalidated[0]
+            while pending and limit > 0:
+                key = pending.pop()
+                limit -= 1
+                if is_stale(key):
+                    keys.append(key)
+            if not pending:
+                self._invalidated.popleft()
+        return keys
+
     def clear(self) -> None:
         self._tags.clear()
         self._key_to_tags.clear()
+        self._invalidated.clear()
 
     def __len__(self) -> int:
         return len(self._tags)
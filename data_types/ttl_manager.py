@@ -1,95 +1,246 @@
-from datetime import datetime
-from sortedcontainers import SortedSet
+import math
+import time
+from itertools import chain
+from typing import Any, Callable, Iterator
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+LEVELS = 6  # 64 ** 6 ms is about 2.2 years, later deadlines wait in the overflow slot
 
 
 class TTLManager:
-    def __init__(self):
-        self._ttd: SortedSet = SortedSet()  # ttd = time to die
-        self._ttd_keys: dict[int, set(str | int)] = {}
-        self._keys_ttd: dict[str | int, int] = {}
-        self._ttd_to_gc: set = set()
-
-    def _set_ttd_key(self, ttd: int, key: str | int) -> None:
-        if ttd not in self._ttd_keys:
-            self._ttd_keys[ttd] = {key}
+    """
+    TTL index on a hierarchical timing wheel with millisecond resolution.
+
+    Deadlines (ttd, time to die) are integer milliseconds of a monotonic clock. A key is stored in exactly one
+    slot, chosen by the highest group of bits in which its deadline differs from the wheel cursor, so setting
+    and removing a TTL are O(1). Advancing the cursor cascades a key to a finer level at most LEVELS times
+    before it lands in the expired slot, from which pop_expired() streams keys out in batches. After a long
+    idle period crossing slots may cascade many keys: pop_expired(limit) places at most limit of them again
+    and leaves the rest to the following calls, cascaded counting them for the caller's budget.
+
+    With index_keys=False the key -> slot index is not kept: the wheel only schedules deadlines that its owner
+    tracks itself, and removes with unschedule(), the slot of a deadline following from the cursor. Queries by
+    key are not available then. Of two deadlines of one key meeting in a slot the earlier one is kept: the
+    owner compares a popped key with its own deadline and schedule()s it again if that one is still ahead.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic, index_keys: bool = True):
+        self._clock: Callable[[], float] = clock
+        self._cursor: int = self.now()
+        self._wheel: list[list[dict[Any, int] | None]] = [[None] * SLOTS for _ in range(LEVELS)]
+        self._overflow: dict[Any, int] = {}
+        self._expired: dict[Any, int] = {}
+        self._keys_slot: dict[Any, dict[Any, int]] | None = {} if index_keys else None
+        # A cascade cut short: the crossed slots whose keys are still to be placed again, by (level, index) as
+        # seen from the cursor they were taken at, the overflow being (LEVELS, 0).
+        self._cascading: dict[tuple[int, int], dict[Any, int]] = {}
+        self._cascade_cursor: int = self._cursor
+        self._cascaded: int = 0
+        # Keys set within the same millisecond share one deadline int object.
+        self._last_ttd: int = 0
+
+    def now(self) -> int:
+        """Current time of the TTL clock in milliseconds."""
+        return int(self._clock() * 1000)
+
+    def _place(self, key: str | int, ttd: int) -> None:
+        if ttd <= self._cursor:
+            slot = self._expired
         else:
-            self._ttd_keys[ttd].add(key)
-
-    def _remove_ttd_key(self, ttd: int, key: str | int) -> None:
-        if ttd in self._ttd_keys:
-            if key in self._ttd_keys[ttd]:
-                self._ttd_keys[ttd].remove(key)
+            level = ((ttd ^ self._cursor).bit_length() - 1) // SLOT_BITS
+            if level >= LEVELS:
+                slot = self._overflow
+            else:
+                index = (ttd >> (SLOT_BITS * level)) & SLOT_MASK
+                slot = self._wheel[level][index]
+                if slot is None:
+                    slot = self._wheel[level][index] = {}
+        if self._keys_slot is None:
+            if slot.get(key, ttd) >= ttd:
+                slot[key] = ttd
+            return
+        slot[key] = ttd
+        self._keys_slot[key] = slot
+
+    @property
+    def cascaded(self) -> int:
+        """Keys placed again in finer slots since the wheel was created."""
+        return self._cascaded
+
+    @property
+    def cascading(self) -> bool:
+        """Whether a cascade cut short is pending: pop_expired() may find nothing yet more keys are due."""
+        return bool(self._cascading)
+
+    @property
+    def _index(self) -> dict[Any, dict[Any, int]]:
+        if self._keys_slot is None:
+            raise RuntimeError("A TTLManager created with index_keys=False has no key index")
+        return self._keys_slot
+
+    @staticmethod
+    def _position(ttd: int, cursor: int) -> tuple[int, int] | None:
+        """(level, index) of the slot _place() puts ttd in seen from cursor, (LEVELS, 0) for the overflow."""
+        if ttd <= cursor:
+            return None
+        level = ((ttd ^ cursor).bit_length() - 1) // SLOT_BITS
+        if level >= LEVELS:
+            return LEVELS, 0
+        return level, (ttd >> (SLOT_BITS * level)) & SLOT_MASK
+
+    def _take_slots(self, level: int, first: int, last: int) -> None:
+        slots = self._wheel[level]
+        for index in range(first, last + 1):
+            slot = slots[index]
+            if slot:
+                self._cascading[(level, index)] = slot
+            slots[index] = None
+
+    def _cross(self, now: int) -> None:
+        """Move the cursor to now, setting aside the slots it crossed."""
+        cursor = self._cursor
+        top = ((cursor ^ now).bit_length() - 1) // SLOT_BITS
+        for level in range(min(top, LEVELS)):
+            self._take_slots(level, ((cursor >> (SLOT_BITS * level)) & SLOT_MASK) + 1, SLOT_MASK)
+        if top < LEVELS:
+            first = ((cursor >> (SLOT_BITS * top)) & SLOT_MASK) + 1
+            self._take_slots(top, first, (now >> (SLOT_BITS * top)) & SLOT_MASK)
+        elif self._overflow:
+            self._cascading[(LEVELS, 0)] = self._overflow
+            self._overflow = {}
+        self._cascade_cursor = cursor
+        self._cursor = now
+
+    def _advance(self, now: int, limit: int | None = None) -> int:
+        """
+        Move the cursor to now and place the keys of the slots it crossed again, at most limit of them; return
+        how many were placed. A cascade cut short resumes with the next call, before the cursor moves further.
+        """
+        moved = 0
+        while limit is None or moved < limit:
+            if not self._cascading:
+                if now <= self._cursor:
+                    break
+                self._cross(now)
+                continue
+            position, slot = next(iter(self._cascading.items()))
+            while slot and (limit is None or moved < limit):
+                key, ttd = slot.popitem()
+                self._place(key, ttd)
+                moved += 1
+            if not slot:
+                del self._cascading[position]
+        self._cascaded += moved
+        return moved
 
-    def get_ttd_keys(self, ttd: int) -> set[str]:
-        return self._ttd_keys.get(ttd, set())
+    def gc_run(self) -> None:
+        self._advance(self.now())
+
+    def set_ttd(self, key: str | int, ttl: int | float) -> int:
+        """Set a TTL of ttl seconds (fractions allowed) for key and return its deadline in milliseconds."""
+        self.remove_ttd(key)
+        expiration_time = self.now() + math.ceil(ttl * 1000)
+        if expiration_time == self._last_ttd:
+            expiration_time = self._last_ttd
+        else:
+            self._last_ttd = expiration_time
+        self._place(key, expiration_time)
+        return expiration_time
 
-    def _set_key_ttd(self, key: str | int, ttd: int) -> None:
-        self._keys_ttd[key] = ttd
+    def schedule(self, key: str | int, ttd: int) -> None:
+        """Set the deadline of key to ttd milliseconds of the TTL clock."""
+        self.remove_ttd(key)
+        self._place(key, ttd)
 
-    def _remove_key_ttd(self, key: str | int) -> None:
-        if key in self._keys_ttd:
-            del self._keys_ttd[key]
+    def remove_ttd(self, key: str | int) -> None:
+        if self._keys_slot is None:
+            return
+        slot = self._keys_slot.pop(key, None)
+        if slot is not None:
+            del slot[key]
+
+    def unschedule(self, key: str | int, ttd: int) -> None:
+        """Remove the ttd deadline of key, which needs no key index."""
+        if self._keys_slot is not None:
+            self.remove_ttd(key)
+            return
+        position = self._position(ttd, self._cursor)
+        if position is None:
+            slot = self._expired
+        elif position[0] == LEVELS:
+            slot = self._overflow
+        else:
+            slot = self._wheel[position[0]][position[1]]
+        if slot is not None and slot.get(key) == ttd:
+            del slot[key]
+        elif self._cascading and ttd > self._cascade_cursor:
+            # Still in a slot set aside by a cascade cut short.
+            slot = self._cascading.get(self._position(ttd, self._cascade_cursor))
+            if slot is not None and slot.get(key) == ttd:
+                del slot[key]
 
     def get_key_ttd(self, key: str | int) -> int | None:
-        return self._keys_ttd.get(key)
+        slot = self._index.get(key)
+        if slot is None:
+            return None
+        return slot[key]
 
-    def _to_gc(self, ttd: int) -> None:
-        self._ttd_to_gc.add(ttd)
-
-    def _from_gc(self, ttd: int) -> None:
-        if self._in_gc(ttd):
-            self._ttd_to_gc.remove(ttd)
-
-    def _in_gc(self, ttd: int) -> bool:
-        return ttd in self._ttd_to_gc
-
-    def gc_run(self) -> None:
-        for ttd in self._ttd_to_gc:
-            if ttd in self._ttd:
-                self._ttd.remove(ttd)
-        self._ttd_to_gc.clear()
-
-    def set_ttd(self, key: str | int, ttl: int) -> int:
-        current_time = int(datetime.now().timestamp())
-        expiration_time = current_time + ttl
-        self._ttd.add(expiration_time)
-        self._set_ttd_key(expiration_time, key)
-        self._set_key_ttd(key, expiration_time)
-        self._from_gc(expiration_time)
-        return expiration_time
-
-    def remove_ttd(self, key: str | int) -> None:
-        ttd = self.get_key_ttd(key)
-        if ttd is not None:
-            self._remove_ttd_key(ttd, key)
-            self._remove_key_ttd(key)
-            if len(self.get_ttd_keys(ttd)) == 0:
-                self._to_gc(ttd)
+    def get_ttd_keys(self, ttd: int) -> set[str]:
+        return {key for key, slot in self._index.items() if slot[key] == ttd}
+
+    def pop_expired(self, limit: int | None = None) -> list[str]:
+        """
+        Remove and return up to limit expired keys. Only the expired keys are touched, so calling
+        this repeatedly with a small limit streams them out without walking the whole index; the cascade
+        of the slots crossed meanwhile is bounded by limit as well.
+        """
+        self._advance(self.now(), limit)
+        expired = self._expired
+        count = len(expired) if limit is None else min(limit, len(expired))
+        keys = []
+        for _ in range(count):
+            key = expired.popitem()[0]
+            if self._keys_slot is not None:
+                del self._keys_slot[key]
+            keys.append(key)
+        return keys
 
     def get_expired_keys(self) -> list[str]:
-        current_time = int(datetime.now().timestamp())
-        expired_keys = []
-        for ttd in self._ttd:
-            if ttd > current_time:
-                break
-            expired_keys.extend(self.get_ttd_keys(ttd))
-        return expired_keys
+        self._advance(self.now())
+        return list(self._expired)
 
     def is_expired(self, key: str | int) -> bool:
-        ttd = self.get_key_ttd(key)
-        if ttd is None:
+        slot = self._index.get(key)
+        if slot is None:
             return False  # Not expired, since there is no TTL set.
-        current_time = int(datetime.now().timestamp())
-        return current_time >= ttd
+        return slot is self._expired or self.now() >= slot[key]
 
     def get_all_ttd(self) -> list[int]:
-        return list(self._ttd)
+        return sorted({slot[key] for key, slot in self._index.items()})
 
     def get_all_keys(self) -> list[str]:
-        return list(self._keys_ttd.keys())
+        return list(self._index)
 
     def clear(self) -> None:
-        self._ttd.clear()
-        self._ttd_keys.clear()
-        self._keys_ttd.clear()
-        self._ttd_to_gc.clear()
+        self._wheel = [[None] * SLOTS for _ in range(LEVELS)]
+        self._overflow = {}
+        self._expired = {}
+        self._cascading = {}
+        if self._keys_slot is not None:
+            self._keys_slot.clear()
+        self._cursor = self._cascade_cursor = self.now()
+
+    def __len__(self) -> int:
+        """Scheduled deadlines; without a key index, a key may be counted once per deadline."""
+        if self._keys_slot is not None:
+            return len(self._keys_slot)
+        slots = chain((self._expired, self._overflow), *self._wheel, self._cascading.values())
+        return sum(len(slot) for slot in slots if slot)
+
+    def __contains__(self, key: str | int) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._index)
@@ -1,36 +1,100 @@
+import heapq
+import threading
+from collections import deque
+
+
 class SimpleIDGenerator:
-    def __init__(self) -> None:
-        self._last = 0
-        self._free = set()
+    """
+    Thread-safe generator of positive integer IDs. Freed IDs are handed out again before new ones: the lowest
+    first, or with fifo=True in the order they were freed, both in O(log n) or better. Freeing the highest
+    issued ID lowers it instead, together with the freed IDs right below it.
+
+    allocate_block(n) reserves n contiguous IDs in one call; they are taken above the highest issued ID.
+    """
+
+    # Free lists are rebuilt from the free set once IDs dropped by the highest ID going down make up this
+    # many times the free IDs.
+    COMPACT_RATIO = 2
+    COMPACT_MIN = 64
+
+    def __init__(self, fifo: bool = False) -> None:
+        self._last: int = 0
+        self._fifo: bool = fifo
+        # The free IDs, each with the number of the free() that freed it, and the order they are reused in: a
+        # min-heap of IDs or a queue of (number, ID). The order may still hold IDs reissued since, which are
+        # skipped when they come up; in the queue, so is an ID freed again, until its latest entry comes up.
+        self._free: dict[int, int] = {}
+        self._frees: int = 0
+        self._order: list[int] | deque[tuple[int, int]] = deque() if fifo else []
+        self._lock: threading.Lock = threading.Lock()
 
     @property
     def last(self) -> int:
         return self._last
 
+    @property
+    def fifo(self) -> bool:
+        return self._fifo
+
     @property
     def next(self) -> int:
-        if len(self._free) > 0:
-            if len(self._free) >= self._last:
-                self.reset()
-            else:
-                return self._free.pop()
-        self._last += 1
-        return self._last
+        with self._lock:
+            while self._free:
+                if self._fifo:
+                    freed, id = self._order.popleft()
+                    if self._free.get(id) != freed:
+                        continue
+                else:
+                    id = heapq.heappop(self._order)
+                    if id not in self._free:
+                        continue
+                del self._free[id]
+                return id
+            self._last += 1
+            return self._last
+
+    def allocate_block(self, count: int) -> range:
+        """Reserve count contiguous IDs; each one can be freed on its own."""
+        if count < 1:
+            raise ValueError(f"count must be a positive integer, not {count}")
+        with self._lock:
+            start = self._last + 1
+            self._last += count
+            return range(start, self._last + 1)
 
     def reset(self) -> None:
-        self._last = 0
-        self._free.clear()
+        with self._lock:
+            self._last = 0
+            self._free.clear()
+            self._order.clear()
 
     def free(self, id: int) -> None:
-        if id > self._last:
-            return
-        elif id == self._last:
+        with self._lock:
+            if id < 1 or id > self._last or id in self._free:
+                return
+            if id < self._last:
+                self._frees += 1
+                self._free[id] = self._frees
+                if self._fifo:
+                    self._order.append((self._frees, id))
+                else:
+                    heapq.heappush(self._order, id)
+                return
             self._last -= 1
-            return
-        self._free.add(id)
+            while self._last in self._free:
+                del self._free[self._last]
+                self._last -= 1
+            if len(self._order) > max(self.COMPACT_MIN, self.COMPACT_RATIO * len(self._free)):
+                self._compact()
+
+    def _compact(self) -> None:
+        if self._fifo:
+            self._order = deque(entry for entry in self._order if self._free.get(entry[1]) == entry[0])
+        else:
+            self._order = sorted(self._free)
 
     def __len__(self) -> int:
         return self._last - len(self._free)
 
     def __call__(self) -> int:
-        return self.next()
+        return self.next
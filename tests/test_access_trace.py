@@ -0,0 +1,73 @@
+import random
+from collections import OrderedDict
+
+from data_types import AccessTrace, AccessTraceRecorder, ManagedIdentityMap, hit_ratio_curves
+from data_types.access_trace import HEADER, MAGIC, OP_HIT, OP_MISS, RECORD, VERSION, key_hash
+
+
+def write_trace(path, records, sample_rate: float = 1.0) -> AccessTrace:
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, sample_rate, 0.0))
+        for record in records:
+            file.write(RECORD.pack(*record))
+    return AccessTrace(str(path))
+
+
+def lru_hits(keys: list, capacity: int) -> int:
+    cache, hits = OrderedDict(), 0
+    for key in keys:
+        if key in cache:
+            hits += 1
+            cache.move_to_end(key)
+        else:
+            cache[key] = True
+            if len(cache) > capacity:
+                cache.popitem(last=False)
+    return hits
+
+
+def test_sampling_records_all_or_none_of_a_keys_lookups(tmp_path):
+    path = str(tmp_path / "users.trace")
+    identity_map = ManagedIdentityMap()
+    with AccessTraceRecorder(path, sample_rate=0.25, buffer_size=64) as recorder:
+        identity_map.add_listener(recorder)
+        for key in range(4000):
+            identity_map.get(key)
+            identity_map.add(key, "x")
+            identity_map.get(key)
+    trace = AccessTrace(path)
+    assert trace.sample_rate == 0.25
+    sampled = {key for key in range(4000) if key_hash(key) < 2**62}
+    assert 800 < len(sampled) < 1200
+    assert len(trace) == recorder.records == 2 * len(sampled)
+    hashes = [hashed for hashed, _, _ in trace]
+    assert sorted(hashes) == sorted(key_hash(key) for key in sampled for _ in range(2))
+    assert [operation for _, _, operation in trace] == [OP_MISS, OP_HIT] * len(sampled)
+
+
+def test_timestamps_keep_growing_across_32_bit_wraparounds(tmp_path):
+    elapsed = [2**32 - 16, 2**32 - 1, 5, 10, 10, 3]
+    trace = write_trace(tmp_path / "wrap.trace", [(1, ms, OP_HIT) for ms in elapsed])
+    assert [ms for _, ms, _ in trace] == [2**32 - 16, 2**32 - 1, 2**32 + 5, 2**32 + 10, 2**32 + 10, 2**33 + 3]
+
+
+def test_lru_curves_match_a_direct_simulation(tmp_path):
+    rnd = random.Random(7)
+    # Skewed keys: a few hot ones and a long tail, so that every capacity gets a different hit ratio.
+    keys = [int(rnd.paretovariate(1.2)) for _ in range(5000)]
+    trace = write_trace(tmp_path / "skewed.trace", [(key, index, OP_MISS) for index, key in enumerate(keys)])
+    capacities = [1, 2, 4, 8, 16, 64, 256]
+    curves = hit_ratio_curves(trace, capacities=capacities, ttls=[1], lfru=False)
+    assert curves["accesses"] == len(keys)
+    assert curves["keys"] == len(set(keys))
+    assert curves["lru"] == [lru_hits(keys, capacity) / len(keys) for capacity in capacities]
+    assert len(set(curves["lru"])) == len(capacities)
+
+
+def test_sampled_traces_scale_the_capacities(tmp_path):
+    keys = [index % 10 for index in range(100)]
+    trace = write_trace(tmp_path / "sampled.trace", [(key, 0, OP_HIT) for key in keys], sample_rate=0.5)
+    curves = hit_ratio_curves(trace, capacities=[10, 20], ttls=[1], lfru=False)
+    assert curves["keys"] == 20
+    assert curves["observed"] == 1
+    assert curves["lru"] == [lru_hits(keys, 5) / 100, lru_hits(keys, 10) / 100]
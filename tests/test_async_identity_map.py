@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from data_types import AsyncManagedIdentityMap
+
+
+class Loader:
+    def __init__(self, delay: float = 0.01):
+        self.calls = []
+        self.delay = delay
+
+    async def __call__(self, keys=None):
+        self.calls.append(keys)
+        await asyncio.sleep(self.delay)
+        if keys is None:
+            return "loaded"
+        return {key: f"loaded {key}" for key in keys}
+
+
+def test_concurrent_misses_share_one_load():
+    one_map = AsyncManagedIdentityMap()
+    loader = Loader()
+
+    async def fetch():
+        return await asyncio.gather(*(one_map.get_or_fetch(1, loader) for _ in range(50)))
+
+    assert asyncio.run(fetch()) == ["loaded"] * 50
+    assert len(loader.calls) == 1
+    assert one_map.stats()["coalesced"] == 49
+    assert one_map.get(1) == "loaded"
+
+
+def test_batch_misses_join_the_loads_in_flight():
+    one_map = AsyncManagedIdentityMap()
+    loader = Loader()
+
+    async def fetch():
+        first = asyncio.ensure_future(one_map.get_or_fetch_many([1, 2], loader))
+        await asyncio.sleep(0)
+        second = one_map.get_or_fetch_many([2, 3], loader)
+        single = one_map.get_or_fetch(3, loader)
+        return await asyncio.gather(first, second, single)
+
+    first, second, single = asyncio.run(fetch())
+    assert first == {1: "loaded 1", 2: "loaded 2"}
+    assert second == {2: "loaded 2", 3: "loaded 3"}
+    assert single == "loaded 3"
+    assert loader.calls == [[1, 2], [3]]
+
+
+def test_a_timed_out_waiter_leaves_the_load_to_the_others():
+    one_map = AsyncManagedIdentityMap()
+    loader = Loader(delay=0.05)
+
+    async def fetch():
+        patient = asyncio.ensure_future(one_map.get_or_fetch(1, loader))
+        with pytest.raises(asyncio.TimeoutError):
+            await one_map.get_or_fetch(1, loader, timeout=0.01)
+        return await patient
+
+    assert asyncio.run(fetch()) == "loaded"
+    assert len(loader.calls) == 1
+
+
+def test_the_load_is_cancelled_once_nobody_waits():
+    one_map = AsyncManagedIdentityMap()
+    loader = Loader(delay=1)
+
+    async def fetch():
+        waiter = asyncio.ensure_future(one_map.get_or_fetch(1, loader, timeout=0.01))
+        await asyncio.sleep(0)
+        task = one_map._flights[1].task
+        with pytest.raises(asyncio.TimeoutError):
+            await waiter
+        await asyncio.sleep(0.01)
+        return task, dict(one_map._flights)
+
+    task, flights = asyncio.run(fetch())
+    assert task.cancelled()
+    assert flights == {}
+    assert one_map.get(1) is None
+
+
+def test_a_failing_load_raises_for_every_waiter_and_is_not_cached():
+    one_map = AsyncManagedIdentityMap()
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise KeyError("gone")
+
+    async def fetch():
+        return await asyncio.gather(*(one_map.get_or_fetch(1, failing) for _ in range(5)), return_exceptions=True)
+
+    assert all(isinstance(error, KeyError) for error in asyncio.run(fetch()))
+    assert calls == [1]
+    assert one_map.get(1) is None
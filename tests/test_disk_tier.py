@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from data_types import AsyncManagedIdentityMap, DiskTier
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_existing_files_are_refused_not_wiped(tmp_path):
+    path = tmp_path / "data.db"
+    path.write_bytes(b"precious")
+    with pytest.raises(FileExistsError):
+        DiskTier(str(path))
+    assert path.read_bytes() == b"precious"
+    empty = tmp_path / "empty.db"
+    empty.touch()
+    with DiskTier(str(empty)) as l2:
+        l2.put(1, "a")
+        assert l2.take(1)[0] == "a"
+
+
+def test_writer_thread_purges_expired_entries(tmp_path):
+    with DiskTier(str(tmp_path / "l2.db"), flush_interval=0.01, purge_interval=0.01) as l2:
+        l2.put(1, "a", ttl=0.05)
+        l2.put(2, "b")
+        wait_for(lambda: l2.stats()["expired"] == 1)
+        assert len(l2) == 1
+        assert l2.take(2)[0] == "b"
+
+
+def test_writer_thread_survives_a_failing_batch(tmp_path, monkeypatch, caplog):
+    l2 = DiskTier(str(tmp_path / "l2.db"), flush_interval=0.01)
+    flush = l2.flush
+    failures = []
+
+    def failing_flush():
+        if not failures:
+            failures.append(1)
+            raise RuntimeError("boom")
+        flush()
+
+    monkeypatch.setattr(l2, "flush", failing_flush)
+    l2.put(1, "a")
+    wait_for(lambda: l2.stats()["batches"] == 1)
+    assert failures
+    assert "failed to write a batch" in caplog.text
+    assert l2.take(1)[0] == "a"
+    l2.close()
+
+
+def test_async_loads_read_the_l2_off_the_loop(tmp_path):
+    l2 = DiskTier(str(tmp_path / "l2.db"))
+    one_map = AsyncManagedIdentityMap(max_items=1, l2=l2)
+    one_map.add(1, "a")
+    one_map.add(2, "b")
+    threads = []
+    load_from_l2 = one_map.identity_map.load_from_l2
+
+    def recording_load_from_l2(key):
+        threads.append(threading.current_thread())
+        return load_from_l2(key)
+
+    one_map.identity_map.load_from_l2 = recording_load_from_l2
+
+    async def fetch():
+        return await one_map.get_or_fetch(1, lambda: "loaded"), await one_map.get_or_fetch_many([2], dict)
+
+    assert asyncio.run(fetch()) == ("a", {2: "b"})
+    assert threads and threading.main_thread() not in threads
+    l2.close()
+
+
+def test_async_refresh_does_not_count_an_l2_miss(tmp_path):
+    l2 = DiskTier(str(tmp_path / "l2.db"))
+    one_map = AsyncManagedIdentityMap(refresh_ahead=0.5, l2=l2)
+
+    async def refresh():
+        one_map.add(1, "a", ttl=0.1)
+        await asyncio.sleep(0.06)
+        assert await one_map.get_or_fetch(1, lambda: "b", ttl=0.1) == "a"
+        while one_map._flights:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(refresh())
+    assert one_map.get(1) == "b"
+    assert one_map.stats()["l2_misses"] == 0
+    l2.close()
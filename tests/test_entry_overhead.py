@@ -0,0 +1,82 @@
+import time
+import tracemalloc
+from collections import deque
+
+from data_types import ManagedIdentityMap
+
+ENTRIES = 1_000_000
+TTL = 600
+TAGS = ["users", "tenant:1"]
+
+
+class Entity:
+    __slots__ = ("id", "identity_map_info")
+
+    def __init__(self, id: int):
+        self.id = id
+        self.identity_map_info = None
+
+
+class BaselineInfo:
+    # The IdentityMapInfo entries records replaced: attributes in a __dict__ and a stats dict per item.
+    def __init__(self, is_expired: bool, is_deleted: bool, stats: dict):
+        self.id_deleted = is_deleted
+        self._is_expired = is_expired
+        self.stats = stats
+
+
+def parallel_indexes(items: dict) -> tuple:
+    # The layout entry records replaced, one index per concern: the identity map, a deque of keys for the LRU
+    # order, deadline -> keys and key -> deadline for the TTL, tag -> keys and key -> tags for the tags.
+    identity_map, lru, ttd_keys, keys_ttd, tag_keys, key_tags = {}, deque(), {}, {}, {}, {}
+    for key, data in items.items():
+        identity_map[key] = data
+        data.identity_map_info = BaselineInfo(False, False, {})
+        # The deque's membership test made every write O(n): append what upsert() appended.
+        lru.append(key)
+        ttd = int(time.time()) + TTL
+        ttd_keys.setdefault(ttd, set()).add(key)
+        keys_ttd[key] = ttd
+        for tag in TAGS:
+            tag_keys.setdefault(tag, set()).add(key)
+            key_tags.setdefault(key, set()).add(tag)
+    return identity_map, lru, ttd_keys, keys_ttd, tag_keys, key_tags
+
+
+def entry_records(items: dict) -> ManagedIdentityMap:
+    identity_map = ManagedIdentityMap()
+    for key, data in items.items():
+        identity_map.add(key, data, ttl=TTL, tags=TAGS)
+    return identity_map
+
+
+def traced_bytes(build) -> int:
+    items = {key: Entity(key) for key in range(ENTRIES)}
+    tracemalloc.start()
+    try:
+        built = build(items)
+        used = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert len(built[0] if isinstance(built, tuple) else built) == ENTRIES
+    return used
+
+
+def test_entry_records_halve_the_overhead_of_entities_with_ttl_and_tags():
+    before = traced_bytes(parallel_indexes)
+    after = traced_bytes(entry_records)
+    assert after <= before * 0.5, f"{after / ENTRIES:.0f} vs {before / ENTRIES:.0f} bytes per entry"
+
+
+def test_rewrites_reuse_the_item_info():
+    identity_map = ManagedIdentityMap()
+    entity = Entity(1)
+    identity_map.add(1, entity, ttl=TTL)
+    info = entity.identity_map_info
+    info.stats["reads"] = 1
+    identity_map.add(1, entity, tags=TAGS)
+    assert entity.identity_map_info is info
+    assert info.stats == {}
+    assert not info.is_expired and not info.is_deleted
+    identity_map.remove(1)
+    assert info.is_deleted and info.id_deleted
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from data_types import AsyncGCScheduler, CollectionBudget, GCScheduler, GCType, IdentityMapsCollection
+
+
+def budgeted_collection() -> IdentityMapsCollection:
+    collection = IdentityMapsCollection(budget=CollectionBudget(max_items=100, rebalance_interval=0))
+    collection.get_map("users")
+    collection.get_map("posts")
+    return collection
+
+
+def test_thread_sweeps_rebalance_the_budget():
+    collection = budgeted_collection()
+    GCScheduler(collection).sweep()
+    assert collection.budget.stats()["rebalances"] == 1
+
+
+def test_async_sweeps_rebalance_the_budget():
+    collection = budgeted_collection()
+    asyncio.run(AsyncGCScheduler(collection).sweep())
+    assert collection.budget.stats()["rebalances"] == 1
+
+
+def failing_collection() -> IdentityMapsCollection:
+    collection = IdentityMapsCollection(gc_type=GCType.TTL, gc_possibility=0)
+    one_map = collection.get_map(str)
+
+    def on_gc(seconds, reclaimed):
+        raise RuntimeError("handler bug")
+
+    one_map.add_hook("on_gc", on_gc)
+    one_map.add(1, "a", ttl=0.01)
+    return collection
+
+
+def test_thread_survives_a_failing_sweep(caplog):
+    collection = failing_collection()
+    with GCScheduler(collection, interval=0.01) as scheduler:
+        deadline = time.monotonic() + 5
+        while len(collection.get_map(str)) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        assert scheduler.running
+        assert not collection.inline_gc
+    assert len(collection.get_map(str)) == 0
+    assert "GC sweep failed" in caplog.text
+
+
+def test_async_task_survives_a_failing_sweep(caplog):
+    collection = failing_collection()
+
+    async def run():
+        async with AsyncGCScheduler(collection, interval=0.01) as scheduler:
+            await asyncio.sleep(0.2)
+            return scheduler.running
+
+    assert asyncio.run(run())
+    assert len(collection.get_map(str)) == 0
+    assert "GC sweep failed" in caplog.text
@@ -0,0 +1,115 @@
+import random
+import sys
+import threading
+
+from id_generators import SimpleIDGenerator
+
+
+def test_lowest_free_id_is_reused_first():
+    generator = SimpleIDGenerator()
+    rnd = random.Random(5)
+    issued, free = set(), set()
+    for _ in range(20_000):
+        if issued and rnd.random() < 0.45:
+            id = rnd.choice(tuple(issued))
+            generator.free(id)
+            issued.remove(id)
+            free.add(id)
+            # Freeing the highest IDs lowers the last one instead.
+            while free and max(free) > max(issued, default=0):
+                free.remove(max(free))
+        else:
+            id = generator.next
+            assert id == (min(free) if free else max(issued | free, default=0) + 1)
+            free.discard(id)
+            issued.add(id)
+        assert len(generator) == len(issued)
+        assert generator.last == max(issued, default=0)
+
+
+def test_fifo_reuses_in_free_order():
+    generator = SimpleIDGenerator(fifo=True)
+    for _ in range(10):
+        generator.next
+    for id in (7, 2, 5):
+        generator.free(id)
+    assert [generator.next for _ in range(4)] == [7, 2, 5, 11]
+
+
+def test_fifo_order_holds_for_ids_reissued_after_the_highest_dropped():
+    generator = SimpleIDGenerator(fifo=True)
+    for _ in range(5):
+        generator.next
+    for id in (3, 5, 4):
+        generator.free(id)
+    assert [generator.next for _ in range(3)] == [3, 4, 5]
+    generator.free(1)
+    generator.free(3)
+    assert [generator.next, generator.next] == [1, 3]
+
+
+def test_fifo_reuse_matches_a_model():
+    generator = SimpleIDGenerator(fifo=True)
+    rnd = random.Random(7)
+    issued, queue = set(), []
+    for _ in range(20_000):
+        if issued and rnd.random() < 0.45:
+            id = rnd.choice(tuple(issued))
+            generator.free(id)
+            issued.remove(id)
+            queue.append(id)
+            while queue and max(queue) > max(issued, default=0):
+                queue.remove(max(queue))
+        else:
+            id = generator.next
+            assert id == (queue.pop(0) if queue else max(issued, default=0) + 1)
+            issued.add(id)
+        assert len(generator) == len(issued)
+
+
+def test_blocks_are_contiguous_and_freed_one_by_one():
+    generator = SimpleIDGenerator()
+    generator.next
+    block = generator.allocate_block(100)
+    assert block == range(2, 102)
+    generator.free(50)
+    assert generator.next == 50
+    for id in reversed(block):
+        generator.free(id)
+    assert generator.last == 1
+    assert len(generator) == 1
+
+
+def test_concurrent_threads_never_share_an_id():
+    generator = SimpleIDGenerator()
+    held = [[] for _ in range(8)]
+    errors = []
+
+    def work(mine: list[int], seed: int) -> None:
+        rnd = random.Random(seed)
+        try:
+            for _ in range(5_000):
+                if mine and rnd.random() < 0.4:
+                    generator.free(mine.pop(rnd.randrange(len(mine))))
+                elif rnd.random() < 0.05:
+                    mine.extend(generator.allocate_block(rnd.randrange(1, 10)))
+                else:
+                    mine.append(generator())
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=work, args=(mine, seed)) for seed, mine in enumerate(held)]
+    interval = sys.getswitchinterval()
+    # Switch threads as often as possible, in the middle of the generator's updates.
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+    ids = [id for mine in held for id in mine]
+    assert len(ids) == len(set(ids)) == len(generator)
+    assert max(ids) <= generator.last
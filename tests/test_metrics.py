@@ -0,0 +1,72 @@
+import gc
+import threading
+
+from data_types import Counter, Histogram, ManagedIdentityMap, ShardedManagedIdentityMap, to_prometheus
+
+
+def run_threads(target, count: int = 8) -> None:
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_sharded_map_counts_an_invalidation_once():
+    identity_map = ShardedManagedIdentityMap(shards=4)
+    identity_map.add(1, "a", tags=["users"])
+    identity_map.invalidate_tag("users")
+    identity_map.invalidate_tags(["posts", "tenant:1"])
+    assert identity_map.metrics_snapshot()["invalidations"] == 3
+    assert identity_map.stats()["invalidations"] == 3
+    assert "identity_map_invalidations_total{map=\"None\"} 3\n" in identity_map.prometheus()
+    assert identity_map.get(1) is None
+
+
+def test_map_counts_invalidations():
+    identity_map = ManagedIdentityMap()
+    identity_map.invalidate_tag("users")
+    identity_map.invalidate_tags(["posts", "tenant:1"])
+    assert identity_map.invalidations == 3
+    assert identity_map.stats()["invalidations"] == 3
+
+
+def test_counts_from_concurrent_threads_add_up():
+    counter, histogram = Counter(), Histogram(buckets=(1.0,))
+
+    def record():
+        for _ in range(10_000):
+            counter.inc()
+            histogram.observe(0.5)
+
+    run_threads(record)
+    assert counter.value == 80_000
+    assert histogram.snapshot() == {"buckets": {1.0: 80_000, float("inf"): 80_000}, "sum": 40_000.0, "count": 80_000}
+
+
+def test_counts_survive_the_threads_that_made_them():
+    counter = Counter()
+    run_threads(lambda: counter.inc(2))
+    gc.collect()
+    assert not counter._cells
+    assert counter.value == 16
+    counter.inc()
+    assert counter.value == 17
+    counter.reset()
+    assert counter.value == 0
+
+
+def test_histograms_render_as_prometheus_text():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(seconds)
+    text = to_prometheus({'Us"er': {"load_seconds": histogram.snapshot()}}, prefix="app")
+    assert text == (
+        "# HELP app_load_seconds Loader latency in seconds.\n"
+        "# TYPE app_load_seconds histogram\n"
+        'app_load_seconds_bucket{map="Us\\"er",le="0.1"} 2\n'
+        'app_load_seconds_bucket{map="Us\\"er",le="1.0"} 3\n'
+        'app_load_seconds_bucket{map="Us\\"er",le="+Inf"} 4\n'
+        'app_load_seconds_sum{map="Us\\"er"} 2.65\n'
+        'app_load_seconds_count{map="Us\\"er"} 4\n'
+    )
@@ -0,0 +1,72 @@
+from data_types import ManagedIdentityMap, TTLManager
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 1000.0
+
+    def __call__(self) -> float:
+        return self.seconds
+
+
+class Loader:
+    def __init__(self, result=None):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.result
+
+
+def negative_map(clock: Clock, **kwargs) -> ManagedIdentityMap:
+    identity_map = ManagedIdentityMap(negative_ttl=10, **kwargs)
+    identity_map._ttl_manager_ = TTLManager(clock, index_keys=False)
+    return identity_map
+
+
+def test_a_none_result_is_cached_until_the_negative_ttl_runs_out():
+    clock = Clock()
+    identity_map = negative_map(clock)
+    loader = Loader()
+    assert identity_map.get_or_fetch(1, loader) is None
+    assert identity_map.get_or_fetch(1, loader) is None
+    assert loader.calls == 1
+    assert identity_map.is_absent(1)
+    clock.seconds += 9.999
+    assert identity_map.get_or_fetch(1, loader) is None
+    assert loader.calls == 1
+    clock.seconds += 0.001
+    loader.result = "a"
+    assert identity_map.get_or_fetch(1, loader) == "a"
+    assert loader.calls == 2
+    assert not identity_map.is_absent(1)
+
+
+def test_the_oldest_absent_keys_are_dropped_first():
+    identity_map = negative_map(Clock(), max_negative_items=2)
+    for key in (1, 2, 3):
+        identity_map.get_or_fetch(key, Loader())
+    assert [identity_map.is_absent(key) for key in (1, 2, 3)] == [False, True, True]
+    assert identity_map.stats()["absent_count"] == 2
+
+
+def test_adding_a_key_clears_its_absent_mark():
+    identity_map = negative_map(Clock())
+    identity_map.get_or_fetch(1, Loader())
+    identity_map.add(1, "a")
+    assert not identity_map.is_absent(1)
+    loader = Loader("b")
+    assert identity_map.get_or_fetch(1, loader) == "a"
+    assert loader.calls == 0
+
+
+def test_negative_hits_are_counted_apart_from_hits_and_misses():
+    identity_map = negative_map(Clock())
+    identity_map.add(2, "b")
+    identity_map.get_or_fetch(1, Loader())
+    identity_map.get_or_fetch(1, Loader())
+    identity_map.get(1)
+    identity_map.get(2)
+    stats = identity_map.stats()
+    assert (stats["hits"], stats["misses"], stats["negative_hits"]) == (1, 1, 2)
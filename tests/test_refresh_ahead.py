@@ -0,0 +1,110 @@
+import threading
+from concurrent.futures import Executor
+
+from data_types import ManagedIdentityMap, TTLManager
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 1000.0
+
+    def __call__(self) -> float:
+        return self.seconds
+
+
+class ManualExecutor(Executor):
+    """Queues the background refreshes until run() is called."""
+
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, /, *args, **kwargs):
+        self.calls.append((fn, args, kwargs))
+
+    def run(self) -> int:
+        calls, self.calls = self.calls, []
+        for fn, args, kwargs in calls:
+            fn(*args, **kwargs)
+        return len(calls)
+
+
+class Loader:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def refreshing_map(clock: Clock, executor: ManualExecutor, **kwargs) -> ManagedIdentityMap:
+    identity_map = ManagedIdentityMap(refresh_executor=executor, **kwargs)
+    identity_map._ttl_manager_ = TTLManager(clock, index_keys=False)
+    return identity_map
+
+
+def test_only_one_background_reload_runs_per_key():
+    clock, executor = Clock(), ManualExecutor()
+    identity_map = refreshing_map(clock, executor, refresh_ahead=0.5)
+    identity_map.add(1, "a", ttl=10)
+    identity_map.add(2, "b", ttl=10)
+    clock.seconds += 5
+    loader = Loader("a2")
+
+    def fetch():
+        identity_map.get_or_fetch(1, loader, ttl=10)
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert identity_map.get_or_fetch(1, loader, ttl=10) == "a"
+    assert identity_map.get_or_fetch(2, Loader("b2"), ttl=10) == "b"
+    assert executor.run() == 2
+    assert loader.calls == 1
+    assert (identity_map.get(1), identity_map.get(2)) == ("a2", "b2")
+    assert identity_map.stats()["refreshes"] == 2
+    # Refreshed, the key is not due again before half of its new TTL.
+    assert identity_map.get_or_fetch(1, loader, ttl=10) == "a2"
+    assert executor.run() == 0
+
+
+def test_a_stale_item_is_served_within_the_stale_window_only():
+    clock, executor = Clock(), ManualExecutor()
+    identity_map = refreshing_map(clock, executor, stale_ttl=5)
+    identity_map.add(1, "a", ttl=10)
+    clock.seconds += 14.999
+    loader = Loader("a2", "a3")
+    assert identity_map.get_or_fetch(1, loader, ttl=10) == "a"
+    assert identity_map.get(1) is None
+    assert identity_map.stats()["stale_hits"] == 1
+    assert loader.calls == 0
+    assert len(executor.calls) == 1
+    clock.seconds += 0.001
+    # Past the stale window the item is gone: the loader runs in the caller, not in the background.
+    assert identity_map.get_or_fetch(1, loader, ttl=10) == "a2"
+    assert loader.calls == 1
+    assert identity_map.stats()["stale_hits"] == 1
+
+
+def test_a_failing_refresh_keeps_the_old_item():
+    clock, executor = Clock(), ManualExecutor()
+    identity_map = refreshing_map(clock, executor, refresh_ahead=0.5)
+    identity_map.add(1, "a", ttl=10)
+    clock.seconds += 5
+    loader = Loader(RuntimeError("down"), "a2")
+    assert identity_map.get_or_fetch(1, loader, ttl=10) == "a"
+    assert executor.run() == 1
+    assert identity_map.get(1) == "a"
+    stats = identity_map.stats()
+    assert (stats["refreshes"], stats["refresh_errors"]) == (0, 1)
+    # The failure does not hold the key: the next hit starts another reload.
+    assert identity_map.get_or_fetch(1, loader, ttl=10) == "a"
+    assert executor.run() == 1
+    assert identity_map.get(1) == "a2"
+    assert identity_map.stats()["refreshes"] == 1
@@ -0,0 +1,43 @@
+import random
+import sys
+import threading
+
+from data_types import ShardedManagedIdentityMap
+
+
+def test_threads_keep_the_map_consistent_and_bounded():
+    identity_map = ShardedManagedIdentityMap(shards=4, max_items=400)
+    errors = []
+
+    def work(seed: int) -> None:
+        rnd = random.Random(seed)
+        try:
+            for _ in range(5_000):
+                key = rnd.randrange(2_000)
+                operation = rnd.random()
+                if operation < 0.5:
+                    identity_map.add(key, ("v", key), ttl=rnd.choice((None, 0.001, 60)), tags=[f"t{key % 7}"])
+                elif operation < 0.9:
+                    value = identity_map.get(key)
+                    assert value is None or value == ("v", key)
+                elif operation < 0.97:
+                    identity_map.remove(key)
+                else:
+                    identity_map.invalidate_tag(f"t{rnd.randrange(7)}")
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=work, args=(seed,)) for seed in range(8)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+    assert len(identity_map) <= 400
+    keys = list(identity_map)
+    assert len(keys) == len(set(keys)) == len(identity_map)
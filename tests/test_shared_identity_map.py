@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+
+import pytest
+
+from data_types.shared_identity_map import _SEQUENCE, SharedIdentityMap
+
+fork = multiprocessing.get_context("fork")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def shared_map(tmp_path):
+    one_map = SharedIdentityMap(f"ptk-test-{os.getpid()}-{time.monotonic_ns()}", 200, 64_000, lock_dir=str(tmp_path))
+    yield one_map
+    one_map.close()
+    one_map.unlink()
+
+
+def attach(one_map: SharedIdentityMap) -> SharedIdentityMap:
+    return SharedIdentityMap(one_map.name, lock_dir=os.path.dirname(one_map.lock_path))
+
+
+def test_lock_file_lives_in_lock_dir(shared_map, tmp_path):
+    assert shared_map.lock_path == str(tmp_path / f"{shared_map.name}.lock")
+    assert os.path.exists(shared_map.lock_path)
+
+
+def test_add_get_remove_and_ttl(shared_map):
+    shared_map.add(1, "a")
+    shared_map.add("k", {"x": [1, 2]}, ttl=0.05)
+    assert shared_map.get(1) == "a"
+    assert shared_map.get("k") == {"x": [1, 2]}
+    time.sleep(0.06)
+    assert shared_map.get("k") is None
+    assert shared_map.gc_run() == 1
+    shared_map.remove(1)
+    assert shared_map.get(1) is None
+    assert len(shared_map) == 0
+
+
+def test_bounds_hold_under_churn(shared_map):
+    rnd = random.Random(1)
+    for _ in range(5000):
+        shared_map.add(rnd.randrange(1000), "x" * rnd.randrange(1, 400))
+        assert len(shared_map) <= shared_map.max_items
+        assert shared_map.bytes <= shared_map.max_bytes
+    assert len(set(shared_map)) == len(shared_map)
+
+
+def test_other_processes_see_writes(shared_map):
+    shared_map.add("parent", 1)
+
+    def child(queue):
+        one_map = attach(shared_map)
+        queue.put(one_map.get("parent"))
+        one_map.add("child", 2)
+        one_map.close()
+
+    queue = fork.Queue()
+    process = fork.Process(target=child, args=(queue,))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert queue.get() == 1
+    assert shared_map.get("child") == 2
+
+
+def test_children_using_the_inherited_map_wait_for_the_lock(shared_map):
+    shared_map.add("parent", 1)
+    entered = fork.Event()
+
+    def child(queue):
+        entered.set()
+        started = time.monotonic()
+        with shared_map._locked():
+            queue.put(time.monotonic() - started)
+        shared_map.add("child", shared_map.get("parent") + 1)
+
+    queue = fork.Queue()
+    with shared_map._locked():
+        process = fork.Process(target=child, args=(queue,))
+        process.start()
+        entered.wait(10)
+        time.sleep(0.2)
+    # The child also inherits the thread lock as held by this thread.
+    process.join(10)
+    process.kill()
+    assert process.exitcode == 0
+    assert queue.get(timeout=10) >= 0.1
+    assert shared_map.get("child") == 2
+
+
+def test_concurrent_writers_through_the_inherited_map_keep_it_consistent(shared_map):
+    def hammer(seed):
+        rnd = random.Random(seed)
+        for _ in range(2000):
+            key = rnd.randrange(300)
+            if rnd.random() < 0.5:
+                shared_map.add(key, ("v", key) * rnd.randrange(1, 20))
+            else:
+                value = shared_map.get(key)
+                if value is not None and set(value) != {"v", key}:
+                    os._exit(1)
+        os._exit(0)
+
+    processes = [fork.Process(target=hammer, args=(seed,)) for seed in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        # Writers racing each other corrupt the index, and probes of a corrupted index may never end.
+        process.join(60)
+        process.kill()
+    assert [process.exitcode for process in processes] == [0] * 4
+    keys = list(shared_map)
+    assert len(keys) == len(set(keys)) == len(shared_map) <= shared_map.max_items
+
+
+def test_concurrent_writers_never_expose_torn_reads(shared_map):
+    def hammer(seed):
+        one_map = attach(shared_map)
+        rnd = random.Random(seed)
+        for _ in range(3000):
+            key = rnd.randrange(300)
+            if rnd.random() < 0.3:
+                one_map.add(key, ("v", key) * rnd.randrange(1, 20))
+            else:
+                value = one_map.get(key)
+                if value is not None and set(value) != {"v", key}:
+                    os._exit(1)
+        one_map.close()
+        os._exit(0)
+
+    processes = [fork.Process(target=hammer, args=(seed,)) for seed in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert [process.exitcode for process in processes] == [0] * 4
+    assert len(set(shared_map)) == len(shared_map) <= shared_map.max_items
+
+
+def test_dead_writer_resets_the_map(shared_map):
+    shared_map.add(1, "a")
+    # A writer dying halfway leaves the sequence odd.
+    shared_map._set(_SEQUENCE, shared_map._get(_SEQUENCE) + 1)
+    assert shared_map.get(1) is None
+    assert len(shared_map) == 0
+    shared_map.add(1, "b")
+    assert shared_map.get(1) == "b"
+
+
+def test_data_types_import_without_fcntl():
+    code = (
+        "import sys; sys.modules['fcntl'] = None\n"
+        "import data_types\n"
+        "try:\n"
+        "    data_types.SharedIdentityMap('ptk-no-fcntl')\n"
+        "except RuntimeError:\n"
+        "    print('refused')\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+    assert result.stdout.strip() == "refused", result.stderr
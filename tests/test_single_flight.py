@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from data_types import ManagedIdentityMap, SingleFlight
+
+
+def run_threads(count: int, target) -> None:
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_misses_share_one_loader_call():
+    identity_map = ManagedIdentityMap()
+    calls = []
+    results = []
+    started = threading.Barrier(16)
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.05)
+        return "loaded"
+
+    def fetch():
+        started.wait()
+        results.append(identity_map.get_or_fetch(1, loader))
+
+    run_threads(16, fetch)
+    assert results == ["loaded"] * 16
+    assert calls == [1]
+    assert identity_map.stats()["coalesced"] == 15
+
+
+def test_waiters_share_the_leader_exception_and_the_key_is_retried():
+    single_flight = SingleFlight()
+    errors = []
+    started = threading.Barrier(8)
+
+    def failing():
+        time.sleep(0.05)
+        raise KeyError("gone")
+
+    def call():
+        started.wait()
+        try:
+            single_flight.do("key", failing)
+        except KeyError as error:
+            errors.append(error)
+
+    run_threads(8, call)
+    assert len(errors) == 8
+    assert len({id(error) for error in errors}) == 1
+    assert len(single_flight) == 0
+    assert single_flight.do("key", lambda: "again") == "again"
+
+
+def test_a_waiter_times_out_without_stopping_the_leader():
+    single_flight = SingleFlight()
+    leading = threading.Event()
+    results = []
+
+    def slow():
+        leading.set()
+        time.sleep(0.1)
+        return "done"
+
+    leader = threading.Thread(target=lambda: results.append(single_flight.do("key", slow)))
+    leader.start()
+    leading.wait()
+    with pytest.raises(TimeoutError):
+        single_flight.do("key", slow, timeout=0.01)
+    leader.join()
+    assert results == ["done"]
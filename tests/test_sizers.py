@@ -0,0 +1,57 @@
+import heapq
+import json
+import logging
+import threading
+
+from data_types import ManagedIdentityMap, deep_sizeof, managed_identity_map
+
+
+class User:
+    def __init__(self, name: str, **extra):
+        self.name = name
+        self.roles = ["admin", "editor"]
+        self.__dict__.update(extra)
+
+
+def test_containers_and_attributes_are_counted_once():
+    shared = ["x" * 100]
+    assert deep_sizeof([shared, shared]) == deep_sizeof([shared]) + 8
+    assert deep_sizeof(User("ann")) > deep_sizeof(User("ann").__dict__)
+
+
+def test_shared_process_objects_are_not_charged():
+    plain = deep_sizeof(User("ann", extra=None))
+    with_shared = deep_sizeof(User("ann", extra=(logging.getLogger("app"), json, json.dumps, User, logging.INFO)))
+    assert with_shared - plain < 200
+
+
+def test_byte_budget_keeps_entries_holding_shared_objects():
+    identity_map = ManagedIdentityMap(max_bytes=20_000)
+    for key in range(20):
+        identity_map.add(key, User(str(key), logger=logging.getLogger("app"), codec=json))
+    assert len(identity_map) == 20
+    assert identity_map.bytes <= 20_000
+
+
+def test_largest_entries_are_ranked_outside_the_map_lock(monkeypatch):
+    identity_map = ManagedIdentityMap(sizer=len)
+    for key in range(10):
+        identity_map.add(key, "x" * key)
+    nlargest = heapq.nlargest
+    lock_free = []
+
+    def try_lock():
+        lock_free.append(identity_map._lock.acquire(blocking=False))
+        if lock_free[-1]:
+            identity_map._lock.release()
+
+    def recording_nlargest(*args, **kwargs):
+        other = threading.Thread(target=try_lock)
+        other.start()
+        other.join()
+        return nlargest(*args, **kwargs)
+
+    monkeypatch.setattr(managed_identity_map.heapq, "nlargest", recording_nlargest)
+    assert identity_map.largest(3) == [(9, 9), (8, 8), (7, 7)]
+    assert identity_map.stats()["largest"][:3] == [(9, 9), (8, 8), (7, 7)]
+    assert lock_free == [True, True]
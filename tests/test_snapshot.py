@@ -0,0 +1,111 @@
+import pickle
+import time
+
+from data_types import ManagedIdentityMap, SnapshotRestore, save_snapshot, snapshot
+
+
+class Blob:
+    """Hands its bytes to pickle out of band, and keeps whatever buffer it is unpickled from."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __reduce_ex__(self, protocol):
+        return Blob, (pickle.PickleBuffer(self.data),)
+
+
+class LaterTime:
+    """The time module, seconds ahead."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def time(self) -> float:
+        return time.time() + self.seconds
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+
+def test_out_of_band_buffers_are_restored_as_views_of_the_file(tmp_path):
+    path = str(tmp_path / "blobs.snapshot")
+    identity_map = ManagedIdentityMap()
+    identity_map.add(1, Blob(b"x" * 1000))
+    identity_map.add(2, Blob(bytearray(b"y" * 999)))
+    assert identity_map.snapshot(path) == 2
+    with open(path, "rb") as file:
+        data = file.read()
+    assert data.index(b"x" * 1000) % snapshot.BUFFER_ALIGNMENT == 0
+    assert data.index(b"y" * 999) % snapshot.BUFFER_ALIGNMENT == 0
+
+    restored = ManagedIdentityMap()
+    assert restored.warm_start(path, background=False).restored == 2
+    blob = restored.get(1)
+    assert isinstance(blob.data, memoryview) and blob.data.readonly
+    assert blob.data == b"x" * 1000
+    assert restored.get(2).data == b"y" * 999
+
+
+def test_remaining_ttls_keep_running_from_the_snapshot(tmp_path, monkeypatch):
+    path = str(tmp_path / "ttl.snapshot")
+    identity_map = ManagedIdentityMap()
+    identity_map.add(1, "a", ttl=100)
+    identity_map.add(2, "b", ttl=50)
+    identity_map.add(3, "c")
+    identity_map.snapshot(path)
+
+    monkeypatch.setattr(snapshot, "time", LaterTime(60))
+    restored = ManagedIdentityMap()
+    restore = restored.warm_start(path, background=False)
+    assert restore.stats()["restored"] == 2 and restore.stats()["skipped"] == 1
+    assert restored.get(2) is None
+    assert restored.get(3) == "c" and restored._entries[3].deadline is None
+    remaining = restored._entries[1].deadline - restored._ttl_manager.now()
+    assert 39_000 <= remaining <= 40_000
+
+
+def test_tags_invalidated_during_a_restore_apply_to_the_restored_entries(tmp_path):
+    path = str(tmp_path / "tags.snapshot")
+    identity_map = ManagedIdentityMap()
+    identity_map.add(1, "a", tags=["users"])
+    identity_map.add(2, "b", tags=["posts"])
+    identity_map.snapshot(path)
+
+    restored = ManagedIdentityMap()
+    restore_records = restored._restore_records
+
+    def invalidating_restore_records(records, age):
+        restored.invalidate_tag("users")
+        return restore_records(records, age)
+
+    restored._restore_records = invalidating_restore_records
+    assert restored.warm_start(path, background=False).restored == 2
+    assert restored.get(1) is None
+    assert restored.get(2) == "b"
+
+
+def test_a_cancelled_restore_stops_after_the_current_frame(tmp_path):
+    path = str(tmp_path / "cancel.snapshot")
+    identity_map = ManagedIdentityMap()
+    for key in range(100):
+        identity_map.add(key, str(key))
+    save_snapshot(path, {None: identity_map}, frame_entries=10)
+
+    restored = ManagedIdentityMap()
+    restore = SnapshotRestore(path, lambda _: restored)
+    restore_records = restored._restore_records
+
+    def cancelling_restore_records(records, age):
+        restore.cancel()
+        return restore_records(records, age)
+
+    restored._restore_records = cancelling_restore_records
+    restore.start(background=False)
+    assert restore.done and restore.error is None
+    assert restore.restored == len(restored) == 10
+    # The most recently used entries come first.
+    assert sorted(restored._entries) == list(range(90, 100))
+    assert restored._restoring is None
+    restored.remove(95)
+    restored.add(95, "again")
+    assert restored.get(95) == "again"
@@ -0,0 +1,50 @@
+from data_types import ManagedIdentityMap, TagsManager
+
+
+def pending_keys(identity_map: ManagedIdentityMap) -> int:
+    return sum(len(keys) for keys in identity_map._tags_manager._invalidated)
+
+
+def test_invalidated_entries_are_misses_and_rewrites_are_fresh():
+    identity_map = ManagedIdentityMap()
+    identity_map.add(1, "a", tags=["users"])
+    identity_map.add(2, "b", tags=["posts"])
+    identity_map.invalidate_tag("users")
+    assert identity_map.get(1) is None
+    assert identity_map.get(2) == "b"
+    identity_map.add(1, "c", tags=["users"])
+    assert identity_map.get(1) == "c"
+
+
+def test_pending_invalidations_stay_bounded_without_gc():
+    identity_map = ManagedIdentityMap(max_items=1000)
+    for batch in range(200):
+        for key in range(1000):
+            identity_map.add(batch * 1000 + key, key, tags=["users"])
+        identity_map.invalidate_tag("users")
+        assert len(identity_map) <= 1000
+        assert pending_keys(identity_map) <= 1000
+    for key in range(100):
+        identity_map.add(-key, key)
+    assert pending_keys(identity_map) == 0
+
+
+def test_pending_invalidations_of_rewritten_keys_stay_bounded():
+    identity_map = ManagedIdentityMap(max_items=1000)
+    for _ in range(200):
+        for key in range(1000):
+            identity_map.add(key, key, tags=["users"])
+        identity_map.invalidate_tag("users")
+        assert pending_keys(identity_map) <= 1000
+
+
+def test_pop_invalidated_work_is_bounded_by_limit():
+    tags_manager = TagsManager()
+    for key in range(1000):
+        tags_manager.set_tag(key, "users")
+    tags_manager.invalidate_tag("users")
+    # None of the keys is stale any more: the call still examines no more than limit of them.
+    assert tags_manager.pop_invalidated(10, lambda key: False) == []
+    assert sum(len(keys) for keys in tags_manager._invalidated) == 990
+    assert len(tags_manager.pop_invalidated(2000)) == 990
+    assert not tags_manager.has_invalidated()
@@ -0,0 +1,132 @@
+import random
+
+import pytest
+
+from data_types import GCBudget, GCType, ManagedIdentityMap, TTLManager
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 1000.0
+
+    def __call__(self) -> float:
+        return self.seconds
+
+
+def drain(ttl_manager: TTLManager, limit: int | None = None) -> set:
+    popped = set()
+    while (keys := ttl_manager.pop_expired(limit)) or ttl_manager.cascading:
+        popped.update(keys)
+    return popped
+
+
+def test_keys_pop_out_at_their_deadline():
+    clock = Clock()
+    ttl_manager = TTLManager(clock)
+    ttl_manager.set_ttd("a", 1)
+    ttl_manager.set_ttd("b", 5)
+    clock.seconds += 0.999
+    assert ttl_manager.pop_expired() == []
+    clock.seconds += 0.001
+    assert ttl_manager.pop_expired() == ["a"]
+    ttl_manager.remove_ttd("b")
+    clock.seconds += 10
+    assert ttl_manager.pop_expired() == []
+    assert len(ttl_manager) == 0
+
+
+def test_random_deadlines_match_a_model():
+    clock = Clock()
+    ttl_manager = TTLManager(clock)
+    rnd = random.Random(3)
+    deadlines = {}
+    for step in range(20_000):
+        key = rnd.randrange(2_000)
+        if rnd.random() < 0.8:
+            deadlines[key] = ttl_manager.set_ttd(key, rnd.choice((0.01, 1, 60, 3600, 86400 * 400)) * rnd.random())
+        else:
+            ttl_manager.remove_ttd(key)
+            deadlines.pop(key, None)
+        if step % 100 == 0:
+            clock.seconds += rnd.choice((0.001, 0.5, 30, 5000, 86400 * 30))
+            now = ttl_manager.now()
+            popped = drain(ttl_manager, rnd.choice((None, 1, 64)))
+            assert popped == {key for key, ttd in deadlines.items() if ttd <= now}
+            for key in popped:
+                del deadlines[key]
+    assert len(ttl_manager) == len(deadlines)
+
+
+def test_cascade_after_idle_is_bounded_by_limit():
+    clock = Clock()
+    ttl_manager = TTLManager(clock)
+    for key in range(10_000):
+        ttl_manager.set_ttd(key, 3600 + key / 100)
+    clock.seconds += 7200
+    popped = []
+    while True:
+        cascaded = ttl_manager.cascaded
+        keys = ttl_manager.pop_expired(64)
+        assert ttl_manager.cascaded - cascaded <= 64
+        if not keys and ttl_manager.cascaded == cascaded:
+            break
+        popped.extend(keys)
+    assert sorted(popped) == list(range(10_000))
+
+
+def test_keys_removed_during_a_cascade_stay_removed():
+    clock = Clock()
+    ttl_manager = TTLManager(clock)
+    for key in range(1_000):
+        ttl_manager.set_ttd(key, 3600)
+    clock.seconds += 3599
+    ttl_manager.pop_expired(10)
+    for key in range(0, 1_000, 2):
+        ttl_manager.remove_ttd(key)
+    ttl_manager.set_ttd(1, 7200)
+    clock.seconds += 2
+    assert drain(ttl_manager, 10) == set(range(3, 1_000, 2))
+    clock.seconds += 7200
+    assert drain(ttl_manager) == {1}
+
+
+def test_gc_pass_counts_the_cascade_against_its_budget():
+    clock = Clock()
+    identity_map = ManagedIdentityMap(gc_types=GCType.TTL, gc_possibility=0)
+    for key in range(5_000):
+        identity_map.add(key, key, ttl=3600 + key / 100)
+    clock.seconds = identity_map._ttl_manager.now() / 1000 + 7200
+    identity_map._ttl_manager._clock = clock
+    cascaded = identity_map._ttl_manager.cascaded
+    identity_map.gc_run(GCBudget(max_entries=100))
+    assert identity_map._ttl_manager.cascaded - cascaded <= 100
+    while identity_map.gc_run(GCBudget(max_entries=100)) or identity_map._ttl_manager.cascading:
+        pass
+    assert len(identity_map) == 0
+
+
+def test_keyless_wheel_raises_on_key_lookups_and_still_counts():
+    clock = Clock()
+    ttl_manager = TTLManager(clock, index_keys=False)
+    ttd = ttl_manager.set_ttd("a", 60)
+    ttl_manager.set_ttd("b", 86400 * 400)
+    assert len(ttl_manager) == 2
+    with pytest.raises(RuntimeError):
+        ttl_manager.get_key_ttd("a")
+    with pytest.raises(RuntimeError):
+        ttl_manager.is_expired("a")
+    ttl_manager.unschedule("a", ttd)
+    assert len(ttl_manager) == 1
+
+
+@pytest.mark.parametrize("gc_types", [GCType.TTL, None])
+def test_evicted_and_removed_entries_leave_the_wheel(gc_types):
+    identity_map = ManagedIdentityMap(max_items=100, gc_types=gc_types, gc_possibility=0)
+    for key in range(200_000):
+        identity_map.add(key, key, ttl=60 + key % 1000)
+    assert len(identity_map._ttl_manager) <= 100
+    for key in range(199_950, 200_000):
+        identity_map.add(key, key, ttl=30)
+    for key in range(199_900, 200_000):
+        identity_map.remove(key)
+    assert len(identity_map._ttl_manager) == 0
@@ -0,0 +1,57 @@
+import gc
+
+from data_types import ManagedIdentityMap, ShardedManagedIdentityMap
+
+
+class Item:
+    def __init__(self, name: str):
+        self.name = name
+
+
+def test_unreferenced_items_go_except_the_keep_alive_window():
+    identity_map = ManagedIdentityMap(weak_values=True, keep_alive=2)
+    held = Item("held")
+    identity_map.add("held", held)
+    for key in range(5):
+        identity_map.add(key, Item(str(key)))
+    gc.collect()
+    assert [identity_map.get(key) is not None for key in range(5)] == [False, False, False, True, True]
+    assert identity_map.get("held") is held
+
+
+def test_restored_items_stay_alive_within_the_keep_alive_window(tmp_path):
+    path = str(tmp_path / "snapshot")
+    items = [Item(str(key)) for key in range(20)]
+    source = ManagedIdentityMap()
+    for key, item in enumerate(items):
+        source.add(key, item)
+    source.snapshot(path)
+
+    identity_map = ManagedIdentityMap(weak_values=True, keep_alive=10)
+    live = Item("live")
+    identity_map.add("live", live)
+    restore = identity_map.warm_start(path, background=False)
+    assert restore.error is None
+    gc.collect()
+    restored = {key for key in range(20) if identity_map.get(key) is not None}
+    # The most recently used ones, behind the items cached meanwhile.
+    assert restored == set(range(11, 20))
+    assert restore.restored == 9
+    for key in range(20, 40):
+        identity_map.add(key, Item(str(key)))
+    assert identity_map.get("live") is live
+
+
+def test_sharded_restore_keeps_restored_items_alive(tmp_path):
+    path = str(tmp_path / "snapshot")
+    items = [Item(str(key)) for key in range(40)]
+    source = ManagedIdentityMap()
+    for key, item in enumerate(items):
+        source.add(key, item)
+    source.snapshot(path)
+
+    identity_map = ShardedManagedIdentityMap(shards=4, weak_values=True, keep_alive=100)
+    restore = identity_map.warm_start(path, background=False)
+    gc.collect()
+    assert restore.restored == 40
+    assert all(identity_map.get(key).name == str(key) for key in range(40))